@@ -262,7 +262,9 @@ class dAutoBizobj(dBizobj):
 			return
 
 		#Create table
-		toExc = self._CurrentCursor.BackendObject.createTableAndIndexes(self._table, self._CurrentCursor)
+		backend = self._CurrentCursor.BackendObject
+		toExc = backend.createTableAndIndexes(self._table, self._CurrentCursor)
+		dabo.db.schemaCache.invalidate(backend.schemaCacheKey, self._table.Name)
 		if toExc:
 			if self._conn in g._toExc:
 				g._toExc[self._conn] = g._toExc[self._conn] + toExc
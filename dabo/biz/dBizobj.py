@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 import types
-import re
 import warnings
 import time
 import dabo
 import dabo.dConstants as kons
 from dabo.db.dCursorMixin import dCursorMixin
+from dabo.db import dExpressions
 from dabo.dLocalize import _
 from dabo.lib.utils import ustr
 import dabo.dException as dException
@@ -34,6 +34,13 @@ class dBizobj(dObject):
 		self._cascadeDeleteFromParent = True
 		# Collection of cursor objects. MUST be defined first.
 		self.__cursors = {}
+		# The cursors that have unsaved changes or new records, as a dict of
+		# id(cursor): (key, cursor), and the child bizobjs that have changes,
+		# keyed on their ids. Kept up to date by the cursors and children, so
+		# that checking for changes doesn't need to look at every cursor.
+		self.__changedCursors = {}
+		self.__changedChildren = {}
+		self.__hasChanges = False
 		# PK of the currently-selected cursor
 		self.__currentCursorKey = None
 		# Description of the data represented by this bizobj
@@ -88,6 +95,16 @@ class dBizobj(dObject):
 		self._parent = None
 		self._autoPopulatePK = True
 		self._autoQuoteNames = True
+		self._fetchMode = "all"
+		self._fetchSize = 5000
+		self._compactRecords = False
+		self._correctTypesOnFetch = False
+		self._nativeTypeFields = ()
+		self._filterIndexes = {}
+		self._cacheTTL = None
+		self._lastModifiedField = None
+		self._deltaSQL = None
+		self._batchSaves = False
 		self._keyField = ""
 		self._requeryChildOnSave = False
 		self._newRecordOnNewParent = False
@@ -148,7 +165,10 @@ class dBizobj(dObject):
 		for key, cursor in self.__cursors.items():
 			if cursor is self._CurrentCursor or cursor.isChanged():
 				cursors[key] = cursor
+			else:
+				self.__changedCursors.pop(id(cursor), None)
 		self.__cursors = cursors
+		self.__updateChangedState()
 
 		for child in self._children:
 			child._flushUnchangedCursors()
@@ -446,11 +466,16 @@ class dBizobj(dObject):
 
 		startTransaction = startTransaction and self.beginTransaction()
 
+		cursor = self._CurrentCursor
+		if self.BatchSaves:
+			cursor.beginBatchSave()
 		# First save the rows we know we've visited:
 		try:
 			self.scanKeys(self.save, self._visitedKeys, startTransaction=False,
 					saveTheChildren=saveTheChildren, scanRequeryChildren=False)
+			cursor.flushBatchSave()
 		except (dException.DBQueryException, dException.dException):
+			cursor.endBatchSave(flush=False)
 			if startTransaction:
 				self.rollbackTransaction()
 			raise
@@ -460,14 +485,16 @@ class dBizobj(dObject):
 		# in some out-of-context child cursor, but that should be rare. In the
 		# common case, all the changes would have already been made in the above
 		# block, and isAnyChanged() will return False very quickly in that case.
-		if self.isAnyChanged():
-			try:
+		try:
+			if self.isAnyChanged():
 				self.scan(self.save, startTransaction=False,
 						saveTheChildren=saveTheChildren, scanRequeryChildren=False)
-			except (dException.DBQueryException, dException.dException):
-				if startTransaction:
-					self.rollbackTransaction()
-				raise
+			cursor.endBatchSave()
+		except (dException.DBQueryException, dException.dException):
+			cursor.endBatchSave(flush=False)
+			if startTransaction:
+				self.rollbackTransaction()
+			raise
 
 		self.commitTransaction()
 		self._visitedKeys.clear()
@@ -475,6 +502,33 @@ class dBizobj(dObject):
 		self.afterSaveAll()
 
 
+	def bulkSave(self, startTransaction=True):
+		"""
+		Saves all the new and changed rows of the current cursor at once, such
+		as after a bulkAppend(). Rows are sent to the backend in batches with
+		executemany() where possible. Unlike saveAll(), the rows aren't
+		validated one by one, the per-row save hooks aren't called and child
+		bizobjs aren't saved; beforeSaveAll() and afterSaveAll() are called.
+		"""
+		cursor = self._CurrentCursor
+		if not self.RowCount or not cursor.getChangedRows(includeNewUnchanged=True):
+			return
+		errMsg = self.beforeSaveAll()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+
+		startTransaction = startTransaction and self.beginTransaction()
+		try:
+			cursor.save(allRows=True, includeNewUnchanged=True)
+		except (dException.DBQueryException, dException.dException):
+			if startTransaction:
+				self.rollbackTransaction()
+			raise
+		if startTransaction:
+			self.commitTransaction()
+		self.afterSaveAll()
+
+
 	def save(self, startTransaction=True, saveTheChildren=True):
 		"""
 		Save any changes that have been made in the current row.
@@ -518,10 +572,19 @@ class dBizobj(dObject):
 				# Save cursor data.
 				cursor.save(includeNewUnchanged=True)
 				if isAdding:
+					if self.AutoPopulatePK or self._children:
+						# The new row's key is passed on to the children by
+						# _onSaveNew(), so a row held back for a batch save
+						# has to be written first.
+						cursor.flushBatchSave()
 					# Call the hook method for saving new records.
 					self._onSaveNew()
 
-			if saveTheChildren:
+			if saveTheChildren and self._children:
+				if [child for child in self._children if child.isAnyChanged()]:
+					# Rows held back for a batch save have to be written before
+					# their children are.
+					cursor.flushBatchSave()
 				# Iterate through the child bizobjs, telling them to save themselves.
 				for child in self._children:
 					# No need to start another transaction. And since this is a child bizobj,
@@ -587,6 +650,7 @@ class dBizobj(dObject):
 			ignoreNoRecords = True
 		# Tell the cursor and all children to cancel themselves:
 		self._CurrentCursor.cancel(ignoreNoRecords=ignoreNoRecords)
+		self.__clearParentVirtualFieldCache()
 		if cancelTheChildren:
 			for child in self._children:
 				child.cancelAll(ignoreNoRecords=ignoreNoRecords)
@@ -630,26 +694,12 @@ class dBizobj(dObject):
 		if rp:
 			return rp.delete()
 		cursor = self._CurrentCursor
-		errMsg = self.beforeDelete()
-		if not errMsg:
-			errMsg = self.beforePointerMove()
-		if errMsg:
-			raise dException.BusinessRuleViolation(errMsg)
-
-		if self.KeyField is None:
-			raise dException.dException(
-					_("No key field defined for table: ") + self.DataSource)
-
-		if self.deleteChildLogic == kons.REFINTEG_RESTRICT:
-			# See if there are any child records
-			for child in self._children:
-				if child.CascadeDeleteFromParent and child.RowCount > 0:
-					raise dException.dException(
-							_("Deletion prohibited - there are related child records."))
+		self.__checkDelete()
 
 		startTransaction = startTransaction and self.beginTransaction()
 		try:
 			cursor.delete()
+			self.__clearParentVirtualFieldCache()
 			if self.RowCount == 0:
 				# Hook method for handling the deletion of the last record in the cursor.
 				self.onDeleteLastRecord()
@@ -677,17 +727,61 @@ class dBizobj(dObject):
 			raise
 
 
+	def __checkDelete(self):
+		"""
+		Runs the hook methods and referential integrity checks that precede
+		the deletion of the current row.
+		"""
+		errMsg = self.beforeDelete()
+		if not errMsg:
+			errMsg = self.beforePointerMove()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+
+		if self.KeyField is None:
+			raise dException.dException(
+					_("No key field defined for table: ") + self.DataSource)
+
+		if self.deleteChildLogic == kons.REFINTEG_RESTRICT:
+			# See if there are any child records
+			for child in self._children:
+				if child.CascadeDeleteFromParent and child.RowCount > 0:
+					raise dException.dException(
+							_("Deletion prohibited - there are related child records."))
+
+
 	def deleteAll(self, startTransaction=True):
-		"""Delete all rows in the data set."""
+		"""
+		Delete all rows in the data set.
+
+		The checks and hook methods run for each row as in delete(), but the
+		rows themselves are deleted together by the cursor's deleteRows().
+		"""
 		rp = self._RemoteProxy
 		if rp:
 			return rp.deleteAll()
 		cursorKey = self.__currentCursorKey
 		startTransaction = startTransaction and self.beginTransaction()
 		try:
-			while self.RowCount > 0:
-				self.first()
-				self.delete(startTransaction=False, inLoop=True)
+			if self.RowCount > 0:
+				cascadeChildren = []
+				if self.deleteChildLogic == kons.REFINTEG_CASCADE:
+					cascadeChildren = [child for child in self._children
+							if child.CascadeDeleteFromParent]
+				restrict = (self.deleteChildLogic == kons.REFINTEG_RESTRICT)
+
+				def checkRow():
+					self.__checkDelete()
+					for child in cascadeChildren:
+						child.deleteAll(startTransaction=False)
+
+				self.scan(checkRow, reverse=False,
+						scanRequeryChildren=bool(cascadeChildren or (restrict and self._children)))
+				self._CurrentCursor.deleteRows(range(self.RowCount))
+				self.__clearParentVirtualFieldCache()
+				# Hook method for handling the deletion of the last record in the cursor.
+				self.onDeleteLastRecord()
+				self.requeryAllChildren()
 			if startTransaction:
 				self.commitTransaction()
 
@@ -750,22 +844,19 @@ class dBizobj(dObject):
 		record that has not been modified from its defaults will suffice to mark the
 		record as changed.
 		"""
-		if not self.RowCount:
+		if not self.RowCount or not self.__hasChanges:
 			# If there are no records, there can be no changes
 			return []
-		if self._children:
-			rows = []
-
-			def _isRowChanged():
-				if self.isChanged(includeNewUnchanged):
-					rows.append(self.RowNumber)
-
-			# Must iterate all records to find potential changes in children:
-			self.scan(_isRowChanged, scanRequeryChildren=False)
-			return rows
-		else:
-			# Can use the much faster cursor.getChangedRows():
-			return self._CurrentCursor.getChangedRows(includeNewUnchanged)
+		cursor = self._CurrentCursor
+		rows = set(cursor.getChangedRows(includeNewUnchanged))
+		# Add the records whose children have changes.
+		for child in self._children:
+			if id(child) not in self.__changedChildren:
+				continue
+			for key, childCursor in child.__getChangedCursors():
+				if child.__isCursorChanged(childCursor, includeNewUnchanged):
+					rows.update(self.__getChildKeyRows(child, cursor, key))
+		return sorted(rows)
 
 
 	def _listChangedRows(self, includeNewUnchanged=False):
@@ -1002,14 +1093,8 @@ class dBizobj(dObject):
 			self._fldReplace("price > 50")
 				=> returns "self.Record.price > 50"
 		"""
-		patTemplate = r"(.*\b)%s(\b.*)"
-		ret = expr
-		for fld in self.getFieldNames():
-			pat = patTemplate % fld
-			mtch = re.match(pat, ret)
-			if mtch:
-				ret = mtch.groups()[0] + "self.Record.%s" % fld + mtch.groups()[1]
-		return ret
+		return dExpressions.rewrite(expr, self.getFieldNames(),
+				lambda fld: "self.Record.%s" % fld)
 
 
 	def _logScanException(self, ex):
@@ -1078,28 +1163,26 @@ class dBizobj(dObject):
 		with an equals sign. All expressions will therefore be a string
 		beginning with '='. Literals can be of any type.
 		"""
-		self.scan(self._replace, field, valOrExpr, scope)
+		# The expressions are compiled once, rather than for every record.
+		flds = self.getFieldNames()
+		if scope is not None:
+			scope = dExpressions.compileGetterExpression(scope, flds, globals())
+		valueExpr = None
+		if isinstance(valOrExpr, basestring) and valOrExpr.startswith("="):
+			valueExpr = dExpressions.compileGetterExpression(valOrExpr.strip()[1:],
+					flds, globals())
+		self.scan(self._replace, field, valOrExpr, scope, valueExpr)
 
 
-	def _replace(self, field, valOrExpr, scope):
+	def _replace(self, field, valOrExpr, scope, valueExpr=None):
 		"""
 		Called once for each record in the bizobj when the replace() method
-		is invoked.
+		is invoked, with the scope and value expressions already compiled.
 		"""
-		if scope is not None:
-			scope = self._fldReplace(scope)
-			if not eval(scope):
-				return
-		literal = True
-		try:
-			if valOrExpr.startswith("="):
-				literal = False
-				valOrExpr = valOrExpr.strip()[1:]
-				valOrExpr = self._fldReplace(valOrExpr)
-				valOrExpr = eval(valOrExpr)
-		except AttributeError:
-			# Not a string expression; no worries
-			pass
+		if scope is not None and not scope(self.getFieldVal, self):
+			return
+		if valueExpr is not None:
+			valOrExpr = valueExpr(self.getFieldVal, self)
 		self.setFieldVal(field, valOrExpr)
 
 
@@ -1116,6 +1199,7 @@ class dBizobj(dObject):
 
 		self._CurrentCursor.new()
 		self._onNew()
+		self.__clearParentVirtualFieldCache()
 
 		# Update all child bizobjs
 		self.requeryAllChildren()
@@ -1197,6 +1281,7 @@ class dBizobj(dObject):
 			except dException.dException:
 				raise
 			self._visitedKeys.clear()
+			self.__clearParentVirtualFieldCache()
 			if self.RestorePositionOnRequery:
 				self._positionUsingPK(currPK, updateChildren=False)
 			if hash(self.DataStructure) != oldDataStructure:
@@ -1212,6 +1297,141 @@ class dBizobj(dObject):
 			raise uiException
 
 
+	def requeryPage(self, size, after=None, append=False):
+		"""
+		Requeries a single page of at most 'size' rows, ordered by the current
+		sort columns and the KeyField. Unlike requery(), rows with unsaved
+		changes are kept. Use nextPage() and priorPage() to fetch the other
+		pages; if 'append' is True, those pages are added to the rows already
+		fetched instead of replacing them. See dCursorMixin.requeryPage() for
+		details. Returns the number of rows fetched.
+		"""
+		return self.__requeryPage("requeryPage", size, after=after, append=append)
+
+
+	def nextPage(self):
+		"""Fetches the page after the rows fetched so far by requeryPage()."""
+		return self.__requeryPage("nextPage")
+
+
+	def priorPage(self):
+		"""Fetches the page before the rows fetched so far by requeryPage()."""
+		return self.__requeryPage("priorPage")
+
+
+	def __requeryPage(self, methodName, *args, **kwargs):
+		errMsg = self.beforeRequery()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+		if self.KeyField is None:
+			errMsg = _("No Primary Key defined in the Bizobj for %s") % self.DataSource
+			raise dException.MissingPKException(errMsg)
+		cursor = self._CurrentCursor
+		if methodName == "requeryPage":
+			# The child filter is always the first clause in the WHERE expression.
+			kwargs["params"] = self.setChildLinkFilter() + self.getParams()
+		try:
+			currPK = self.getPK()
+		except dException.NoRecordsException:
+			currPK = None
+		ret = getattr(cursor, methodName)(*args, **kwargs)
+		self.__clearParentVirtualFieldCache()
+		try:
+			newPK = self.getPK()
+		except dException.NoRecordsException:
+			newPK = None
+		if (methodName == "requeryPage") or (newPK != currPK):
+			try:
+				self.requeryAllChildren()
+			except dException.NoRecordsException:
+				pass
+		self.afterRequery()
+		self._addVisitedKey()
+		return ret
+
+
+	def requeryDelta(self, detectDeletes=False):
+		"""
+		Refreshes the data set with only the rows changed in the database since
+		the last requery, keeping the current sort order, record pointer and
+		unsaved changes. Requires LastModifiedField or DeltaSQL to be set. See
+		dCursorMixin.requeryDelta() for details. Returns the number of rows
+		updated, added or removed.
+		"""
+		errMsg = self.beforeRequery()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+		if self.KeyField is None:
+			errMsg = _("No Primary Key defined in the Bizobj for %s") % self.DataSource
+			raise dException.MissingPKException(errMsg)
+		params = self.setChildLinkFilter() + self.getParams()
+		try:
+			currPK = self.getPK()
+		except dException.NoRecordsException:
+			currPK = None
+		ret = self._CurrentCursor.requeryDelta(params, detectDeletes=detectDeletes)
+		if ret:
+			self.__clearParentVirtualFieldCache()
+		try:
+			newPK = self.getPK()
+		except dException.NoRecordsException:
+			newPK = None
+		if newPK != currPK:
+			try:
+				self.requeryAllChildren()
+			except dException.NoRecordsException:
+				pass
+		self.afterRequery()
+		self._addVisitedKey()
+		return ret
+
+
+	def requeryAsync(self, callback=None):
+		"""
+		Requeries the data set on a worker thread with its own connection, so
+		that the UI stays responsive while a slow query runs. Returns a
+		dRequeryFuture; see dCursorMixin.requeryAsync() for details.
+
+		When the new rows have been stored, the record pointer is restored
+		(if RestorePositionOnRequery is True), the children are requeried and
+		afterRequery() is called, as with requery(). 'callback', if passed, is
+		called after that with the future as its argument. Starting another
+		requery cancels the one still running.
+		"""
+		if self._RemoteProxy:
+			raise dException.FeatureNotSupportedException(
+					_("Asynchronous requeries are not supported for remote bizobjs"))
+		errMsg = self.beforeRequery()
+		if errMsg:
+			raise dException.BusinessRuleViolation(errMsg)
+		if self.KeyField is None:
+			errMsg = _("No Primary Key defined in the Bizobj for %s") % self.DataSource
+			raise dException.MissingPKException(errMsg)
+		params = self.setChildLinkFilter() + self.getParams()
+		future = self._CurrentCursor.requeryAsync(params)
+		future.addDoneCallback(self.__afterRequeryAsync)
+		if callback is not None:
+			future.addDoneCallback(callback)
+		return future
+
+
+	def __afterRequeryAsync(self, future):
+		"""Finishes the requery once the new rows are in the cursor."""
+		if future.cancelled() or future.exception() is not None:
+			return
+		self._visitedKeys.clear()
+		self.__clearParentVirtualFieldCache()
+		if self.RestorePositionOnRequery:
+			self._positionUsingPK(future._priorPK, updateChildren=False)
+		self._clearCursorRecord()
+		try:
+			self.requeryAllChildren()
+		except dException.NoRecordsException:
+			pass
+		self.afterRequery()
+		self._addVisitedKey()
+
+
 	def _clearCursorRecord(self):
 		## The Record object must be reinstantiated to reflect the new structure:
 		try:
@@ -1324,9 +1544,15 @@ class dBizobj(dObject):
 			| startswith, beginswith: fld.startswith(expr)
 			| endswith: fld.endswith(expr)
 			| contains: expr in fld
+			| in: fld in expr
+
+		Fields listed in FilterIndexes are looked up in an index instead of
+		being compared row by row.
 		"""
 		currPK = self.getPK()
-		if fld in self.VirtualFields:
+		vf = self.VirtualFields.get(fld)
+		if isinstance(vf, dict) and vf.get("requery_children", False):
+			# The children have to be requeried for each row.
 			self.scan(self.scanVirtualFields, fld=fld, expr=expr, op=op, reverse=True)
 			self._CurrentCursor.filterByExpression("%s IN (%s)" % (
 					self.KeyField, ", ".join("%i" % key for key in self.__filterPKVirtual)))
@@ -1594,8 +1820,8 @@ class dBizobj(dObject):
 		If runRequery is True, and the record pointer is moved, all child bizobjs
 		will be requeried, and the afterPointerMove() hook method will fire.
 
-		If sort is True (the default), then we seek to the first matching value
-		without sorting first.
+		If sort is True (the default), the cursor searches a sorted index of the
+		field values. If it is False, the rows are searched in their current order.
 
 		If incremental is True (default is False), then we only compare the first
 		characters up until the length of val.
@@ -1634,31 +1860,117 @@ class dBizobj(dObject):
 		like:
 				if self._isAnyChanged_fast() or self._isAnyChanged_precise()...
 
-		Which will at least be much faster (and still correct) in the case of
-		_isAnyChanged_fast() returning False, and not much slower otherwise.
+		The cursors and child bizobjs report when they start or stop having
+		changes, so this takes constant time. New records count as changes
+		here even if they are unchanged.
+		"""
+		return self.__hasChanges
+
+
+	def _isAnyChanged_precise(self, includeNewUnchanged=None, withChildren=True):
+		"""
+		Return True if at least one record in the current record set
+		has been changed.
+		"""
+		cursor = self._CurrentCursor
+		if cursor is None:
+			return False
+		return self.__isCursorChanged(cursor, includeNewUnchanged, withChildren)
+
+
+	def __isCursorChanged(self, cursor, includeNewUnchanged, withChildren=True):
 		"""
+		Return True if any record in the passed cursor has been changed, or
+		has changed child records. Only the cursors of the children that are
+		known to have changes are checked.
+		"""
+		if not cursor.RowCount:
+			return False
 		withNewUnchanged = includeNewUnchanged
 		if withNewUnchanged is None:
 			withNewUnchanged = self.SaveNewUnchanged
-		for cursor in self.__cursors.values():
-			if cursor.isChanged(allRows=True, includeNewUnchanged=withNewUnchanged):
-				return True
-		for child in self._children:
-			if child._isAnyChanged_fast(includeNewUnchanged=includeNewUnchanged):
-				return True
+		if cursor.isChanged(allRows=True, includeNewUnchanged=withNewUnchanged):
+			return True
+		if withChildren:
+			for child in self._children:
+				if id(child) not in self.__changedChildren:
+					continue
+				for key, childCursor in child.__getChangedCursors():
+					if (child.__isCursorChanged(childCursor, includeNewUnchanged)
+							and self.__getChildKeyRows(child, cursor, key)):
+						return True
 		return False
 
 
-	def _isAnyChanged_precise(self, includeNewUnchanged=None, withChildren=True):
+	def __getChangedCursors(self):
 		"""
-		Return True if at least one record in the current record set
-		has been changed.
+		Return (key, cursor) pairs for the cursors that have changes, or whose
+		records may have changed child records.
+		"""
+		if self.__changedChildren:
+			return self.__cursors.items()
+		return self.__changedCursors.values()
+
+
+	def __getChildKeyRows(self, child, cursor, key):
+		"""
+		Return the rows of the passed cursor that the child's cursor with the
+		passed key belongs to.
 		"""
-		def _isThisChanged():
-			self.exitScan = self._isChanged(True, includeNewUnchanged, withChildren)
-			return self.exitScan
+		if not child.LinkField:
+			# The child uses the same cursor for every record.
+			return range(cursor.RowCount)
+		plf = child.ParentLinkField
+		if not plf:
+			row = cursor._getRecordByPk(key, raiseRowNotFound=False)[0]
+			if row is None:
+				return []
+			return [row]
+		flds = plf.replace(" ", "").split(",")
+		if len(flds) == 1:
+			return [row for row in xrange(cursor.RowCount)
+					if cursor.getFieldVal(flds[0], row) == key]
+		return [row for row in xrange(cursor.RowCount)
+				if tuple([cursor.getFieldVal(fld, row) for fld in flds]) == key]
 
-		return self.scan(_isThisChanged, scanRequeryChildren=False) or False
+
+	def _cursorChangedStateChanged(self, cursor):
+		"""
+		Called by the cursors when they start or stop having changes or new
+		records.
+		"""
+		if cursor.isChanged(allRows=True, includeNewUnchanged=True):
+			cursors = self.__cursors
+			key = self.__currentCursorKey
+			if cursors.get(key) is not cursor:
+				for key, crs in cursors.iteritems():
+					if crs is cursor:
+						break
+				else:
+					# Not one of the data cursors, such as a many-to-many cursor.
+					return
+			self.__changedCursors[id(cursor)] = (key, cursor)
+		else:
+			self.__changedCursors.pop(id(cursor), None)
+		self.__updateChangedState()
+
+
+	def _childChangedStateChanged(self, child, hasChanges):
+		"""Called by the child bizobjs when they start or stop having changes."""
+		if hasChanges:
+			self.__changedChildren[id(child)] = child
+		else:
+			self.__changedChildren.pop(id(child), None)
+		self.__updateChangedState()
+
+
+	def __updateChangedState(self):
+		hasChanges = bool(self.__changedCursors or self.__changedChildren)
+		if hasChanges != self.__hasChanges:
+			self.__hasChanges = hasChanges
+			parent = self.Parent
+			if parent is not None:
+				parent._childChangedStateChanged(self, hasChanges)
 
 
 	def isAnyChanged(self, includeNewUnchanged=None, withChildren=True):
@@ -1969,10 +2281,32 @@ class dBizobj(dObject):
 		return ret[0]
 
 
+	def clearVirtualFieldCache(self, fld=None, row=None):
+		"""
+		Discards the memoized values of the virtual fields defined with 'cache'.
+		See dCursorMixin.clearVirtualFieldCache() for the meaning of the arguments.
+		"""
+		self._CurrentCursor.clearVirtualFieldCache(fld, row)
+
+
+	def __clearParentVirtualFieldCache(self):
+		"""
+		Discards the memoized virtual field values of the parent's current row
+		that depend on the rows of this bizobj.
+		"""
+		parent = self.Parent
+		if parent is None:
+			return
+		crs = parent._CurrentCursor
+		if crs is not None and crs._virtualFieldCache:
+			crs.clearVirtualFieldCache(self.DataSource, parent.RowNumber)
+
+
 	def setFieldVal(self, fld, val, row=None, pk=None):
 		"""Set the value of the specified field in the current or specified row."""
 		changed = self._CurrentCursor.setFieldVal(fld, val, row, pk)
 		if changed:
+			self.__clearParentVirtualFieldCache()
 			self.afterSetFieldVal(fld, row)
 		return changed
 
@@ -2068,6 +2402,47 @@ class dBizobj(dObject):
 		return ret
 
 
+	def getDataRows(self, flds=(), rowStart=0, rows=None, returnInternals=False):
+		"""
+		Like getDataSet(), but returns a (fields, rows) tuple, where 'rows' is a
+		list with a tuple of values for each row, in the order of 'fields'.
+		"""
+		cc = self._CurrentCursor
+		if cc is None:
+			return tuple(flds), []
+		return cc.getDataRows(flds, rowStart, rows, returnInternals=returnInternals)
+
+
+	def iterRecords(self):
+		"""
+		Generator that yields each record of the current data set in turn, as a
+		dict. With FetchMode set to 'chunked', rows not yet fetched are streamed
+		from the backend without being kept in the data set.
+		"""
+		return self._CurrentCursor.iterRecords()
+
+
+	def getColumnArrays(self, flds=None):
+		"""
+		Returns a dict mapping the passed fields, or all the fields, to arrays
+		of their values in row order; NumPy arrays when it is installed. See
+		dCursorMixin.getColumnArrays() for the details.
+		"""
+		return self._CurrentCursor.getColumnArrays(flds)
+
+
+	def setColumnArrays(self, columns):
+		"""
+		Stores whole columns of values at once, from a dict mapping field names
+		to sequences with one value per row. The changes are saved by the next
+		save(). Returns the number of values that changed.
+		"""
+		ret = self._CurrentCursor.setColumnArrays(columns)
+		if ret:
+			self.__clearParentVirtualFieldCache()
+		return ret
+
+
 	def appendDataSet(self, ds, updateInternals=False):
 		"""
 		Appends the rows in the passed dataset to this bizobj's dataset. No checking
@@ -2078,6 +2453,31 @@ class dBizobj(dObject):
 		self._CurrentCursor.appendDataSet(ds, updateInternals=updateInternals)
 
 
+	def bulkAppend(self, rows, markNew=True, fields=None):
+		"""
+		Appends a large number of records at once, such as when importing a
+		file; see dCursorMixin.bulkAppend() for the format of 'rows'. The
+		DefaultValues and the link to the parent record are filled in for the
+		fields that aren't in the rows, but the new() hooks aren't called for
+		each record. Use bulkSave() or saveAll() to write the new records.
+		Returns the number of records added.
+		"""
+		defaults = {}
+		if self.DefaultValues:
+			defaults.update(self.DefaultValues)
+		if self.Parent and self.FillLinkFromParent and self.LinkField:
+			val = self.getParentLinkValue()
+			if not isinstance(val, (list, tuple)):
+				val = (val,)
+			links = self.LinkField.replace(" ", "").split(",")
+			defaults.update(zip(links, val))
+		ret = self._CurrentCursor.bulkAppend(rows, markNew=markNew, fields=fields,
+				defaults=defaults)
+		if ret:
+			self.__clearParentVirtualFieldCache()
+		return ret
+
+
 	def cloneRecord(self):
 		"""
 		Creates a copy of the current record and adds it to the dataset. The KeyField
@@ -2088,7 +2488,8 @@ class dBizobj(dObject):
 		# beforehand, and restore after the call to cloneRecord().
 		memsave = cc._mementos.copy()
 		cc.cloneRecord()
-		cc._mementos = memsave
+		cc._mementos.clear()
+		cc._mementos.update(memsave)
 		self._onNew(setDefaults=False)
 
 
@@ -2622,6 +3023,16 @@ afterDelete() which is only called after a delete().""")
 		crs.KeyField = self._keyField
 		crs.AutoPopulatePK = self._autoPopulatePK
 		crs.AutoQuoteNames = self._autoQuoteNames
+		crs.FetchMode = self._fetchMode
+		crs.CompactRecords = self._compactRecords
+		crs.CacheTTL = self._cacheTTL
+		crs.FetchSize = self._fetchSize
+		crs.FilterIndexes = self._filterIndexes
+		crs.CorrectTypesOnFetch = self._correctTypesOnFetch
+		crs.NativeTypeFields = self._nativeTypeFields
+		if crs.LastModifiedField != self._lastModifiedField:
+			crs.LastModifiedField = self._lastModifiedField
+		crs.DeltaSQL = self._deltaSQL
 		if self._dataStructure is not None:
 			crs.DataStructure = self._dataStructure
 		if not self._RemoteProxy:
@@ -2651,8 +3062,10 @@ afterDelete() which is only called after a delete().""")
 		"""
 		oldKey = self.__currentCursorKey
 		if newKey <> oldKey:
-			self.__cursors[newKey] = self.__cursors.pop(oldKey)
+			cursor = self.__cursors[newKey] = self.__cursors.pop(oldKey)
 			self.__currentCursorKey = newKey
+			if id(cursor) in self.__changedCursors:
+				self.__changedCursors[id(cursor)] = (newKey, cursor)
 
 
 	## Property getter/setter methods ##
@@ -2682,6 +3095,21 @@ afterDelete() which is only called after a delete().""")
 			return None
 
 
+	def _getBatchSaves(self):
+		return self._batchSaves
+
+	def _setBatchSaves(self, val):
+		self._batchSaves = bool(val)
+
+
+	def _getCacheTTL(self):
+		return self._cacheTTL
+
+	def _setCacheTTL(self, val):
+		self._cacheTTL = val
+		self._syncWithCursors()
+
+
 	def _getCaption(self):
 		try:
 			return self._caption
@@ -2706,6 +3134,22 @@ afterDelete() which is only called after a delete().""")
 		self._childCacheInterval = val
 
 
+	def _getCompactRecords(self):
+		return self._compactRecords
+
+	def _setCompactRecords(self, val):
+		self._compactRecords = bool(val)
+		self._syncWithCursors()
+
+
+	def _getCorrectTypesOnFetch(self):
+		return self._correctTypesOnFetch
+
+	def _setCorrectTypesOnFetch(self, val):
+		self._correctTypesOnFetch = bool(val)
+		self._syncWithCursors()
+
+
 	def _getCurrentSQL(self):
 		return self._CurrentCursor.CurrentSQL
 
@@ -2786,6 +3230,14 @@ afterDelete() which is only called after a delete().""")
 		self._defaultValues = val
 
 
+	def _getDeltaSQL(self):
+		return self._deltaSQL
+
+	def _setDeltaSQL(self, val):
+		self._deltaSQL = val
+		self._syncWithCursors()
+
+
 	def _getVirtualFields(self):
 		# We need to save the explicitly-assigned VirtualFields here in the bizobj,
 		# so that we are able to propagate it to any future-assigned child cursors.
@@ -2818,6 +3270,22 @@ afterDelete() which is only called after a delete().""")
 		self._syncWithCursors()
 
 
+	def _getFetchMode(self):
+		return self._fetchMode
+
+	def _setFetchMode(self, val):
+		self._fetchMode = val
+		self._syncWithCursors()
+
+
+	def _getFetchSize(self):
+		return self._fetchSize
+
+	def _setFetchSize(self, val):
+		self._fetchSize = val
+		self._syncWithCursors()
+
+
 	def _getFillLinkFromParent(self):
 		try:
 			return self._fillLinkFromParent
@@ -2828,6 +3296,14 @@ afterDelete() which is only called after a delete().""")
 		self._fillLinkFromParent = bool(val)
 
 
+	def _getFilterIndexes(self):
+		return self._filterIndexes
+
+	def _setFilterIndexes(self, val):
+		self._filterIndexes = dict(val or {})
+		self._syncWithCursors()
+
+
 	def _isAdding(self):
 		return self._CurrentCursor.IsAdding
 
@@ -2843,6 +3319,14 @@ afterDelete() which is only called after a delete().""")
 		self._syncWithCursors()
 
 
+	def _getLastModifiedField(self):
+		return self._lastModifiedField
+
+	def _setLastModifiedField(self, val):
+		self._lastModifiedField = val
+		self._syncWithCursors()
+
+
 	def _getLastSQL(self):
 		try:
 			v = self._CurrentCursor.LastSQL
@@ -2881,6 +3365,16 @@ afterDelete() which is only called after a delete().""")
 		self._newRecordOnNewParent = bool(val)
 
 
+	def _getNativeTypeFields(self):
+		return self._nativeTypeFields
+
+	def _setNativeTypeFields(self, val):
+		if isinstance(val, basestring):
+			val = [fld.strip() for fld in val.split(",")]
+		self._nativeTypeFields = tuple(val)
+		self._syncWithCursors()
+
+
 	def _getNonUpdateFields(self):
 		return self._CurrentCursor.getNonUpdateFields()
 
@@ -2899,7 +3393,13 @@ afterDelete() which is only called after a delete().""")
 
 	def _setParent(self, val):
 		if val is None or isinstance(val, dBizobj):
+			oldParent = self.Parent
 			self._parent = val
+			if self.__hasChanges and (val is not oldParent):
+				if oldParent is not None:
+					oldParent._childChangedStateChanged(self, False)
+				if val is not None:
+					val._childChangedStateChanged(self, True)
 		else:
 			raise TypeError(_("Parent must descend from dBizobj"))
 
@@ -3089,6 +3589,24 @@ afterDelete() which is only called after a delete().""")
 	AutoSQL = property(_getAutoSQL, None, None,
 			_("Returns the SQL statement automatically generated by the sql manager."))
 
+	BatchSaves = property(_getBatchSaves, _setBatchSaves, None,
+			_("""When True, saveAll() validates each changed row as usual, but holds
+			back the writes and sends them in batches, one executemany() call per
+			distinct insert or update statement. Held-back rows are written before
+			any changed child rows. New rows whose key is generated by the backend,
+			and new rows of a bizobj with children, are written as soon as they are
+			saved, so that their key is known to the children. Note that the
+			afterSave() hooks of the other rows run before their data is written.
+			Default=False  (bool)"""))
+
+	CacheTTL = property(_getCacheTTL, _setCacheTTL, None,
+			_("""When set, requery() serves the rows from the shared
+			dabo.db.resultCache if the same query was run less than this many
+			seconds ago. Meant for lookup tables that rarely change; cached rows
+			are discarded as soon as any cursor writes to the table. The counters
+			are available from dabo.db.resultCache.getStats(), and dQueryStats
+			reports the hits of each bizobj as 'cacheHits'. Default=None  (int)"""))
+
 	Caption = property(_getCaption, _setCaption, None,
 			_("The friendly title of the cursor, used in messages to the end user. (str)"))
 
@@ -3101,9 +3619,19 @@ afterDelete() which is only called after a delete().""")
 			requery from parent.requeryAllChildren() will be ignored.  (int)
 			"""))
 
+	CompactRecords = property(_getCompactRecords, _setCompactRecords, None,
+			_("""When True, the cursors store fetched rows as compact records that
+			share one map of field names instead of as one dict per row, which
+			takes much less memory for wide tables. Default=False  (bool)"""))
+
 	Connection = property(_getConnection, None, None,
 			_("The dConnection object used to connect with the backend database."))
 
+	CorrectTypesOnFetch = property(_getCorrectTypesOnFetch, _setCorrectTypesOnFetch, None,
+			_("""When True, the cursors correct the field types of all the rows as
+			soon as they are fetched, instead of as each row is first accessed.
+			Default=False  (bool)"""))
+
 	CurrentSQL = property(_getCurrentSQL, None, None,
 			_("Returns the current SQL that will be run, which is one of UserSQL or AutoSQL."))
 
@@ -3160,15 +3688,33 @@ afterDelete() which is only called after a delete().""")
 			to the bizobj.
 			"""))
 
+	DeltaSQL = property(_getDeltaSQL, _setDeltaSQL, None,
+			_("""SQL used by requeryDelta() to fetch the rows changed since the last
+			requery, instead of filtering the current SQL on the LastModifiedField.
+			See dCursorMixin.DeltaSQL.  (str)"""))
+
 	Encoding = property(_getEncoding, _setEncoding, None,
 			_("Name of encoding to use for unicode  (str)"))
 
+	FetchMode = property(_getFetchMode, _setFetchMode, None,
+			_("""Either 'all' (default), to fetch the entire result of a requery at
+			once, or 'chunked', to fetch FetchSize rows at a time as they are
+			needed. Passed through to the cursors.  (str)"""))
+
+	FetchSize = property(_getFetchSize, _setFetchSize, None,
+			_("Number of rows fetched at a time when FetchMode is 'chunked'. Default=5000  (int)"))
+
 	FillLinkFromParent = property(_getFillLinkFromParent, _setFillLinkFromParent, None,
 			_("""In the onNew() method, do we fill in the foreign key field specified by the
 			LinkField property with the value returned by calling the bizobj's 	getParentPK()
 			method? (bool)
 			"""))
 
+	FilterIndexes = property(_getFilterIndexes, _setFilterIndexes, None,
+			_("""Dict mapping field names to the kind of index, 'hash' or 'sorted',
+			that filter() uses to look up the matching rows, instead of comparing
+			the value of every row. See dCursorMixin.FilterIndexes. Default={}  (dict)"""))
+
 	IsAdding = property(_isAdding, None, None,
 			_("Returns True if the current record is new and unsaved."))
 
@@ -3177,6 +3723,10 @@ afterDelete() which is only called after a delete().""")
 			separate the fields with commas. (str)
 			"""))
 
+	LastModifiedField = property(_getLastModifiedField, _setLastModifiedField, None,
+			_("""Name of the field holding the time each row was last changed, which
+			lets requeryDelta() fetch only the changed rows.  (str)"""))
+
 	LastSQL = property(_getLastSQL, None, None,
 			_("Returns the last executed SQL statement."))
 
@@ -3189,6 +3739,10 @@ afterDelete() which is only called after a delete().""")
 	NewRecordOnNewParent = property(_getNewRecordOnNewParent, _setNewRecordOnNewParent, None,
 			_("If this bizobj's parent has NewChildOnNew==True, do we create a record here? (bool)"))
 
+	NativeTypeFields = property(_getNativeTypeFields, _setNativeTypeFields, None,
+			_("""Names of the fields whose values the backend already returns as the
+			correct Python type; the cursors skip type correction for them.  (tuple)"""))
+
 	NonUpdateFields = property(_getNonUpdateFields, _setNonUpdateFields, None,
 			_("Fields in the cursor to be ignored during updates"))
 
@@ -3281,7 +3835,11 @@ afterDelete() which is only called after a delete().""")
 			_("""A dictionary mapping virtual_field_name to function to call.
 
 			The specified function will be called when getFieldVal() is called on
-			the specified virtual field name.
+			the specified virtual field name. The value can also be a dict with
+			the 'func', 'requery_children', 'cache' and 'depends_on' keys; see
+			dCursorMixin.VirtualFields. A cached field that lists the DataSource
+			of a child bizobj in 'depends_on' is recomputed when the child's rows
+			are changed, added, deleted or requeried.
 			"""))
 
 
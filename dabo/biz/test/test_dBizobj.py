@@ -103,6 +103,48 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		biz.Record.combined_name = "shouldn't be able to set this"
 		self.assertEqual(biz.Record.combined_name, "PaulKeithMcNett:23")
 
+	def testBatchVirtualFields(self):
+		biz = self.biz
+		def getInitials(rows):
+			return ["".join(word[0] for word in rec["cField"].split()) for rec in rows]
+		biz.VirtualFields = {"initials": {"func": getInitials, "batch": True}}
+		self.assertEqual(biz.Record.initials, "PKM")
+		biz.filter("initials", "EL")
+		self.assertEqual(biz.RowCount, 1)
+		self.assertEqual(biz.Record.pk, 2)
+		biz.removeFilter()
+		self.assertEqual(biz.RowCount, 3)
+
+	def testCachedVirtualFields(self):
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizMain.addChild(bizChild)
+		bizMain.requery()
+		calls = []
+		def getInvoiceCount():
+			calls.append(bizMain.RowNumber)
+			return bizChild.RowCount
+		bizMain.VirtualFields = {"invoice_count": {"func": getInvoiceCount,
+				"cache": True, "depends_on": [self.temp_child_table_name]}}
+		self.assertEqual(bizMain.Record.invoice_count, 2)
+		self.assertEqual(bizMain.Record.invoice_count, 2)
+		bizMain.Record.iField = 99
+		self.assertEqual(bizMain.Record.invoice_count, 2)
+		self.assertEqual(len(calls), 1)
+		# Changes to the child's rows discard the parent's value, as does
+		# fetching a page of them.
+		bizChild.requeryPage(1)
+		self.assertEqual(bizMain.Record.invoice_count, 1)
+		bizChild.requery()
+		self.assertEqual(bizMain.Record.invoice_count, 2)
+		self.assertEqual(len(calls), 3)
+		bizChild.new()
+		self.assertEqual(bizMain.Record.invoice_count, 3)
+		self.assertEqual(len(calls), 4)
+
 	def test_Encoding(self):
 		biz = self.biz
 		self.assertEqual(biz.Encoding, dabo.getEncoding())
@@ -266,6 +308,26 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		self.assertEqual(bizMain.RowCount, 2)
 
 
+	def testDeleteAllCascade(self):
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizChild.FillLinkFromParent = True
+		bizMain.addChild(bizChild)
+		bizMain.requery()
+
+		bizMain.deleteAll()
+		self.assertEqual(bizMain.RowCount, 0)
+		self.assertEqual(bizChild.RowCount, 0)
+		crs = bizMain._CurrentCursor.AuxCursor
+		crs.execute("select count(*) as cnt from %s" % self.temp_table_name)
+		self.assertEqual(crs.getFieldVal("cnt"), 0)
+		crs.execute("select count(*) as cnt from %s" % self.temp_child_table_name)
+		self.assertEqual(crs.getFieldVal("cnt"), 0)
+
+
 	def testSaveNewUnchanged(self):
 		"""See ticket #1101"""
 		bizMain = self.biz
@@ -687,6 +749,145 @@ insert into %s (cField, iField, nField) values (NULL, NULL, NULL)
 		"""Do the same test as for save, but with cancelAll()."""
 		self.testChangesToTwoChildRecords("cancel")
 
+	def testBatchSaves(self):
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizChild.FillLinkFromParent = True
+		bizMain.addChild(bizChild)
+		bizMain.BatchSaves = bizChild.BatchSaves = True
+		bizMain.requery()
+
+		for pk in (1, 2, 3):
+			bizMain.moveToPK(pk)
+			bizMain.Record.iField = pk * 10
+		bizMain.moveToPK(1)
+		bizChild.RowNumber = 1
+		bizChild.Record.cInvNum = "IN99999"
+		bizMain.saveAll()
+		self.assertEqual(bizMain.isAnyChanged(), False)
+		self.assertEqual(bizMain._CurrentCursor._batchSaveRecords, None)
+
+		bizMain.requery()
+		self.assertEqual([rec["iField"] for rec in bizMain.getDataSet()], [10, 20, 30])
+		self.assertEqual(bizChild.getDataSet()[1]["cInvNum"], "IN99999")
+
+		# A new child of a new parent gets the parent's saved key.
+		bizMain.new()
+		bizMain.Record.cField = "Batched"
+		bizChild.new()
+		bizChild.Record.cInvNum = "IN88888"
+		bizMain.saveAll()
+		parentPK = bizMain.Record.pk
+		self.assertTrue(parentPK > 0)
+		bizChild.requery()
+		self.assertEqual([(rec["parent_fk"], rec["cInvNum"]) for rec in bizChild.getDataSet()],
+				[(parentPK, "IN88888")])
+
+	def testBulkAppend(self):
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizChild.FillLinkFromParent = True
+		bizMain.addChild(bizChild)
+		bizMain.requery()
+		rows = [{"cInvNum": "IN%05d" % num} for num in range(3)]
+		self.assertEqual(bizChild.bulkAppend(rows), 3)
+		self.assertEqual(bizChild.RowCount, 5)
+		self.assertEqual(bizChild.getDataSet(rowStart=2, rows=1)[0]["parent_fk"], 1)
+		self.assertTrue(bizChild.isAnyChanged(includeNewUnchanged=True))
+		bizChild.bulkSave()
+		self.assertFalse(bizChild.isAnyChanged(includeNewUnchanged=True))
+		bizChild.requery()
+		self.assertEqual(bizChild.RowCount, 5)
+		self.assertEqual(bizChild.getDataSet()[4]["cInvNum"], "IN00002")
+
+	def testFilterIndexes(self):
+		biz = self.biz
+		biz.FilterIndexes = {"iField": "sorted"}
+		self.assertEqual(biz._CurrentCursor.FilterIndexes, {"iField": "sorted"})
+		biz.filter("iField", 100, "lt")
+		self.assertEqual(biz.RowCount, 2)
+		biz.filter("iField", (23, 10223), "in")
+		self.assertEqual(biz.RowCount, 1)
+		self.assertEqual(biz.Record.cField, "Paul Keith McNett")
+		biz.removeFilters()
+		self.assertEqual(biz.RowCount, 3)
+
+	def testReplace(self):
+		biz = self.biz
+		biz.replace("iField", "=iField * 2", scope="cField.startswith('Paul') or iField > 100")
+		self.assertEqual([rec["iField"] for rec in biz.getDataSet()], [46, 42, 20446])
+		self.assertTrue(biz.isAnyChanged())
+		# Literals are never treated as expressions, even if they name a field.
+		biz.replace("cField", "iField", scope="iField == 42")
+		self.assertEqual(biz.getDataSet(rowStart=1, rows=1)[0]["cField"], "iField")
+		self.assertEqual(biz._fldReplace("iField > 1 and cField != 'iField'"),
+				"self.Record.iField > 1 and self.Record.cField != 'iField'")
+
+	def testKeysetPaging(self):
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizMain.addChild(bizChild)
+		self.assertEqual(bizMain.requeryPage(2), 2)
+		self.assertEqual([rec["pk"] for rec in bizMain.getDataSet()], [1, 2])
+		self.assertEqual(bizChild.RowCount, 2)
+		self.assertEqual(bizMain.nextPage(), 1)
+		self.assertEqual(bizMain.Record.pk, 3)
+		self.assertEqual(bizChild.Record.cInvNum, "IN00024")
+
+	def testChangeTracking(self):
+		bizMain = self.biz
+		bizChild = dabo.biz.dBizobj(self.con)
+		bizChild.KeyField = "pk"
+		bizChild.DataSource = self.temp_child_table_name
+		bizChild.LinkField = "parent_fk"
+		bizMain.addChild(bizChild)
+		bizMain.requery()
+		for pk in (1, 2, 3):
+			# Visiting the records caches a child cursor for each of them.
+			bizMain.moveToPK(pk)
+		self.assertEqual(bizMain._isAnyChanged_fast(), False)
+		self.assertEqual(bizMain.isAnyChanged(), False)
+		bizMain.moveToPK(3)
+		bizChild.Record.cInvNum = "IN99999"
+		bizMain.moveToPK(1)
+		self.assertEqual(bizMain._isAnyChanged_fast(), True)
+		self.assertEqual(bizMain.isAnyChanged(), True)
+		self.assertEqual(bizMain.isChanged(), False)
+		self.assertEqual(bizMain.getChangedRows(), [2])
+		bizMain.Record.iField = 99
+		self.assertEqual(bizMain.getChangedRows(), [0, 2])
+		bizMain.cancelAll()
+		self.assertEqual(bizMain._isAnyChanged_fast(), False)
+		self.assertEqual(bizMain.getChangedRows(), [])
+
+	def testCacheTTL(self):
+		biz = self.biz
+		cache = dabo.db.resultCache
+		cache.resetStats()
+		biz.CacheTTL = 60
+		try:
+			biz.requery()
+			biz.requery()
+			self.assertEqual(cache.getStats()["hits"], 1)
+			biz.Record.cField = "Paul McNett"
+			biz.save()
+			# Saving discards the cached rows.
+			biz.requery()
+			self.assertEqual(cache.getStats()["hits"], 1)
+			self.assertEqual(biz.Record.cField, "Paul McNett")
+		finally:
+			biz.CacheTTL = None
+			cache.invalidate()
+
 if __name__ == "__main__":
 	suite = unittest.TestLoader().loadTestsFromTestCase(Test_dBizobj)
 	unittest.TextTestRunner(verbosity=2).run(suite)
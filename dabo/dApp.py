@@ -408,6 +408,8 @@ try again when it is running.
 		self.uiApp.exit()
 		self._persistMRU()
 		self.uiApp.finish()
+		if self.SchemaCacheFile:
+			dabo.db.schemaCache.save(self.SchemaCacheFile, self.getAppInfo("appVersion"))
 		self.closeConnections()
 		self._tempFileHolder.release()
 		dabo.log.info(_("Application finished."))
@@ -1029,24 +1031,72 @@ try again when it is running.
 		for the same named connection will not open multiple
 		connections. If the name doesn't exist in self.dbConnectionDefs,
 		then an exception is raised.
+
+		If the PoolMaxSize of the connection definition is set, the connection
+		is checked out from a dConnectionPool instead; calls made from the same
+		thread get the same connection, and other threads get their own. Call
+		close() on it once for each call to return it to the pool.
 		"""
 		if not connName in self.dbConnections:
 			if connName in self.dbConnectionDefs:
 				ci = self.dbConnectionDefs[connName]
-				self.dbConnections[connName] = dabo.db.dConnection(ci)
+				if ci.PoolMaxSize:
+					self.dbConnections[connName] = dabo.db.dConnectionPool(ci)
+				else:
+					self.dbConnections[connName] = dabo.db.dConnection(ci)
 		try:
 			ret = self.dbConnections[connName]
 		except KeyError:
 			raise dException.ConnectionNotFoundException(
 					_("No connection named '%s' is defined") % connName)
+		if isinstance(ret, dabo.db.dConnectionPool):
+			ret = ret.acquireForThread()
 		return ret
 
 
+	def getConnectionPool(self, connName):
+		"""
+		Returns the dConnectionPool for the passed connection name, or None if
+		the connection isn't pooled or hasn't been used yet.
+		"""
+		ret = self.dbConnections.get(connName)
+		if isinstance(ret, dabo.db.dConnectionPool):
+			return ret
+		return None
+
+
 	def getConnectionNames(self):
 		"""Returns a list of all defined connection names"""
 		return self.dbConnectionDefs.keys()
 
 
+	def prewarmSchema(self, tables, connName=None):
+		"""
+		Loads the metadata for the passed table names into dabo.db.schemaCache,
+		so that bizobjs don't have to query the database for it when they are
+		first used. If the app only defines one connection, connName can be
+		left out.
+		"""
+		if connName is None:
+			names = self.getConnectionNames()
+			if len(names) != 1:
+				raise dException.ConnectionNotFoundException(
+						_("prewarmSchema() needs a connection name when the app "
+						"doesn't define exactly one connection"))
+			connName = names[0]
+		conn = self.getConnectionByName(connName)
+		try:
+			crs = conn.getDaboCursor()
+			backend = crs.BackendObject
+			for table in tables:
+				crs.Table = table
+				backend.cacheTableSchema(crs, table)
+		finally:
+			if self.getConnectionPool(connName) is not None:
+				# Return the pooled connection that was checked out above.
+				conn.close()
+
+
 	def closeConnections(self):
 		"""Cleanup as the app is exiting."""
 		for key, conn in self.dbConnections.items():
@@ -1150,6 +1200,14 @@ try again when it is running.
 		return (self._transactionTokens.get(cn) is biz)
 
 
+	def isTransactionPending(self, conn):
+		"""
+		Returns True if a bizobj holds the transaction token for the
+		passed connection.
+		"""
+		return self._transactionTokens.get(conn) is not None
+
+
 	def releaseTransactionToken(self, biz):
 		"""
 		When a process that would normally close a transaction happens, the
@@ -1161,6 +1219,9 @@ try again when it is running.
 		cn = biz._connection
 		if biz is self._transactionTokens.get(cn):
 			del self._transactionTokens[cn]
+			if getattr(cn, "_releasePending", False):
+				# It was closed during the transaction; return it to its pool now.
+				cn.close()
 
 
 	def setLanguage(self, lang, charset=None):
@@ -1603,6 +1664,15 @@ try again when it is running.
 			return None
 
 
+	def _getSchemaCacheFile(self):
+		return getattr(self, "_schemaCacheFile", None)
+
+	def _setSchemaCacheFile(self, val):
+		self._schemaCacheFile = val
+		if val:
+			dabo.db.schemaCache.load(val, self.getAppInfo("appVersion"))
+
+
 	def _getSearchDelay(self):
 		try:
 			return self._searchDelay
@@ -1836,6 +1906,14 @@ try again when it is running.
 			_("""If this bizobj is being run remotely, returns a reference to the RemoteConnector
 			object that will handle communication with the server.  (read-only) (RemoteConnector)"""))
 
+	SchemaCacheFile = property(_getSchemaCacheFile, _setSchemaCacheFile, None,
+			_("""Path of the file where the table metadata queried from the database
+			is kept between runs of the app. When set, the file is loaded into
+			dabo.db.schemaCache, and the cache is saved back to it when the app
+			finishes. The file is ignored if it was saved by a different
+			appVersion, so the cache is refreshed with each new release.
+			Default=None  (str)"""))
+
 	SearchDelay = property(_getSearchDelay, _setSearchDelay, None,
 			_("""Specifies the delay before incrementeal searching begins.  (int)
 
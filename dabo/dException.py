@@ -65,6 +65,9 @@ class FieldNotFoundException(dException):
 class ConnectionNotFoundException(dException):
 	pass
 
+class ConnectionPoolTimeoutException(dException):
+	pass
+
 class DatabaseException(dException):
 	pass
 
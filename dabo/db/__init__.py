@@ -31,10 +31,16 @@ some rows from a backend database in a script. Here's an example of that::
 import datetime
 from decimal import Decimal
 from dConnection import dConnection
+from dConnectionPool import dConnectionPool
 from dCursorMixin import dCursorMixin
 from dConnectInfo import dConnectInfo
 from dTable import dTable
 from dDataSet import dDataSet
+from dCompactRecord import dCompactRecord
+from dQueryMonitor import addQueryObserver, removeQueryObserver, dQueryStats
+from dSchemaCache import dSchemaCache, schemaCache
+from dResultCache import dResultCache, resultCache
+from dRequeryFuture import dRequeryFuture
 from dabo.dException import FieldNotFoundException
 
 daboTypes = {
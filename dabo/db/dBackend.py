@@ -10,6 +10,7 @@ from dabo.dLocalize import _
 import dabo.dException as dException
 from dabo.dObject import dObject
 from dabo.db import dTable
+from dabo.db.dSchemaCache import schemaCache
 from dNoEscQuoteStr import dNoEscQuoteStr
 from dabo.lib.utils import ustr
 from dCursorMixin import dCursorMixin
@@ -30,6 +31,10 @@ class dBackend(dObject):
 		super(dBackend, self).__init__()
 		self.dbModuleName = None
 		self._connection = None
+		# Identifies the database in the schema cache; set by dConnectInfo.
+		self.schemaCacheKey = None
+		# The dConnectInfo that made the connection; set by dConnectInfo.
+		self.connectInfo = None
 		# Reference to the cursor that is using this object
 		self._cursor = None
 		self.lastExecuteTime = time.time() # For keep alive interval
@@ -117,6 +122,17 @@ class dBackend(dObject):
 		raise dException.dException(_("No records updated"))
 
 
+	def reportsBatchRowCount(self):
+		"""
+		Returns True if the rowcount of a cursor after executemany() is the
+		number of rows changed by all the statements, so that the updates of
+		several rows can be sent together and still be checked for rows that
+		weren't found. Backends whose rowcount can't be relied on should
+		return False; their updates are then saved one row at a time.
+		"""
+		return True
+
+
 	def noResultsOnDelete(self):
 		"""
 		Most backends will return a non-zero number if there are deletions.
@@ -459,20 +475,16 @@ class dBackend(dObject):
 			# No table specified, so no update checking is possible
 			return None
 		# This is the current description of the cursor.
-		auxCrs = cursor._getAuxCursor()
-		if not cursor.FieldDescription:
+		descFlds = cursor.FieldDescription
+		if not descFlds:
 			# A query hasn't been run yet; so we need to get one
+			auxCrs = cursor._getAuxCursor()
 			holdWhere = auxCrs._whereClause
 			auxCrs.addWhere("1 = 0")
-			auxCrs.execute(auxCrs.getSQL())
+			descFlds = self.getCachedDescription(cursor, auxCrs.getSQL())
 			auxCrs._whereClause = holdWhere
-		descFlds = auxCrs.FieldDescription
-		# Get the raw version of the table
-		sql = "select * from %s where 1=0 " % self.encloseNames(cursor.Table,
-				autoQuote=autoQuote)
-		auxCrs.execute(sql)
 		# This is the clean version of the table.
-		stdFlds = auxCrs.FieldDescription
+		stdFlds = self.getTableDescription(cursor, cursor.Table, autoQuote=autoQuote)
 
 		# Get all the fields that are not in the table.
 		ret0 = [d[0] for d in descFlds
@@ -489,6 +501,41 @@ class dBackend(dObject):
 		return ret0
 
 
+	def getCachedDescription(self, cursor, sql):
+		"""
+		Returns the FieldDescription that running 'sql' in the cursor's AuxCursor
+		gives. This is used with statements that return no rows, to find out the
+		structure of a query or table. The description is kept in the schema
+		cache, so each statement only goes to the backend once.
+		"""
+		item = ("description", sql)
+		desc = schemaCache.get(self.schemaCacheKey, cursor.Table, item)
+		if desc is None:
+			aux = cursor.AuxCursor
+			aux.execute(sql)
+			desc = aux.FieldDescription
+			if desc:
+				desc = tuple(tuple(fld) for fld in desc)
+				schemaCache.set(self.schemaCacheKey, cursor.Table, item, desc)
+		return desc
+
+
+	def getTableDescription(self, cursor, table, autoQuote=True):
+		"""Returns the FieldDescription of a query for all the fields of the table."""
+		sql = "select * from %s where 1=0 " % self.encloseNames(table,
+				autoQuote=autoQuote)
+		return self.getCachedDescription(cursor, sql)
+
+
+	def cacheTableSchema(self, cursor, table):
+		"""
+		Loads the metadata that cursors need about the table into the schema
+		cache, so that it doesn't have to be queried when the table is first used.
+		"""
+		cursor.getFields(table)
+		self.getTableDescription(cursor, table)
+
+
 	def getStructureDescription(self, cursor):
 		"""Return the basic field structure."""
 		field_structure = {}
@@ -497,10 +544,8 @@ class dBackend(dObject):
 		field_description = cursor.FieldDescription
 		if not field_description:
 			# No query run yet: execute the structure-only sql:
-			structure_only_sql = cursor.getStructureOnlySql()
-			aux = cursor.AuxCursor
-			aux.execute(structure_only_sql)
-			field_description = aux.FieldDescription
+			field_description = self.getCachedDescription(cursor,
+					cursor.getStructureOnlySql())
 		for field_info in field_description:
 			field_name = ustr(field_info[0])
 			field_type = self.getDaboFieldType(field_info[1])
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion between the columns of a cursor and typed arrays, as used by
+dCursorMixin.getColumnArrays() and setColumnArrays().
+
+When NumPy is installed, columns become NumPy arrays whose dtype follows the
+Dabo type code of the field; columns holding NULLs become masked arrays.
+Without NumPy, numeric columns become array.array objects, and all other
+columns, as well as numeric ones holding NULLs, which array.array can't
+represent, are returned as plain lists.
+"""
+import array
+from decimal import Decimal
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# The NumPy dtype for each Dabo type code; other codes use object arrays.
+# Decimals become floats, which is what numeric code expects; they are turned
+# back into Decimals by toList().
+_numpyTypes = {"I": "int64", "G": "int64", "F": "float64", "N": "float64",
+		"B": "bool", "D": "datetime64[D]", "T": "datetime64[us]"}
+# The array.array typecode for each numeric Dabo type code.
+_arrayTypes = {"I": "l", "G": "l", "F": "d", "N": "d", "B": "b"}
+# The values stored under the mask in place of NULLs.
+_fillValues = {"I": 0, "G": 0, "F": 0.0, "N": 0.0, "B": False}
+
+
+def hasNumpy():
+	"""Returns True if NumPy is available to build the arrays."""
+	return numpy is not None
+
+
+def toArray(values, typeCode):
+	"""Returns the list of column values as an array for the Dabo type code."""
+	hasNulls = None in values
+	if numpy is not None:
+		dtype = _numpyTypes.get(typeCode, object)
+		if not hasNulls:
+			return numpy.array(values, dtype=dtype)
+		fill = _fillValues.get(typeCode)
+		data = [fill if val is None else val for val in values]
+		return numpy.ma.masked_array(numpy.array(data, dtype=dtype),
+				mask=[val is None for val in values])
+	typ = _arrayTypes.get(typeCode)
+	if typ is None or hasNulls:
+		return list(values)
+	try:
+		return array.array(typ, values)
+	except (TypeError, OverflowError):
+		# Values that don't fit the typecode, such as very large longs.
+		return list(values)
+
+
+def toList(arr, pyType=None):
+	"""
+	Returns the values of an array, or of any other sequence, as a list of
+	Python values. Masked entries become None, and floats and ints are
+	converted to the Decimal or bool 'pyType' of the field they belong to.
+	"""
+	if numpy is not None and isinstance(arr, numpy.ndarray):
+		# This also turns masked entries into None, and datetime64 values
+		# into dates and datetimes.
+		ret = arr.tolist()
+	else:
+		ret = list(arr)
+	if pyType is Decimal:
+		ret = [Decimal(repr(val)) if isinstance(val, float) else val for val in ret]
+	elif pyType is bool:
+		ret = [val if val is None else bool(val) for val in ret]
+	return ret
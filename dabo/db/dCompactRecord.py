@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+from operator import itemgetter
+import dabo.dConstants as kons
+
+
+
+# Marks a field that has been deleted from a compact record.
+_missing = object()
+
+
+class dRecordLayout(object):
+	"""Maps the field names of a result set to their slot in each record.
+
+	A single layout is shared by all the dCompactRecord objects of a result
+	set, so that the field names are stored only once per cursor instead of
+	once in every row.
+	"""
+	__slots__ = ("names", "slots")
+
+	def __init__(self, names):
+		self.names = tuple(names)
+		self.slots = dict((name, idx) for idx, name in enumerate(self.names))
+
+
+	def makeRecords(self, rows):
+		"""Converts a sequence of backend rows to a list of compact records. The
+		rows can be either tuples in the layout's field order, or dicts.
+		"""
+		if not rows:
+			return []
+		if isinstance(rows[0], dict):
+			names = self.names
+			return [dCompactRecord(self, [row[name] for name in names])
+					for row in rows]
+		return [dCompactRecord(self, list(row)) for row in rows]
+
+
+	def getProjector(self, names):
+		"""Returns a function that takes a compact record with this layout and
+		returns a tuple of the values of the passed fields, or None if any of
+		them isn't in the layout. Like rec[name], it raises KeyError for a
+		field that was deleted from the record.
+		"""
+		try:
+			idx = [self.slots[name] for name in names]
+		except KeyError:
+			return None
+		if not idx:
+			return lambda rec: ()
+		if len(idx) == 1:
+			pos = idx[0]
+			getter = lambda values: (values[pos],)
+		else:
+			getter = itemgetter(*idx)
+		def project(rec):
+			vals = getter(rec._values)
+			if _missing in vals:
+				raise KeyError(names[list(vals).index(_missing)])
+			return vals
+		return project
+
+
+
+class dCompactRecord(object):
+	"""A dict-like record that stores its values in a list.
+
+	The position of each field's value is looked up in the shared
+	dRecordLayout. Keys that aren't in the layout, such as the temporary key
+	flag of a new record, go into a small dict that is only created when
+	needed, and the 'types corrected' flag is kept in its own slot. The usual
+	dict methods are supported, so code that works with the records of a
+	cursor doesn't need to know how they are stored.
+	"""
+	__slots__ = ("_layout", "_values", "_corrected", "_extra")
+	__hash__ = None
+
+	def __init__(self, layout, values):
+		self._layout = layout
+		self._values = values
+		self._corrected = False
+		self._extra = None
+
+
+	def __getitem__(self, key):
+		try:
+			val = self._values[self._layout.slots[key]]
+		except KeyError:
+			if key == kons.CURSOR_FIELD_TYPES_CORRECTED and self._corrected:
+				return True
+			if self._extra is None:
+				raise
+			return self._extra[key]
+		if val is _missing:
+			raise KeyError(key)
+		return val
+
+
+	def __setitem__(self, key, val):
+		try:
+			self._values[self._layout.slots[key]] = val
+		except KeyError:
+			if key == kons.CURSOR_FIELD_TYPES_CORRECTED:
+				self._corrected = bool(val)
+				return
+			if self._extra is None:
+				self._extra = {}
+			self._extra[key] = val
+
+
+	def __delitem__(self, key):
+		try:
+			idx = self._layout.slots[key]
+		except KeyError:
+			if key == kons.CURSOR_FIELD_TYPES_CORRECTED and self._corrected:
+				self._corrected = False
+				return
+			if self._extra is None:
+				raise
+			del self._extra[key]
+			return
+		if self._values[idx] is _missing:
+			raise KeyError(key)
+		self._values[idx] = _missing
+
+
+	def __contains__(self, key):
+		try:
+			return self._values[self._layout.slots[key]] is not _missing
+		except KeyError:
+			if key == kons.CURSOR_FIELD_TYPES_CORRECTED:
+				return self._corrected
+			return self._extra is not None and key in self._extra
+
+	has_key = __contains__
+
+
+	def __iter__(self):
+		return self.iterkeys()
+
+
+	def __len__(self):
+		return len(self.keys())
+
+
+	def __nonzero__(self):
+		# Cheaper than counting the keys, as truth tests on records are common.
+		for val in self._values:
+			if val is not _missing:
+				return True
+		return self._corrected or bool(self._extra)
+
+
+	def __eq__(self, other):
+		if other is self:
+			return True
+		try:
+			return dict(self.iteritems()) == dict(other.iteritems())
+		except AttributeError:
+			return False
+
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+
+	def __repr__(self):
+		return repr(dict(self.iteritems()))
+
+
+	def __getstate__(self):
+		return dict(self.iteritems())
+
+
+	def __setstate__(self, state):
+		self.__init__(dRecordLayout(()), [])
+		self.update(state)
+
+
+	def __copy__(self):
+		"""Returns a compact record with the same layout and its own values."""
+		ret = dCompactRecord(self._layout, list(self._values))
+		ret._corrected = self._corrected
+		if self._extra is not None:
+			ret._extra = self._extra.copy()
+		return ret
+
+
+	def iteritems(self):
+		for name, val in zip(self._layout.names, self._values):
+			if val is not _missing:
+				yield name, val
+		if self._corrected:
+			yield kons.CURSOR_FIELD_TYPES_CORRECTED, True
+		if self._extra:
+			for item in self._extra.iteritems():
+				yield item
+
+
+	def iterkeys(self):
+		for key, val in self.iteritems():
+			yield key
+
+
+	def itervalues(self):
+		for key, val in self.iteritems():
+			yield val
+
+
+	def items(self):
+		return list(self.iteritems())
+
+
+	def keys(self):
+		return list(self.iterkeys())
+
+
+	def values(self):
+		return list(self.itervalues())
+
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+
+	def pop(self, key, *default):
+		try:
+			val = self[key]
+		except KeyError:
+			if default:
+				return default[0]
+			raise
+		del self[key]
+		return val
+
+
+	def setdefault(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			self[key] = default
+			return default
+
+
+	def update(self, other=(), **kwargs):
+		if hasattr(other, "keys"):
+			other = ((key, other[key]) for key in other.keys())
+		for key, val in other:
+			self[key] = val
+		for key, val in kwargs.iteritems():
+			self[key] = val
+
+
+	def copy(self):
+		"""Returns a plain dict with the same contents."""
+		return dict(self.iteritems())
+
+
+	def clear(self):
+		self._values = [_missing] * len(self._layout.names)
+		self._corrected = False
+		self._extra = None
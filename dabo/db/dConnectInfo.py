@@ -51,6 +51,8 @@ class dConnectInfo(dObject):
 		self._backendObject = None
 		self._host = self._user = self._password = self._dbType = self._database = self._port = self._name = self._remoteHost = ""
 		self._keepAliveInterval = None
+		self._poolMaxSize = self._poolMinSize = 0
+		self._poolTimeout = None
 		super(dConnectInfo, self).__init__(**kwargs)
 		if connInfo:
 			self.setConnInfo(connInfo)
@@ -61,7 +63,8 @@ class dConnectInfo(dObject):
 		# a valid property name, raise TypeError.
 		self._customParameters = {}
 		props = ["Name", "DbType", "Host", "User", "Password", "Database",
-				"PlainTextPassword", "Port", "RemoteHost", "KeepAliveInterval"]
+				"PlainTextPassword", "Port", "RemoteHost", "KeepAliveInterval",
+				"PoolMaxSize", "PoolMinSize", "PoolTimeout"]
 		lprops = [p.lower() for p in props]
 		for k, v in connInfo.items():
 			try:
@@ -76,7 +79,43 @@ class dConnectInfo(dObject):
 
 	def getConnection(self, **kwargs):
 		kwargs.update(self.CustomParameters)
-		return self._backendObject.getConnection(self, **kwargs)
+		conn = self._backendObject.getConnection(self, **kwargs)
+		self._backendObject.schemaCacheKey = self.getSchemaCacheKey(conn)
+		self._backendObject.connectInfo = self
+		return conn
+
+
+	def copy(self):
+		"""
+		Returns a new dConnectInfo with the same settings. It has its own
+		backend object, so connections made with it are independent of the
+		ones made with this object. The pool settings are not copied.
+		"""
+		ret = dConnectInfo()
+		cryptoProvider = getattr(self, "_cryptoProvider", None)
+		if cryptoProvider is not None:
+			ret._cryptoProvider = cryptoProvider
+		info = dict(self.CustomParameters)
+		info.update({"Name": self.Name, "DbType": self.DbType, "Host": self.Host,
+				"User": self.User, "Password": self.Password, "Database": self.Database,
+				"RemoteHost": self.RemoteHost, "KeepAliveInterval": self.KeepAliveInterval})
+		if self.Port:
+			info["Port"] = self.Port
+		ret.setConnInfo(info)
+		return ret
+
+
+	def getSchemaCacheKey(self, connection=None):
+		"""
+		Returns the tuple that identifies the database in dabo.db.schemaCache.
+		Its last element is None, except for in-memory SQLite databases, which
+		only exist within the passed connection.
+		"""
+		instance = None
+		if self.Database == ":memory:":
+			instance = id(connection)
+		return (self.DbType, self.RemoteHost, self.Host, self.Port, self.Database,
+				self.User, instance)
 
 
 	def getDictCursorClass(self):
@@ -234,6 +273,31 @@ class dConnectInfo(dObject):
 		self._password = self.encrypt(val)
 
 
+	def _getPoolMaxSize(self):
+		return self._poolMaxSize
+
+	def _setPoolMaxSize(self, val):
+		self._poolMaxSize = int(val or 0)
+
+
+	def _getPoolMinSize(self):
+		return self._poolMinSize
+
+	def _setPoolMinSize(self, val):
+		self._poolMinSize = int(val or 0)
+
+
+	def _getPoolTimeout(self):
+		return self._poolTimeout
+
+	def _setPoolTimeout(self, val):
+		if val in (None, ""):
+			val = None
+		else:
+			val = float(val)
+		self._poolTimeout = val
+
+
 	def _getPort(self):
 		return self._port
 
@@ -292,6 +356,24 @@ class dConnectInfo(dObject):
 			_("""Write-only property that encrypts the value and stores that
 				in the Password property. (str)"""))
 
+	PoolMaxSize = property(_getPoolMaxSize, _setPoolMaxSize, None,
+			_("""The most connections that dApp.getConnectionByName() keeps open for
+			this connection. (int)
+
+			Defaults to 0, meaning the connection isn't pooled: a single connection
+			is shared by everything that asks for it by name. When set, each thread
+			that calls getConnectionByName() checks out its own connection from a
+			dConnectionPool, which is returned by calling its close() method.
+			"""))
+
+	PoolMinSize = property(_getPoolMinSize, _setPoolMinSize, None,
+			_("The number of pooled connections opened up front. Defaults to 0. (int)"))
+
+	PoolTimeout = property(_getPoolTimeout, _setPoolTimeout, None,
+			_("""Seconds to wait for a pooled connection to be returned when they
+			are all in use, after which ConnectionPoolTimeoutException is raised.
+			Defaults to None, meaning wait for as long as needed. (float)"""))
+
 	Port = property(_getPort, _setPort, None,
 			_("The port to connect on (may not be applicable for all databases). (int)"))
 
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import dabo
 from dabo.dLocalize import _
 from dabo.dObject import dObject
 from dConnectInfo import dConnectInfo
@@ -10,6 +11,9 @@ class dConnection(dObject):
 	def __init__(self, connectInfo=None, parent=None, forceCreate=False, **kwargs):
 		self._baseClass = dConnection
 		self._forceCreate = forceCreate
+		# The dConnectionPool this connection was checked out from, if any.
+		self._pool = None
+		self._releasePending = False
 		super(dConnection, self).__init__()
 		# Store a reference to the parent object (bizobj maybe; app
 		# object connection collection most likely)
@@ -37,7 +41,20 @@ class dConnection(dObject):
 
 
 	def close(self):
-		self._connection.close()
+		"""
+		Closes the connection. Pooled connections are returned to their pool
+		instead, once any transaction running on them has finished.
+		"""
+		if self._pool is not None:
+			self._pool.release(self)
+		else:
+			self._connection.close()
+			key = self._connectInfo.getSchemaCacheKey(self._connection)
+			if key[-1] is not None:
+				# An in-memory database is gone once its connection is closed, and
+				# a new connection could be given the same key.
+				dabo.db.schemaCache.invalidate(key)
+				dabo.db.resultCache.invalidate(key)
 
 
 	def getDictCursorClass(self):
@@ -112,12 +129,19 @@ class dConnection(dObject):
 			return "?"
 
 
+	def _getPool(self):
+		return self._pool
+
+
 	ConnectInfo = property(_getConnInfo, None, None,
 			_("The connectInfo for the connection.  (dConnectInfo)"))
 
 	Name = property(_getName, None, None,
 			_("The name of the connection.  (str)"))
 
+	Pool = property(_getPool, None, None,
+			_("The dConnectionPool this connection was checked out from, or None.  (dConnectionPool)"))
+
 
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import dabo
+import dabo.dException as dException
+from dabo.dLocalize import _
+from dabo.lib.utils import ustr
+
+
+
+class dConnectionPool(object):
+	"""
+	Keeps a set of open connections to the same database, so that several
+	threads can run queries at the same time instead of all sharing a single
+	DB-API connection.
+
+	Each pooled connection is a regular dConnection made from a copy of the
+	passed dConnectInfo. Call acquire() to check one out, and close() on the
+	returned connection to give it back to the pool. A connection that still
+	holds the app's transaction token when it is closed is returned once the
+	transaction is committed or rolled back.
+
+	Idle connections are checked with a cheap query before being handed out
+	again if they haven't been used for 'healthCheckInterval' seconds; broken
+	ones are discarded and replaced. The pool never holds more than the
+	PoolMaxSize of the dConnectInfo, and keeps at least PoolMinSize open.
+
+	Pools are normally created by dApp.getConnectionByName() for connections
+	whose PoolMaxSize is set, which checks out connections with
+	acquireForThread(): all the bizobjs created in the same thread then share
+	one connection, and with it their transactions.
+	"""
+	def __init__(self, connectInfo, healthCheckInterval=30, healthCheckSQL="select 1"):
+		self._connectInfo = connectInfo
+		self.healthCheckInterval = healthCheckInterval
+		self.healthCheckSQL = healthCheckSQL
+		self._cond = threading.Condition(threading.Lock())
+		# List of (dConnection, time it was returned) tuples, most recent last.
+		self._idle = []
+		self._inUse = set()
+		# The connections checked out by acquireForThread(), keyed on the
+		# thread, and the number of close() calls each is still waiting for.
+		self._threadConns = {}
+		self._shareCounts = {}
+		# Number of checkouts whose connection is still being opened or checked.
+		self._opening = 0
+		self._closed = False
+		self._stats = dict.fromkeys(("created", "checkouts", "waits", "timeouts",
+				"healthCheckFailures", "discarded"), 0)
+		for num in xrange(self.MinSize):
+			self._idle.append((self._createConnection(), time.time()))
+
+
+	def acquire(self, timeout=None):
+		"""
+		Checks out a connection. When all connections are in use and the pool
+		is at its maximum size, waits up to 'timeout' seconds for one to be
+		returned; 'timeout' defaults to the PoolTimeout of the dConnectInfo,
+		and None waits for as long as needed.
+		"""
+		if timeout is None:
+			timeout = self._connectInfo.PoolTimeout
+		deadline = None
+		if timeout is not None:
+			deadline = time.time() + timeout
+		with self._cond:
+			waited = False
+			while True:
+				if self._closed:
+					raise dException.dException(_("The connection pool is closed"))
+				if self._idle:
+					conn, returned = self._idle.pop()
+					break
+				if self._getSize() < self.MaxSize:
+					conn = returned = None
+					break
+				if not waited:
+					self._stats["waits"] += 1
+					waited = True
+				remaining = None
+				if deadline is not None:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						self._stats["timeouts"] += 1
+						raise dException.ConnectionPoolTimeoutException(
+								_("No connection was returned to the pool '%(name)s' within "
+								"%(timeout)s seconds") % {"name": self.Name, "timeout": timeout})
+				self._cond.wait(remaining)
+			# The slot stays reserved while the connection is checked or opened,
+			# which happens outside of the lock.
+			self._opening += 1
+			self._stats["checkouts"] += 1
+		try:
+			if ((conn is not None) and (time.time() - returned > self.healthCheckInterval)
+					and not self._isHealthy(conn)):
+				self._discard(conn)
+				conn = None
+			if conn is None:
+				conn = self._createConnection()
+		finally:
+			with self._cond:
+				self._opening -= 1
+				if conn is None:
+					# Opening it failed, so another thread can have the slot.
+					self._cond.notify()
+				else:
+					self._inUse.add(conn)
+		return conn
+
+
+	def acquireForThread(self, timeout=None):
+		"""
+		Like acquire(), but all the calls made by the same thread get the same
+		connection, so that a parent bizobj and its children write in the same
+		transaction. The connection is returned to the pool once close() has
+		been called on it once for each call.
+		"""
+		ident = threading.current_thread().ident
+		with self._cond:
+			conn = self._threadConns.get(ident)
+			if conn is not None:
+				self._shareCounts[conn] += 1
+				# Whoever closed it during a transaction is done with it, but
+				# this caller isn't.
+				conn._releasePending = False
+				return conn
+		conn = self.acquire(timeout)
+		with self._cond:
+			self._threadConns[ident] = conn
+			self._shareCounts[conn] = 1
+		return conn
+
+
+	def release(self, conn):
+		"""
+		Returns a connection checked out with acquire(). This is what close()
+		does for pooled connections. Any transaction that wasn't committed is
+		rolled back.
+		"""
+		with self._cond:
+			count = self._shareCounts.get(conn)
+			if count > 1:
+				# It's still used by other objects of the same thread.
+				self._shareCounts[conn] = count - 1
+				return
+			if count is not None:
+				self._shareCounts[conn] = 0
+		app = dabo.dAppRef
+		if app is not None and app.isTransactionPending(conn):
+			# The bizobj holding the token will release the connection.
+			conn._releasePending = True
+			return
+		conn._releasePending = False
+		try:
+			conn.getConnection().rollback()
+			healthy = True
+		except StandardError:
+			healthy = False
+		with self._cond:
+			if conn not in self._inUse:
+				return
+			self._inUse.discard(conn)
+			if conn in self._shareCounts:
+				del self._shareCounts[conn]
+				for ident, shared in self._threadConns.items():
+					if shared is conn:
+						del self._threadConns[ident]
+			if self._closed or not healthy:
+				self._stats["discarded"] += 1
+			else:
+				self._idle.append((conn, time.time()))
+				conn = None
+			self._cond.notify()
+		if conn is not None:
+			self._closeConnection(conn)
+
+
+	def close(self):
+		"""
+		Closes the idle connections, and the ones in use as they are returned.
+		No more connections can be checked out.
+		"""
+		with self._cond:
+			self._closed = True
+			idle, self._idle = self._idle, []
+			self._cond.notifyAll()
+		for conn, returned in idle:
+			self._closeConnection(conn)
+
+
+	def getStats(self):
+		"""
+		Returns a dict with the current 'size', 'idle' and 'inUse' counts, and
+		the number of connections 'created', 'discarded', 'checkouts', the
+		checkouts that had to wait ('waits') or gave up ('timeouts'), and the
+		'healthCheckFailures'.
+		"""
+		with self._cond:
+			ret = dict(self._stats)
+			ret["idle"] = len(self._idle)
+			ret["inUse"] = len(self._inUse) + self._opening
+			ret["size"] = self._getSize()
+		return ret
+
+
+	def _getSize(self):
+		return len(self._idle) + len(self._inUse) + self._opening
+
+
+	def _createConnection(self):
+		ci = self._connectInfo.copy()
+		# The health checks take the place of a keep-alive thread per connection.
+		ci.KeepAliveInterval = None
+		conn = dabo.db.dConnection(ci)
+		conn._pool = self
+		with self._cond:
+			self._stats["created"] += 1
+		return conn
+
+
+	def _isHealthy(self, conn):
+		try:
+			crs = conn.getConnection().cursor()
+			crs.execute(self.healthCheckSQL)
+			crs.fetchall()
+			crs.close()
+		except StandardError, e:
+			dabo.log.info(_("Discarding broken pooled connection '%(name)s': %(e)s")
+					% {"name": self.Name, "e": ustr(e)})
+			with self._cond:
+				self._stats["healthCheckFailures"] += 1
+			return False
+		return True
+
+
+	def _discard(self, conn):
+		with self._cond:
+			self._stats["discarded"] += 1
+		self._closeConnection(conn)
+
+
+	def _closeConnection(self, conn):
+		try:
+			conn.getConnection().close()
+		except StandardError:
+			pass
+
+
+	def _getMaxSize(self):
+		return max(self._connectInfo.PoolMaxSize, 1)
+
+
+	def _getMinSize(self):
+		return min(self._connectInfo.PoolMinSize, self.MaxSize)
+
+
+	def _getName(self):
+		return self._connectInfo.Name
+
+
+	MaxSize = property(_getMaxSize, None, None,
+			_("The most connections the pool will open, from the PoolMaxSize of the dConnectInfo.  (int)"))
+
+	MinSize = property(_getMinSize, None, None,
+			_("The connections opened when the pool is created, from the PoolMinSize of the dConnectInfo.  (int)"))
+
+	Name = property(_getName, None, None,
+			_("The name of the pooled connection.  (str)"))
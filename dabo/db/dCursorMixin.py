@@ -2,7 +2,11 @@
 # dabo/db/dCursorMixin
 
 import datetime
+import logging
 import time
+import sys
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
 import re
 from decimal import Decimal
 import functools
@@ -13,20 +17,93 @@ import dabo.dException as dException
 from dabo.dObject import dObject
 from dNoEscQuoteStr import dNoEscQuoteStr
 from dabo.db.dDataSet import dDataSet
+from dabo.db.dCompactRecord import dRecordLayout, dCompactRecord
 from dabo.lib import dates
-from dabo.lib.utils import noneSortKey, caseInsensitiveSortKey
 from dabo.lib.utils import ustr
+from dabo.lib.utils import logWillEmit
+from dabo.db.dQueryMonitor import hasQueryObservers, notifyQueryObservers
+from dabo.db.dSchemaCache import schemaCache
+from dabo.db.dRequeryFuture import dRequeryFuture, startRequery
+from dabo.db.dResultCache import resultCache, getTableNames, isWriteStatement
+from dabo.db import dColumnArrays
 
 cursor_flags = (kons.CURSOR_MEMENTO, kons.CURSOR_NEWFLAG,
 		kons.CURSOR_TMPKEY_FIELD, kons.CURSOR_FIELD_TYPES_CORRECTED)
 
 
+def _safeLower(val):
+	try:
+		return val.lower()
+	except AttributeError:
+		return val
+
+
+class _ChangeDict(dict):
+	"""
+	dict used for the mementos and new record flags of a cursor. It calls
+	'callback' whenever it goes from empty to not empty or back, which lets
+	the cursor tell its bizobj when it starts or stops having changes.
+	"""
+	__slots__ = ("_callback",)
+
+	def __init__(self, callback):
+		super(_ChangeDict, self).__init__()
+		self._callback = callback
+
+
+	def __setitem__(self, key, val):
+		wasEmpty = not self
+		dict.__setitem__(self, key, val)
+		if wasEmpty:
+			self._callback()
+
+
+	def __delitem__(self, key):
+		dict.__delitem__(self, key)
+		if not self:
+			self._callback()
+
+
+	def pop(self, key, *default):
+		wasEmpty = not self
+		ret = dict.pop(self, key, *default)
+		if not self and not wasEmpty:
+			self._callback()
+		return ret
+
+
+	def popitem(self):
+		ret = dict.popitem(self)
+		if not self:
+			self._callback()
+		return ret
+
+
+	def setdefault(self, key, default=None):
+		wasEmpty = not self
+		ret = dict.setdefault(self, key, default)
+		if wasEmpty:
+			self._callback()
+		return ret
+
+
+	def update(self, *args, **kwargs):
+		wasEmpty = not self
+		dict.update(self, *args, **kwargs)
+		if wasEmpty and self:
+			self._callback()
+
+
+	def clear(self):
+		if self:
+			dict.clear(self)
+			self._callback()
+
+
+
 class dCursorMixin(dObject):
 	"""Dabo's cursor class, representing the lowest tier."""
 	_call_initProperties = False
-	# Make these class attributes, so that they are shared among all instances
-	_fieldStructure = {}
-
 	def __init__(self, sql="", *args, **kwargs):
 		self._convertStrToUnicode = True
 		self._initProperties()
@@ -83,8 +160,10 @@ class dCursorMixin(dObject):
 		self.__lastFieldList = ""
 		self._whitespacePat = re.compile(r"(\s+)")
 		self._selectStatementPat = re.compile(r"\bselect\b(.+)\bfrom\b", re.I | re.M | re.S)
-		# Holds the keys in the original, unsorted order for unsorting the dataset
-		self.__unsortedRows = []
+		# Maps the id of each record to its original, unsorted position for
+		# unsorting the dataset; the records themselves are kept alongside.
+		self.__unsortedPositions = None
+		self.__unsortedRecords = None
 		# Holds the name of fields to be skipped when updating the backend, such
 		# as calculated or derived fields, or fields that are otherwise not to be updated.
 		self.__nonUpdateFields = None
@@ -98,6 +177,16 @@ class dCursorMixin(dObject):
 		self.sqlManager = self
 		# Attribute that holds the data of the cursor
 		self._records = dDataSet()
+		# Maps PK values to row positions in self._records. It is rebuilt lazily
+		# whenever self._records is replaced by a different data set object.
+		self._pkIndex = None
+		self._pkIndexRecords = None
+		self._pkIndexHasDupes = False
+		# Sorted (value, row) lists used by seek(), keyed on the tuple of fields
+		# and whether the values are lowercased. Like the PK index, they are
+		# only valid for the data set object they were built from.
+		self._seekIndexes = {}
+		self._seekIndexRecords = None
 		# Attribute that holds the current row number
 		self.__rownumber = -1
 		# Data structure info
@@ -106,13 +195,66 @@ class dCursorMixin(dObject):
 		self._keyField = ""
 		self._userSQL = None
 		self._virtualFields = {}
+		# Memoized values of the virtual fields defined with 'cache': maps each
+		# field name to a dict of {id(record): (record, value)}.
+		self._virtualFieldCache = {}
 
 		self._autoPopulatePK = True
 		self._autoQuoteNames = True
+		# How the rows of a select are retrieved from the backend: either all at
+		# once, or 'chunked', FetchSize rows at a time as they are needed.
+		self._fetchMode = "all"
+		self._fetchSize = 5000
+		# True while a chunked select still has rows waiting in the backend.
+		self._fetchPending = False
+		# When True, fetched rows are stored as dCompactRecord objects sharing
+		# a single dRecordLayout, instead of as one dict per row.
+		self._compactRecords = False
+		self._recordLayout = None
+		# Records whose saving is deferred between beginBatchSave() and
+		# endBatchSave(); None when save() writes immediately.
+		self._batchSaveRecords = None
+		# Maximum number of keys in a single delete statement of deleteRows().
+		self._deleteChunkSize = 500
+		# State of the keyset paging started by requeryPage(): the page size,
+		# the columns that order the pages, the parameters of the query, whether
+		# pages are appended, and the key values of the first and last rows.
+		self._pageSize = None
+		self._pageColumns = None
+		self._pageParams = None
+		self._pageAppend = False
+		self._pageFirstKey = None
+		self._pageLastKey = None
+		# Used by requeryDelta(): the field holding the time each row was last
+		# changed, the optional SQL that returns the changed rows, the highest
+		# value of that field seen so far, and the rows that were changed both
+		# in the database and locally.
+		self._lastModifiedField = None
+		self._deltaSQL = None
+		self._deltaWatermark = None
+		self._deltaConflicts = {}
+		# The dRequeryFuture of the last call to requeryAsync().
+		self._asyncRequery = None
+		# Seconds that requeried rows are kept in dabo.db.resultCache; None
+		# means the cache isn't used.
+		self._cacheTTL = None
 
 		self.__tmpPK = -1		# temp PK value for new records.
 		# Holds the data types for each field
 		self._types = {}
+		# Maps field names to the functions that correct their values' types. It
+		# is rebuilt whenever the types change.
+		self._fieldConverters = {}
+		# Maps (table, AutoQuoteNames, column names) to the insert statement
+		# for those columns, so that batches of new rows build it only once.
+		self._insertSQLCache = {}
+		# When True, the types of all the fetched rows are corrected right away,
+		# one column at a time, instead of as each row is first accessed.
+		self._correctTypesOnFetch = False
+		# Fields whose values are used as the backend returns them.
+		self._nativeTypeFields = ()
+		# Maps field names to the kind of index filter() uses for them.
+		self._filterIndexes = {}
 
 		# Holds reference to auxiliary cursor that handles queries that
 		# are not supposed to affect the record set.
@@ -134,9 +276,11 @@ class dCursorMixin(dObject):
 		self._cursorFactoryFunc = None
 		self._cursorFactoryClass = None
 
-		# mementos and new records, keyed on record object ids:
-		self._mementos = {}
-		self._newRecords = {}
+		# mementos and new records, keyed on record object ids. These are never
+		# replaced, only cleared, so that the bizobj is always told when the
+		# cursor starts or stops having changes.
+		self._mementos = _ChangeDict(self._onChangedStateChanged)
+		self._newRecords = _ChangeDict(self._onChangedStateChanged)
 
 		# Flag preference cursors so that they don't fill up the logs
 		self._isPrefCursor = False
@@ -213,12 +357,106 @@ class dCursorMixin(dObject):
 		return pkField
 
 
-	def _correctFieldTypesIfNeeded(self, rec):
+	def _correctFieldTypesIfNeeded(self, rec, row=None):
 		if not rec.get(kons.CURSOR_FIELD_TYPES_CORRECTED, False):
-			_correctFieldType = self._correctFieldType
-			for fld_name in (i for i in rec if i not in cursor_flags):
-				rec[fld_name] = _correctFieldType(rec[fld_name], fld_name)
+			getConverter = self._getFieldConverter
+			converted = False
+			for fld_name in [i for i in rec if i not in cursor_flags]:
+				convert = getConverter(fld_name)
+				if convert is not None:
+					rec[fld_name] = convert(rec[fld_name])
+					converted = True
 			rec[kons.CURSOR_FIELD_TYPES_CORRECTED] = True
+			if converted:
+				# Pass the row when it's known, so that only it is marked.
+				self._markRecordsChanged(row)
+
+
+	def _correctRecordTypes(self, recs):
+		"""
+		Corrects the field types of all the passed records, which must not have
+		been corrected yet. This works a column at a time, so that each
+		field's converter is only looked up once.
+		"""
+		if not recs:
+			return
+		getConverter = self._getFieldConverter
+		converted = False
+		for fld_name in [i for i in recs[0] if i not in cursor_flags]:
+			convert = getConverter(fld_name)
+			if convert is None:
+				continue
+			for rec in recs:
+				rec[fld_name] = convert(rec[fld_name])
+			converted = True
+		flag = kons.CURSOR_FIELD_TYPES_CORRECTED
+		for rec in recs:
+			rec[flag] = True
+		if converted:
+			self._markRecordsChanged()
+
+
+	def _getFieldConverter(self, field_name):
+		"""
+		Returns the function that corrects the type of the values of the passed
+		field, or None if they don't need to be corrected.
+		"""
+		try:
+			return self._fieldConverters[field_name]
+		except KeyError:
+			convert = self._fieldConverters[field_name] = self._makeFieldConverter(field_name)
+			return convert
+
+
+	def _makeFieldConverter(self, field_name):
+		"""
+		Builds the type correction function for the passed field. Everything
+		that only depends on the field, such as its Python type and the scale of
+		Decimal values, is worked out here once, so that the returned function
+		only has to look at the value itself. Values that don't take the fast
+		path are handed to _correctFieldType().
+		"""
+		if field_name in self._nativeTypeFields:
+			return None
+		correct = self._correctFieldType
+		pythonType = self._types.get(field_name)
+		if not pythonType:
+			# The type depends on each value.
+			return lambda field_val: correct(field_val, field_name)
+		if pythonType is Decimal:
+			scale = self._getDecimalScale(field_name)
+			if scale is not None:
+				quantum = Decimal("0.%s" % (scale * "0",))
+				def convertDecimal(field_val):
+					if field_val is None or isinstance(field_val, Decimal):
+						return field_val
+					try:
+						if isinstance(field_val, float):
+							# Can't convert to decimal directly from float
+							return Decimal(ustr(field_val)).quantize(quantum)
+						return Decimal(field_val).quantize(quantum)
+					except StandardError:
+						# Let the general code log the problem.
+						return correct(field_val, field_name)
+				return convertDecimal
+		def convert(field_val):
+			if field_val is None or isinstance(field_val, pythonType):
+				return field_val
+			return correct(field_val, field_name)
+		return convert
+
+
+	def _getDecimalScale(self, field_name):
+		"""Returns the scale of the passed field from DataStructure, or None."""
+		for fld in self.DataStructure:
+			if fld[0] == field_name:
+				return fld[5]
+		return None
+
+
+	def _clearFieldConverters(self):
+		"""Discards the type converters, so they are rebuilt from the current types."""
+		self._fieldConverters = {}
 
 
 	def _correctFieldType(self, field_val, field_name):
@@ -233,7 +471,7 @@ class dCursorMixin(dObject):
 		if field_val is None:
 			return field_val
 
-		pythonType = self._types.get(field_name, dabo.db.getDataType(type(field_val)))
+		pythonType = self._types.get(field_name)
 		if not pythonType:
 			pythonType = dabo.db.getDataType(type(field_val))
 
@@ -258,17 +496,12 @@ class dCursorMixin(dObject):
 		elif pythonType in (datetime.date,) and isinstance(field_val, basestring):
 			return tryToCorrect(dates.getDateFromString, field_val, field_name)
 		elif pythonType in (Decimal,):
-			ds = self.DataStructure
 			_field_val = field_val
 			if type(field_val) in (float,):
 				# Can't convert to decimal directly from float
 				_field_val = ustr(_field_val)
 			# Need to convert to the correct scale:
-			try:
-				scale = [s[5] for s in ds
-						if s[0] == field_name][0]
-			except IndexError:
-				scale = None
+			scale = self._getDecimalScale(field_name)
 			if scale is None:
 				try:
 					scale = len(_field_val.split(".")[1])
@@ -327,10 +560,14 @@ class dCursorMixin(dObject):
 			sql = self._qMarkToParamPlaceholder(sql)
 		# Some backends, notably Firebird, require that fields be specially marked.
 		sql = self.processFields(sql)
+		# Any rows still pending from a previous chunked select are discarded.
+		self._fetchPending = False
+		doLog = not self.IsPrefCursor and logWillEmit(dabo.dbActivityLog, logging.INFO)
+		startTime = time.time()
 		try:
 			if params:
 				res = self.superCursor.execute(self, sql, params)
-				if not self.IsPrefCursor:
+				if doLog:
 					try:
 						dabo.dbActivityLog.info("execute() SQL: %s, PARAMS: %s" % (
 								sql.decode(self.Encoding).replace("\n", " "),
@@ -343,7 +580,7 @@ class dCursorMixin(dObject):
 							dabo.dbActivityLog.info("execute() (failed to log SQL and PARAMS)")
 			else:
 				res = self.superCursor.execute(self, sql)
-				if not self.IsPrefCursor:
+				if doLog:
 					try:
 						dabo.dbActivityLog.info("execute() SQL: %s" % (
 								sql.decode(self.Encoding).replace("\n", " "),))
@@ -359,17 +596,19 @@ class dCursorMixin(dObject):
 			# handle it appropriately.
 			if errorClass is not None and isinstance(e, errorClass):
 				raise e
-			if params:
-				try:
-					dabo.dbActivityLog.info("FAILED SQL: %s, PARAMS: %s" % (
-							sql.decode(self.Encoding).replace("\n", " "),
-							', '.join("%s" % p for p in params)))
-				except StandardError:
-					# A problem with writing to the log, most likely due to encoding issues
-					dabo.dbActivityLog.info("FAILED SQL: %r" % sql)
-			else:
-				dabo.dbActivityLog.info("FAILED SQL: %s" % (
-						sql.decode(self.Encoding).replace("\n", " "),))
+			doLog = logWillEmit(dabo.dbActivityLog, logging.INFO)
+			if doLog:
+				if params:
+					try:
+						dabo.dbActivityLog.info("FAILED SQL: %s, PARAMS: %s" % (
+								sql.decode(self.Encoding).replace("\n", " "),
+								', '.join("%s" % p for p in params)))
+					except StandardError:
+						# A problem with writing to the log, most likely due to encoding issues
+						dabo.dbActivityLog.info("FAILED SQL: %r" % sql)
+				else:
+					dabo.dbActivityLog.info("FAILED SQL: %s" % (
+							sql.decode(self.Encoding).replace("\n", " "),))
 			# Database errors need to be decoded from database encoding.
 			try:
 				errMsg = unicode(str(e), self.Encoding)
@@ -383,12 +622,16 @@ class dCursorMixin(dObject):
 			elif "access" in errMsg.lower():
 				raise dException.DBNoAccessException(errMsg)
 			else:
-				dabo.dbActivityLog.info(
-						_("DBQueryException encountered in execute(): %s\n%s") % (errMsg, sql))
+				if doLog:
+					dabo.dbActivityLog.info(
+							_("DBQueryException encountered in execute(): %s\n%s") % (errMsg, sql))
 				raise dException.DBQueryException(errMsg)
 
 		# Set the last execute time in case there is a Keep Alive Interval
 		self.BackendObject.lastExecuteTime = time.time()
+		if self._virtualFieldCache:
+			# The records are about to be replaced.
+			self._virtualFieldCache.clear()
 
 		# Some backend programs do odd things to the description
 		# This allows each backend to handle these quirks individually.
@@ -400,34 +643,201 @@ class dCursorMixin(dObject):
 		if sql.split(None, 1)[0].lower() not in ("select", "pragma"):
 			# No need to massage the data for DML commands
 			self._records = dDataSet(tuple())
+			if len(resultCache) and isWriteStatement(sql):
+				self._invalidateResultCache(sql)
+			if not self.IsPrefCursor and hasQueryObservers():
+				self._notifyQueryObservers(sql, params, time.time() - startTime,
+						getattr(self, "rowcount", -1))
 			return res
 
+		if self._fetchMode == "chunked":
+			self._fetchPending = True
+			_records = self._fetchRows(self._fetchSize)
+		else:
+			_records = self._fetchRows()
+		if self._correctTypesOnFetch:
+			self._correctRecordTypes(_records)
+
+		self._records = dDataSet(_records)
+		if not self.IsPrefCursor and hasQueryObservers():
+			self._notifyQueryObservers(sql, params, time.time() - startTime,
+					len(_records))
+		# This will handle bounds issues
+		self.RowNumber = self.RowNumber
+		return res
+
+
+	def executemany(self, sql, paramList):
+		"""
+		Execute the sql once for each set of parameters in 'paramList'. This is
+		meant for DML statements; the data set is not changed.
+		"""
+		if isinstance(sql, unicode):
+			sql = sql.encode(self.Encoding)
+		sql = self.processFields(sql)
+		paramList = list(paramList)
+		startTime = time.time()
 		try:
-			_records = self.fetchall()
+			res = self.superCursor.executemany(self, sql, paramList)
+			if not self.IsPrefCursor and logWillEmit(dabo.dbActivityLog, logging.INFO):
+				try:
+					dabo.dbActivityLog.info("executemany() SQL: %s, ROWS: %s" % (
+							sql.decode(self.Encoding).replace("\n", " "), len(paramList)))
+				except StandardError:
+					# A problem with writing to the log, most likely due to encoding issues
+					dabo.dbActivityLog.info("executemany() SQL: %r" % sql)
 		except Exception, e:
-			_records = dabo.db.dDataSet()
+			if logWillEmit(dabo.dbActivityLog, logging.INFO):
+				try:
+					dabo.dbActivityLog.info("FAILED SQL: %s, ROWS: %s" % (
+							sql.decode(self.Encoding).replace("\n", " "), len(paramList)))
+				except StandardError:
+					dabo.dbActivityLog.info("FAILED SQL: %r" % sql)
+			# Database errors need to be decoded from database encoding.
+			try:
+				errMsg = unicode(str(e), self.Encoding)
+			except UnicodeError:
+				errMsg = ustr(e)
+			if "connect" in errMsg.lower():
+				raise dException.ConnectionLostException(errMsg)
+			elif "access" in errMsg.lower():
+				raise dException.DBNoAccessException(errMsg)
+			else:
+				raise dException.DBQueryException(errMsg)
+		if not self.IsPrefCursor and hasQueryObservers():
+			self._notifyQueryObservers(sql, paramList, time.time() - startTime,
+					getattr(self, "rowcount", -1))
+		if len(resultCache) and isWriteStatement(sql):
+			self._invalidateResultCache(sql)
+		# Set the last execute time in case there is a Keep Alive Interval
+		self.BackendObject.lastExecuteTime = time.time()
+		return res
+
+
+	def _invalidateResultCache(self, sql):
+		"""
+		Discards the cached results that read from the tables changed by the
+		passed statement, or all of this connection's results if the tables
+		can't be determined.
+		"""
+		connKey = self.BackendObject.schemaCacheKey
+		tables = getTableNames(sql)
+		if tables:
+			resultCache.invalidateTables(connKey, tables)
+		else:
+			resultCache.invalidate(connKey)
+
+
+	def _notifyQueryObservers(self, sql, params, elapsed, rowCount, cached=False):
+		"""Passes the details of an executed statement to the query observers."""
+		biz = self._bizobj
+		if biz is not None:
+			name = biz.Name
+		else:
+			name = self.Table or self.Name
+		notifyQueryObservers(sql, params, elapsed, rowCount, name, cached=cached)
+
+
+	def _fetchRows(self, size=None):
+		"""
+		Fetches the rows of the last select from the backend, converting them to
+		dicts if necessary. All remaining rows are fetched unless 'size' is passed.
+		"""
+		try:
+			if size is None:
+				_records = self.fetchall()
+			else:
+				_records = self.fetchmany(size)
+		except Exception, e:
+			_records = []
 			# Database errors need to be decoded from database encoding.
 			try:
 				errMsg = ustr(e).decode(self.Encoding)
 			except UnicodeError:
 				errMsg = ustr(e)
 			dabo.log.error("Error fetching records: (%s, %s)" % (type(e), errMsg))
+		if size is None or len(_records) < size:
+			self._fetchPending = False
 
-		if _records and isinstance(_records[0], (tuple, list)):
+		if not _records:
+			pass
+		elif self._compactRecords:
+			_records = self._getRecordLayout(_records[0]).makeRecords(_records)
+		elif isinstance(_records[0], (tuple, list)):
 			# Need to convert each row to a Dict, since the backend didn't do it.
-			tmpRows = []
 			fldNames = [f[0] for f in self.FieldDescription]
-			for row in _records:
-				dic = {}
-				for idx, fldName in enumerate(fldNames):
-					dic[fldName] = row[idx]
-				tmpRows.append(dic)
-			_records = tmpRows
+			_records = [dict(zip(fldNames, row)) for row in _records]
+		return _records
 
-		self._records = dDataSet(_records)
-		# This will handle bounds issues
-		self.RowNumber = self.RowNumber
-		return res
+
+	def _getRecordLayout(self, row):
+		"""
+		Returns the dRecordLayout for rows like the passed one, re-using the
+		current layout as long as the field names are the same and in the same
+		order, as the values of sequence rows are stored by position.
+		"""
+		if isinstance(row, dict):
+			fldNames = row.keys()
+		else:
+			fldNames = [f[0] for f in self.FieldDescription]
+		layout = self._recordLayout
+		if layout is None or tuple(fldNames) != layout.names:
+			layout = self._recordLayout = dRecordLayout(fldNames)
+		return layout
+
+
+	def fetchMore(self, size=None):
+		"""
+		When FetchMode is 'chunked', fetches the next FetchSize rows of the last
+		select (or 'size' rows, if passed) and appends them to the data set.
+		Returns the number of rows added, which is 0 once all rows are fetched.
+		"""
+		if not self._fetchPending:
+			return 0
+		if size is None:
+			size = self._fetchSize
+		return self.__appendFetched(self._fetchRows(size))
+
+
+	def fetchRemaining(self):
+		"""
+		When FetchMode is 'chunked', fetches all the rows of the last select that
+		have not been fetched yet. Returns the number of rows added.
+		"""
+		if not self._fetchPending:
+			return 0
+		return self.__appendFetched(self._fetchRows())
+
+
+	def __appendFetched(self, recs):
+		if not recs:
+			return 0
+		if self._correctTypesOnFetch:
+			self._correctRecordTypes(recs)
+		oldRecords = self._records
+		self._records = oldRecords + tuple(recs)
+		self._appendToPkIndex(oldRecords, recs)
+		self._appendToSeekIndexes(oldRecords, recs)
+		return len(recs)
+
+
+	def iterRecords(self):
+		"""
+		Generator that yields each record of the data set in turn, as a dict.
+
+		When a chunked select still has rows pending, they are then fetched
+		FetchSize rows at a time and yielded without being added to the data
+		set, so that batch jobs can process a result of any size without ever
+		holding all of it in memory.
+		"""
+		_correctFieldTypesIfNeeded = self._correctFieldTypesIfNeeded
+		for rec in self._records:
+			_correctFieldTypesIfNeeded(rec)
+			yield rec
+		while self._fetchPending:
+			for rec in self._fetchRows(self._fetchSize):
+				_correctFieldTypesIfNeeded(rec)
+				yield rec
 
 
 	def executeSafe(self, sql, params=None):
@@ -489,16 +899,32 @@ class dCursorMixin(dObject):
 
 	def requery(self, params=None, convertQMarks=False):
 		currSQL = self.CurrentSQL
+		ttl = self._cacheTTL
+		if ttl:
+			cached = resultCache.get(self.BackendObject.schemaCacheKey, currSQL, params)
+			if cached is not None:
+				self.__storeQueryResult(currSQL, params, *cached)
+				if not self.IsPrefCursor and hasQueryObservers(cached=True):
+					self._notifyQueryObservers(currSQL, params, 0.0, self.RowCount,
+							cached=True)
+				return True
 		newQuery = (self._lastSQL != currSQL)
 		self._lastSQL = currSQL
 		self.lastParams = params
 		self._savedStructureDescription = []
 
 		self.execute(currSQL, params, convertQMarks=convertQMarks)
+		if ttl and not self._fetchPending:
+			# Results still being fetched in chunks are incomplete, so they can't
+			# be cached.
+			resultCache.set(self.BackendObject.schemaCacheKey, currSQL, params,
+					self._records, self._types, self.DataStructure, ttl, tables=[self.Table])
 
 		# clear mementos and new record flags:
-		self._mementos = {}
-		self._newRecords = {}
+		self._mementos.clear()
+		self._newRecords.clear()
+		self._deltaConflicts = {}
+		self._deltaWatermark = self.__getDeltaWatermark(self._records)
 		# Record the requery time for caching purposes
 		self.lastRequeryTime = time.time()
 
@@ -508,7 +934,8 @@ class dCursorMixin(dObject):
 			self.__setNonUpdateFields()
 
 		# Clear the unsorted list, and then apply the current sort
-		self.__unsortedRows = []
+		self.__unsortedPositions = None
+		self.__unsortedRecords = None
 		if self.sortColumn:
 			try:
 				self.sort(self.sortColumn, self.sortOrder)
@@ -518,6 +945,506 @@ class dCursorMixin(dObject):
 		return True
 
 
+	def requeryAsync(self, params=None, callback=None):
+		"""
+		Starts a requery that runs on a worker thread with its own connection
+		to the database, so the calling thread isn't blocked while the rows are
+		fetched. Returns a dRequeryFuture.
+
+		The fetched rows replace the data in the cursor on the calling thread:
+		in the UI event loop if a UI is loaded, otherwise when the future's
+		result() method is called. As with requery(), any unsaved changes are
+		discarded at that point. If passed, 'callback' is then called with the
+		future as its argument.
+
+		Only the latest requery counts: starting another one cancels the one
+		still running, and its rows are discarded. The connection must be one
+		that can be opened more than once, which excludes in-memory SQLite
+		databases.
+		"""
+		connectInfo = self.BackendObject.connectInfo
+		if connectInfo is None:
+			raise dException.dException(
+					_("requeryAsync() needs a connection made from a dConnectInfo"))
+		prior = self._asyncRequery
+		if prior is not None:
+			prior.cancel()
+		sql = self.CurrentSQL
+		if params is not None:
+			params = tuple(params)
+		future = self._asyncRequery = dRequeryFuture(
+				functools.partial(self.__finishRequeryAsync, sql=sql, params=params))
+		if callback is not None:
+			future.addDoneCallback(callback)
+		cursorProps = {"Table": self.Table, "AutoQuoteNames": self.AutoQuoteNames,
+				"CompactRecords": self.CompactRecords,
+				"CorrectTypesOnFetch": self.CorrectTypesOnFetch,
+				"NativeTypeFields": self.NativeTypeFields}
+		startRequery(future, connectInfo, sql, params, cursorProps)
+		return future
+
+
+	def __finishRequeryAsync(self, future, data, typs, stru, sql=None, params=None):
+		"""
+		Stores the rows fetched by requeryAsync() in the cursor, unless another
+		requery has been started since. Returns the number of rows.
+		"""
+		if future is not self._asyncRequery:
+			raise dException.dException(_("The requery was superseded by a newer one"))
+		self._asyncRequery = None
+		try:
+			future._priorPK = self.getPK()
+		except dException.dException:
+			future._priorPK = None
+		self.__storeQueryResult(sql, params, data, typs, stru)
+		return self.RowCount
+
+
+	def __storeQueryResult(self, sql, params, data, typs, stru):
+		"""
+		Replaces the data in the cursor with rows for the passed query that
+		were fetched elsewhere, as requery() would have left it.
+		"""
+		newQuery = (self._lastSQL != sql)
+		self._lastSQL = sql
+		self.lastParams = params
+		self._savedStructureDescription = []
+		if getattr(self, "_dataStructure", None) is None and stru:
+			self.DataStructure = stru
+		self._storeData(dDataSet(data), typs)
+		# This will handle bounds issues
+		self.RowNumber = self.RowNumber
+		if newQuery:
+			self.__setNonUpdateFields()
+
+
+	def requeryPage(self, size, after=None, params=None, append=False):
+		"""
+		Runs the query for a single page of at most 'size' rows, using keyset
+		paging instead of an offset: the rows are ordered by the current sort
+		columns followed by the KeyField, and each page starts after the last
+		row of the previous one. Call nextPage() and priorPage() to move to the
+		following and preceding pages.
+
+		'after' is the tuple of values of those columns after which the page
+		starts; by default the first page is fetched. The page replaces the rows
+		in the cursor. If 'append' is True, the pages fetched by nextPage() and
+		priorPage() are then added to the rows already there; otherwise each
+		page replaces them. Either way, rows with unsaved changes are kept along
+		with their mementos, so they can still be saved or canceled.
+
+		The SQL must come from the SQL builder methods; paging can't be applied
+		to UserSQL. The sort columns must not contain NULL values, since these
+		can't be compared with the key values. Returns the number of rows in
+		the page.
+		"""
+		if self.UserSQL:
+			raise dException.dException(
+					_("Paging requires the SQL to be created with the SQL builder methods, not UserSQL"))
+		if not self._hasValidKeyField():
+			raise dException.MissingPKException(_("Paging requires a KeyField"))
+		self._pageSize = size
+		self._pageColumns = self.__getPageColumns()
+		self._pageParams = tuple(params or ())
+		self._pageAppend = append
+		self._pageFirstKey = self._pageLastKey = None
+		if after is not None and not isinstance(after, (list, tuple)):
+			after = (after,)
+		ret = self.__requeryPage(after, reverse=False, append=False)
+		self.__setNonUpdateFields()
+		return ret
+
+
+	def nextPage(self):
+		"""
+		Fetches the page that follows the last one fetched by requeryPage(),
+		nextPage() or priorPage(). Returns the number of rows fetched, which is
+		0 when there are no more rows; in that case the data set is unchanged.
+		"""
+		self.__checkPaging()
+		if self._pageLastKey is None:
+			return 0
+		return self.__requeryPage(self._pageLastKey, reverse=False,
+				append=self._pageAppend)
+
+
+	def priorPage(self):
+		"""
+		Fetches the page before the first row fetched so far. When pages are
+		appended, its rows are inserted before the current ones. Returns the
+		number of rows fetched.
+		"""
+		self.__checkPaging()
+		if self._pageFirstKey is None:
+			return 0
+		return self.__requeryPage(self._pageFirstKey, reverse=True,
+				append=self._pageAppend)
+
+
+	def __checkPaging(self):
+		if self._pageColumns is None:
+			raise dException.dException(_("requeryPage() must be called first"))
+
+
+	def __getPageColumns(self):
+		"""
+		Returns a tuple of (field name, descending) pairs for the current sort
+		columns plus the key fields, which make the order of the rows unique.
+		"""
+		cols = self.sortColumn
+		ords = self.sortOrder
+		if not cols:
+			cols, ords = (), ()
+		elif not isinstance(cols, tuple):
+			cols, ords = (cols,), (ords,)
+		ret = [(col, (ordr or "").upper() == "DESC") for col, ordr in zip(cols, ords)]
+		for col in cols:
+			if col in self.VirtualFields:
+				raise dException.dException(
+						_("Can't page on the virtual field '%s'") % col)
+		kf = self.KeyField
+		if not isinstance(kf, tuple):
+			kf = (kf,)
+		ret.extend((fld, False) for fld in kf if fld not in cols)
+		return tuple(ret)
+
+
+	def __getPageColumnExpr(self, col):
+		"""Returns the expression for the passed result column to use in WHERE and ORDER BY."""
+		fldName = col
+		for fld in self.DataStructure:
+			if fld[0] == col:
+				if fld[3] == self.Table and fld[4]:
+					fldName = "%s.%s" % (self._getTableAlias(), fld[4])
+				break
+		return self.BackendObject.encloseNames(fldName, autoQuote=self.AutoQuoteNames)
+
+
+	def __requeryPage(self, after, reverse, append):
+		"""
+		Runs the query for the page that starts after the key values in 'after'
+		(or before them, if 'reverse' is True), and adds its rows to the data
+		set if 'append' is True, or replaces the data set with them.
+		"""
+		sqlManager = self.sqlManager
+		placeholder = self.ParamPlaceholder
+		exprs = [self.__getPageColumnExpr(col) for col, desc in self._pageColumns]
+		orderBy = []
+		for expr, (col, desc) in zip(exprs, self._pageColumns):
+			orderBy.append("%s %s" % (expr, ("DESC" if desc != reverse else "ASC")))
+		params = self._pageParams
+		whereClause = holdWhere = sqlManager._whereClause
+		if after is not None:
+			# (a > x) or (a = x and b > y) or ...
+			terms = []
+			for pos, (col, desc) in enumerate(self._pageColumns):
+				op = "<" if desc != reverse else ">"
+				conds = ["%s = %s" % (expr, placeholder) for expr in exprs[:pos]]
+				conds.append("%s %s %s" % (exprs[pos], op, placeholder))
+				terms.append("(%s)" % " and ".join(conds))
+				params += tuple(after[:pos + 1])
+			pred = "(%s)" % " or ".join(terms)
+			if whereClause:
+				whereClause = "(%s) and %s" % (whereClause, pred)
+			else:
+				whereClause = pred
+		holdOrderBy = sqlManager._orderByClause
+		holdLimit = sqlManager._limitClause
+		try:
+			sqlManager._whereClause = whereClause
+			sqlManager._orderByClause = ", ".join(orderBy)
+			sqlManager._limitClause = self._pageSize
+			sql = self.getSQL()
+		finally:
+			sqlManager._whereClause = holdWhere
+			sqlManager._orderByClause = holdOrderBy
+			sqlManager._limitClause = holdLimit
+
+		oldRecords = self._records
+		oldRow = self.RowNumber
+		self.execute(sql, params)
+		self.fetchRemaining()
+		page = list(self._records)
+		if not page:
+			self._records = oldRecords
+			self.RowNumber = oldRow
+			return 0
+		if reverse:
+			page.reverse()
+		cols = [col for col, desc in self._pageColumns]
+		firstKey = tuple(page[0][col] for col in cols)
+		lastKey = tuple(page[-1][col] for col in cols)
+		if not append:
+			self._pageFirstKey, self._pageLastKey = firstKey, lastKey
+		elif reverse:
+			self._pageFirstKey = firstKey
+		else:
+			self._pageLastKey = lastKey
+
+		# Keep the rows with unsaved changes, in place of their fetched copies.
+		pkOf = self._pkIndexKey
+		changed = set(self._mementos)
+		changed.update(self._newRecords)
+		if append:
+			kept = list(oldRecords)
+		else:
+			kept = [rec for rec in oldRecords if pkOf(rec) in changed]
+		keptByPk = dict((pkOf(rec), rec) for rec in kept)
+		if append:
+			page = [rec for rec in page if pkOf(rec) not in keptByPk]
+		else:
+			page = [keptByPk.pop(pkOf(rec), rec) for rec in page]
+			kept = [rec for rec in kept if pkOf(rec) in keptByPk]
+		if append and not reverse:
+			self._records = dDataSet(kept + page)
+		else:
+			self._records = dDataSet(page + kept)
+		self.__unsortedPositions = None
+		self.__unsortedRecords = None
+		self.lastRequeryTime = time.time()
+		if not append:
+			self.RowNumber = 0
+		elif reverse:
+			self.RowNumber = max(oldRow, 0) + len(page)
+		else:
+			self.RowNumber = max(oldRow, 0)
+		return len(page)
+
+
+	def requeryDelta(self, params=None, detectDeletes=False):
+		"""
+		Refreshes the data set with only the rows that changed in the database
+		since the last requery, instead of fetching all of them again.
+
+		The changed rows are those whose LastModifiedField is at least the
+		highest value fetched so far; alternatively, DeltaSQL can be set to a
+		query that returns them. Changed rows are updated in place, and rows
+		that are new to the data set are added, so the current sort order and
+		record pointer are kept. If 'detectDeletes' is True, the keys of all
+		the rows in the query are fetched as well, and the rows that are no
+		longer there are removed.
+
+		Rows with unsaved changes are never overwritten or removed; their
+		values in the database are recorded instead, and can be retrieved with
+		getDeltaConflicts(). If there is no previous requery to start from, or
+		the SQL has changed since, a full requery() is done instead. Returns the
+		number of rows that were updated, added or removed; rows fetched again
+		with the same values, such as those at the watermark, aren't counted.
+		"""
+		if params is None:
+			params = self.lastParams
+		if (not self.LastModifiedField and not self.DeltaSQL):
+			raise dException.dException(
+					_("Delta requeries need a LastModifiedField or DeltaSQL"))
+		if not self._hasValidKeyField():
+			raise dException.MissingPKException(_("Delta requeries require a KeyField"))
+		since = self._deltaWatermark
+		if since is None and not self.LastModifiedField and self.lastRequeryTime:
+			since = datetime.datetime.fromtimestamp(self.lastRequeryTime)
+		if (since is None) or (self._lastSQL != self.CurrentSQL):
+			self.requery(params)
+			return self.RowCount
+		params = tuple(params or ())
+		requeryTime = time.time()
+		sql = self.DeltaSQL or self.__getDeltaQuery()
+		oldRecords = self._records
+		oldRow = self.RowNumber
+		try:
+			currPK = self.getPK()
+		except dException.NoRecordsException:
+			currPK = None
+		self.execute(sql, params + (since,))
+		self.fetchRemaining()
+		delta = self._records
+		self._records = oldRecords
+		liveKeys = None
+		if detectDeletes:
+			liveKeys = self.__getLiveKeys(params)
+		self.lastRequeryTime = requeryTime
+		watermark = self.__getDeltaWatermark(delta)
+		if watermark is not None and (self._deltaWatermark is None
+				or watermark > self._deltaWatermark):
+			self._deltaWatermark = watermark
+		return self.__mergeDelta(delta, liveKeys, oldRow, currPK)
+
+
+	def getDeltaConflicts(self):
+		"""
+		Returns a dict of the rows that requeryDelta() found changed in the
+		database while they had unsaved local changes. The keys are the PK
+		values, and the values are the rows as they are in the database, or
+		None for rows that were deleted there. Once the local changes are saved
+		or canceled, the next requeryDelta() applies these values and removes
+		the entries; a full requery removes them as well.
+		"""
+		return dict(self._deltaConflicts)
+
+
+	def __getDeltaValue(self, rec):
+		"""Returns the LastModifiedField value of the record, with the correct type."""
+		fld = self.LastModifiedField
+		if rec.get(kons.CURSOR_FIELD_TYPES_CORRECTED, False):
+			return rec[fld]
+		return self._correctFieldType(rec[fld], fld)
+
+
+	def __getDeltaWatermark(self, recs):
+		"""Returns the highest LastModifiedField value in the passed records."""
+		if not self.LastModifiedField or not recs:
+			return None
+		vals = [val for val in map(self.__getDeltaValue, recs) if val is not None]
+		if not vals:
+			return None
+		return max(vals)
+
+
+	def __getDeltaQuery(self):
+		"""
+		Returns the current SQL restricted to the rows whose LastModifiedField
+		is not older than the value passed as its last parameter.
+		"""
+		fld = self.LastModifiedField
+		placeholder = self.ParamPlaceholder
+		if self.UserSQL:
+			fld = self.BackendObject.encloseNames(fld, autoQuote=self.AutoQuoteNames)
+			return "select * from (%s) dabo_delta where %s >= %s" % (self.UserSQL,
+					fld, placeholder)
+		sqlManager = self.sqlManager
+		pred = "%s >= %s" % (self.__getPageColumnExpr(fld), placeholder)
+		holdWhere = sqlManager._whereClause
+		holdLimit = sqlManager._limitClause
+		try:
+			if holdWhere:
+				sqlManager._whereClause = "(%s) and %s" % (holdWhere, pred)
+			else:
+				sqlManager._whereClause = pred
+			# The changed rows may be anywhere in the data set.
+			sqlManager._limitClause = None
+			return self.getSQL()
+		finally:
+			sqlManager._whereClause = holdWhere
+			sqlManager._limitClause = holdLimit
+
+
+	def __getLiveKeys(self, params):
+		"""Returns the set of the PK values of all the rows the current SQL returns."""
+		kf = self.KeyField
+		if not isinstance(kf, tuple):
+			kf = (kf,)
+		if self.UserSQL:
+			flds = self.BackendObject.encloseNames(", ".join(kf),
+					autoQuote=self.AutoQuoteNames)
+			sql = "select %s from (%s) dabo_delta" % (flds, self.UserSQL)
+		else:
+			sqlManager = self.sqlManager
+			holdFields = sqlManager._fieldClause
+			try:
+				sqlManager._fieldClause = ", ".join([self.__getPageColumnExpr(fld)
+						for fld in kf])
+				sql = self.getSQL()
+			finally:
+				sqlManager._fieldClause = holdFields
+		aux = self.AuxCursor
+		aux.execute(sql, params)
+		return set(self._pkIndexKey(rec) for rec in aux.getDataSet())
+
+
+	def __mergeDelta(self, delta, liveKeys, oldRow, currPK):
+		"""
+		Merges the changed rows into the data set, removes the rows whose keys
+		aren't in 'liveKeys' (unless it is None), and moves the record pointer
+		back to the record it was on. Returns the number of rows affected.
+		"""
+		pkOf = self._pkIndexKey
+		records = self._records
+		positions = dict((pkOf(rec), pos) for pos, rec in enumerate(records))
+		edited = set(self._mementos)
+		edited.update(self._newRecords)
+		# Conflicting rows whose local changes have since been saved or canceled
+		# get the values that were found in the database.
+		resolved = [(pk, rec) for pk, rec in self._deltaConflicts.items()
+				if pk not in edited]
+		delta = [rec for pk, rec in resolved if rec is not None] + list(delta)
+		if liveKeys is None and [pk for pk, rec in resolved if rec is None]:
+			liveKeys = set(positions)
+		for pk, rec in resolved:
+			del self._deltaConflicts[pk]
+			if rec is None:
+				liveKeys.discard(pk)
+		added = []
+		count = 0
+		for newRec in delta:
+			pk = pkOf(newRec)
+			if pk in edited:
+				self._deltaConflicts[pk] = newRec
+				continue
+			self._deltaConflicts.pop(pk, None)
+			pos = positions.get(pk)
+			if pos is None:
+				added.append(newRec)
+			else:
+				rec = records[pos]
+				if self.__sameValues(rec, newRec):
+					# Fetched again because it changed at the watermark, but it
+					# hasn't changed since.
+					continue
+				rec.clear()
+				rec.update(newRec)
+			count += 1
+		removed = 0
+		if liveKeys is not None:
+			for pk in positions:
+				if pk in liveKeys:
+					continue
+				if pk in edited:
+					if pk not in self._newRecords:
+						# Deleted in the database while being edited.
+						self._deltaConflicts[pk] = None
+				else:
+					removed += 1
+		if added or removed:
+			if removed:
+				records = [rec for rec in records
+						if pkOf(rec) in liveKeys or pkOf(rec) in edited]
+			self._records = dDataSet(list(records) + added)
+			count += removed
+		if count:
+			# The values of the updated rows have changed in place.
+			self._invalidateSeekIndexes()
+			self._clearVirtualFieldCache()
+			self._markRecordsChanged()
+			if added and self.sortColumn:
+				try:
+					self.sort(self.sortColumn, self.sortOrder)
+				except dException.NoRecordsException:
+					pass
+		row = None
+		if currPK is not None:
+			row = self._getRecordByPk(currPK, raiseRowNotFound=False)[0]
+		if row is None:
+			row = oldRow
+		self.RowNumber = row
+		return count
+
+
+	def __sameValues(self, rec, newRec):
+		"""
+		Returns True if the record holds the values of the fetched record
+		'newRec', allowing for the field types of the record having been
+		corrected.
+		"""
+		corrected = rec.get(kons.CURSOR_FIELD_TYPES_CORRECTED, False)
+		for fld in newRec:
+			val = newRec[fld]
+			oldVal = rec.get(fld)
+			if oldVal == val:
+				continue
+			convert = self._getFieldConverter(fld) if corrected else None
+			if convert is None or oldVal != convert(val):
+				return False
+		return True
+
+
 	def _storeFieldTypes(self, target=None):
 		"""Stores the data type for each column in the result set."""
 		try:
@@ -531,6 +1458,9 @@ class dCursorMixin(dObject):
 		for field in self.DataStructure:
 			field_alias, field_type = field[0], field[1]
 			target._types[field_alias] = dabo.db.getPythonType(field_type)
+		target._clearFieldConverters()
+		for field_alias in target._types:
+			target._getFieldConverter(field_alias)
 
 
 	def sort(self, col, ordr=None, caseSensitive=True):
@@ -547,7 +1477,21 @@ class dCursorMixin(dObject):
 			CYCLE
 
 		Only the first three characters are significant; case is ignored.
+
+		To sort on more than one column, pass a list or tuple of column names for
+		'col', and either a matching sequence of directions or a single direction
+		for 'ordr'. Each direction must then be ASC, DESC or ""; passing "" for
+		every column restores the unsorted order. For example:
+
+			cursor.sort(["cust", "date"], ["ASC", "DESC"])
 		"""
+		if isinstance(col, (list, tuple)):
+			if len(col) == 1:
+				col = col[0]
+				if isinstance(ordr, (list, tuple)):
+					ordr = ordr[0]
+			else:
+				return self.__sortMultiple(col, ordr, caseSensitive)
 		currCol = self.sortColumn
 		currOrd = self.sortOrder
 		if not ordr:
@@ -557,9 +1501,7 @@ class dCursorMixin(dObject):
 			col = currCol
 
 		# Make sure that the specified column is a column in the result set
-		if not [True for t in self.DataStructure if t[0] == col]  and col not in self.VirtualFields:
-			raise dException.dException(
-					_("Invalid column specified for sort: ") + col)
+		self.__checkSortColumn(col)
 
 		newCol = col
 		if col == currCol:
@@ -592,89 +1534,220 @@ class dCursorMixin(dObject):
 					raise dException.dException(
 							_("Invalid Sort direction specified: ") + ordr)
 
-		self.__sortRows(newCol, newOrd, caseSensitive)
+		self.__sortRows((newCol,), (newOrd,), caseSensitive)
 		# Save the current sort values
 		self.sortColumn = newCol
 		self.sortOrder = newOrd
 		self.sortCase = caseSensitive
 
 
-	def __sortRows(self, col, ordr, caseSensitive):
+	def __sortMultiple(self, cols, ordr, caseSensitive):
+		"""Handles sort() calls that specify more than one column."""
+		cols = tuple(cols)
+		if isinstance(ordr, (list, tuple)):
+			if len(ordr) != len(cols):
+				raise dException.dException(
+						_("The number of sort directions does not match the number of sort columns"))
+			ordrs = ordr
+		else:
+			ordrs = (ordr,) * len(cols)
+		newOrds = []
+		for ordr in ordrs:
+			if ordr is None:
+				ordr = "ASC"
+			if ordr.upper() not in ("ASC", "DESC", ""):
+				raise dException.dException(
+						_("Invalid Sort direction specified: ") + ordr)
+			newOrds.append(ordr.upper())
+		for col in cols:
+			self.__checkSortColumn(col)
+		if [ordr for ordr in newOrds if ordr]:
+			# An empty direction only means 'unsorted' when given for every column.
+			newOrds = [ordr or "ASC" for ordr in newOrds]
+		newOrds = tuple(newOrds)
+
+		self.__sortRows(cols, newOrds, caseSensitive)
+		# Save the current sort values
+		self.sortColumn = cols
+		self.sortOrder = newOrds
+		self.sortCase = caseSensitive
+
+
+	def __checkSortColumn(self, col):
+		"""Raises an error if 'col' is neither a result set column nor a VirtualField."""
+		if not [True for t in self.DataStructure if t[0] == col]  and col not in self.VirtualFields:
+			raise dException.dException(
+					_("Invalid column specified for sort: ") + ustr(col))
+
+
+	def __sortRows(self, cols, ordrs, caseSensitive):
 		"""
 		Sort the rows of the cursor.
 
-		At this point, we know we have a valid column and order. We need to
+		At this point, we know we have valid columns and orders. We need to
 		preserve the unsorted order if we haven't done that yet; then we sort
-		the data according to the request.
+		the data according to the request. Rather than sorting the records
+		themselves, we sort a list of row positions on pre-computed key lists,
+		one stable pass per column starting with the least significant one.
 		"""
-		kf = self.KeyField
-		if not kf or not self.RowCount:
+		self.fetchRemaining()
+		records = self._records
+		rowCount = len(records)
+		if not rowCount:
 			return
 
-		if not self.__unsortedRows:
-			# Record the PK values
-			for row in self._records:
-				if self._compoundKey:
-					key = tuple([row[k] for k in kf])
-					self.__unsortedRows.append(key)
+		if self.__unsortedPositions is None:
+			# Record the original position of each record object. The records are
+			# kept alive along with the map, so their ids can't be reused.
+			self.__unsortedRecords = records
+			self.__unsortedPositions = dict((id(rec), pos)
+					for pos, rec in enumerate(records))
+
+		order = range(rowCount)
+		if not [ordr for ordr in ordrs if ordr]:
+			# Restore the rows to their unsorted order. Records added since the
+			# original order was recorded go to the end.
+			positions = self.__unsortedPositions
+			last = len(positions)
+			keys = [positions.get(id(rec), last) for rec in records]
+			order.sort(key=keys.__getitem__)
+		else:
+			for col, ordr in reversed(zip(cols, ordrs)):
+				vals = self._getColumnValues(col)
+				if self.__isStringColumn(col, vals) and not caseSensitive:
+					keys = [(val or "").lower() for val in vals]
 				else:
-					self.__unsortedRows.append(row[kf])
-
-		# First, preserve the PK of the current row so that we can reset
-		# the RowNumber property to point to the same row in the new order.
-		try:
-			if self._compoundKey:
-				currRow = self._records[self.RowNumber]
-				currRowKey = tuple([currRow[k] for k in kf])
-			else:
-				currRowKey = self._records[self.RowNumber][kf]
-		except IndexError:
+					# Same ordering as noneSortKey(): None sorts before everything.
+					keys = [(val is not None, val) for val in vals]
+				order.sort(key=keys.__getitem__, reverse=(ordr == "DESC"))
+
+		self._records = dDataSet([records[pos] for pos in order])
+		# The new position of each row, by its old position.
+		newRows = [0] * len(order)
+		for newRow, oldRow in enumerate(order):
+			newRows[oldRow] = newRow
+		self.__remapPkIndex(records, newRows)
+		self.__remapSeekIndexes(records, newRows)
+
+		# Restore the RowNumber to point to the same record in the new order.
+		currRow = self.RowNumber
+		if 0 <= currRow < rowCount:
+			self.RowNumber = newRows[currRow]
+		else:
 			# Row no longer exists, such as after a Requery that returns
 			# fewer rows.
-			currRowKey = None
-		# Create the list to hold the rows for sorting
-		sortList = []
-		if not ordr:
-			# Restore the rows to their unsorted order
-			for row in self._records:
-				if self._compoundKey:
-					key = tuple([row[k] for k in kf])
-					sortList.append([self.__unsortedRows.index(key), row])
-				else:
-					sortList.append([self.__unsortedRows.index(row[kf]), row])
-		else:
-			for row, rec in enumerate(self._records):
-				sortList.append([self.getFieldVal(col, row), rec])
-		# At this point we have a list consisting of lists. Each of these member
-		# lists contain the sort value in the zeroth element, and the row as
-		# the first element.
-		# First, see if we are comparing strings
-		compString = isinstance(sortList[0][0], basestring)
-
-		if compString and not caseSensitive:
-			sortKey = caseInsensitiveSortKey
-		else:
-			sortKey = noneSortKey
-		sortList.sort(key=sortKey, reverse=(ordr == "DESC"))
+			self.RowNumber = 0
 
-		# Extract the rows into a new list, then convert them back to the _records tuple
-		newRows = [elem[1] for elem in sortList]
-		self._records = dDataSet(newRows)
 
-		# restore the RowNumber
-		if currRowKey:
-			for ii in xrange(0, self.RowCount):
-				row = self._records[ii]
-				if self._compoundKey:
-					key = tuple([row[k] for k in kf])
-					found = (key == currRowKey)
-				else:
-					found = row[kf] == currRowKey
-				if found:
-					self.RowNumber = ii
-					break
+	def __isStringColumn(self, col, vals):
+		"""Returns True if the values of the column are strings."""
+		typ = self._types.get(col)
+		if typ is not None:
+			return issubclass(typ, basestring)
+		for val in vals:
+			if val is not None:
+				return isinstance(val, basestring)
+		return False
+
+
+	def __remapPkIndex(self, oldRecords, newRows):
+		"""
+		Carries a current PK index over to the re-ordered records, so that a sort
+		doesn't force the index to be rebuilt. 'newRows' holds the new position
+		of each row, by its old position.
+		"""
+		if self._pkIndex is None or self._pkIndexRecords is not oldRecords:
+			self._invalidatePkIndex()
+			return
+		self._pkIndex = dict((key, newRows[row])
+				for key, row in self._pkIndex.iteritems())
+		self._pkIndexRecords = self._records
+
+
+	def __remapSeekIndexes(self, oldRecords, newRows):
+		"""Carries the seek indexes over to the re-ordered records."""
+		if self._seekIndexRecords is not oldRecords:
+			self._invalidateSeekIndexes()
+			return
+		for key, entries in self._seekIndexes.items():
+			# Only rows with equal values change their relative order, so this
+			# sort has very little to do.
+			self._seekIndexes[key] = sorted((val, newRows[row]) for val, row in entries)
+		self._seekIndexRecords = self._records
+
+
+	def _getColumnValues(self, fld, rows=None):
+		"""
+		Returns a list of the values of 'fld' for the passed row numbers, or for
+		every row in row order.
+		"""
+		records = self._records
+		if records and fld not in records[0] and fld in self.VirtualFields:
+			return self._getVirtualColumn(fld, rows)
+		if rows is not None:
+			records = [records[row] for row in rows]
+		flag = kons.CURSOR_FIELD_TYPES_CORRECTED
+		self._correctRecordTypes([rec for rec in records if not rec.get(flag, False)])
+		return [rec[fld] for rec in records]
+
+
+	def _getVirtualColumn(self, fld, rows=None):
+		"""
+		Returns the values of the virtual field 'fld' for the passed row numbers,
+		or for every row. The values of a 'batch' field that aren't cached yet
+		are computed with a single call to its function; other virtual fields
+		are computed row by row.
+		"""
+		records = self._records
+		if rows is None:
+			rows = xrange(len(records))
+		vf = self.VirtualFields[fld]
+		if not (isinstance(vf, dict) and vf.get("batch", False)):
+			return [self.getFieldVal(fld, row) for row in rows]
+		recs = [records[row] for row in rows]
+		ret = [None] * len(recs)
+		missing = []
+		cache = self._virtualFieldCache.get(fld, {})
+		for idx, rec in enumerate(recs):
+			try:
+				cachedRec, val = cache[id(rec)]
+			except KeyError:
+				cachedRec = None
+			if cachedRec is rec:
+				ret[idx] = val
+			else:
+				missing.append(idx)
+		if missing:
+			vals = self.__computeBatchField(fld, vf, [recs[idx] for idx in missing])
+			for idx, val in zip(missing, vals):
+				ret[idx] = val
+		return ret
+
+
+	def __computeBatchField(self, fld, vf, recs):
+		"""
+		Calls the function of the batch virtual field 'fld' for the passed
+		records, caches the values it returns and returns them as a list.
+		"""
+		flag = kons.CURSOR_FIELD_TYPES_CORRECTED
+		self._correctRecordTypes([rec for rec in recs if not rec.get(flag, False)])
+		# 'depends_on' can also name the DataSource of a child bizobj, which
+		# isn't a field of the records.
+		deps = [dep for dep in vf.get("depends_on") or () if dep in recs[0]]
+		if deps:
+			args = [[rec[dep] for rec in recs] for dep in deps]
 		else:
-			self.RowNumber = 0
+			args = [dDataSet(recs)]
+		vals = list(vf["func"](*args))
+		if len(vals) != len(recs):
+			cnt, valCnt = len(recs), len(vals)
+			raise dException.dException(
+					_("The virtual field '%(fld)s' returned %(valCnt)s values for %(cnt)s rows")
+					% locals())
+		cache = self._virtualFieldCache.setdefault(fld, {})
+		for rec, val in zip(recs, vals):
+			cache[id(rec)] = (rec, val)
+		return vals
 
 
 	@staticmethod
@@ -841,12 +1914,20 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		# are assigned to the same child, we need to use sqlManager
 		# for temporary key creation.
 		tmpPK = self.sqlManager._genTempPKVal(pkVal)
+		try:
+			oldKey = self._pkIndexKey(rec)
+		except KeyError:
+			oldKey = None
 		if isinstance(kf, tuple):
 			for key in kf:
 				rec[key] = tmpPK
 		else:
 			rec[kf] = tmpPK
 		rec[kons.CURSOR_TMPKEY_FIELD] = tmpPK
+		self._updatePkIndex(self.RowNumber, oldKey, self._pkIndexKey(rec))
+		self._invalidateSeekIndexes(kf)
+		self._clearVirtualFieldCache(kf, rec)
+		self._markRecordsChanged(self.RowNumber)
 		return tmpPK
 
 
@@ -906,7 +1987,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			cnt = len(_records)
 			raise dException.RowNotFoundException(
 					_("Row #%(row)s requested, but the data set has only %(cnt)s row(s),") % locals())
-		self._correctFieldTypesIfNeeded(rec)
+		self._correctFieldTypesIfNeeded(rec, row if row >= 0 else None)
 		if isinstance(fld, (tuple, list)):
 			return map(functools.partial(self.getFieldVal, row=row), fld)
 		if fld in rec:
@@ -915,6 +1996,19 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			vf = self.VirtualFields[fld]
 			if not isinstance(vf, dict):
 				vf = {"func": vf}
+			batch = vf.get("batch", False)
+			cache = batch or vf.get("cache", False)
+			if cache:
+				try:
+					cachedRec, ret = self._virtualFieldCache[fld][id(rec)]
+					if cachedRec is rec:
+						return ret
+				except KeyError:
+					pass
+			if batch:
+				# Computing the whole column costs about as much as a single row.
+				self._getVirtualColumn(fld)
+				return self._virtualFieldCache[fld][id(rec)][1]
 
 			requery_children = (vf.get("requery_children", False) and bool(_rowChangeCallback))
 
@@ -927,13 +2021,16 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				self.RowNumber = row
 				ret = vf["func"]()
 				self.RowNumber = _oldrow
-				return ret
 			else:
 				# The VirtualFields definition's 'requery_children' key is True, so
 				# we need to request a row change and requery of any child bizobjs
 				# as necessary, before executing the virtual field function.
 				_rowChangeCallback(row)
-				return vf["func"]()
+				ret = vf["func"]()
+			if cache:
+				# The record is kept with the value, so that its id can't be reused.
+				self._virtualFieldCache.setdefault(fld, {})[id(rec)] = (rec, ret)
+			return ret
 		else:
 			raise dException.FieldNotFoundException("%s '%s' %s" % (
 					_("Field"), fld, _("does not exist in the data set")))
@@ -1070,8 +2167,10 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if old_val == val:
 			return False
 		else:
+			keyChanged = False
 			if valid_pk:
 				if (fld == keyField) or (self._compoundKey and fld in keyField):
+					keyChanged = True
 					# Changing the key field value, need to key the mementos on the new
 					# value, not the old. Additionally, need to copy the mementos from the
 					# old key value to the new one.
@@ -1117,6 +2216,12 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 			# Finally, save the new value to the field and signify that the field was changed:
 			rec[fld] = val
+			if keyChanged:
+				self._updatePkIndex(row, old_key, keyFieldValue)
+			self._updateSeekIndexes(row, {fld: old_val})
+			if self._virtualFieldCache:
+				self._clearVirtualFieldCache((fld,), rec)
+			self._markRecordsChanged(row)
 			return True
 
 
@@ -1299,11 +2404,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		"""
 		ret = {}
 		if pk is not None:
-			recs = [r for r in self._records
-					if r[self._keyField] == pk]
-			try:
-				rec = recs[0]
-			except IndexError:
+			row, rec = self._getRecordByPk(pk, raiseRowNotFound=False)
+			if rec is None:
 				return ret
 		else:
 			if row is None:
@@ -1331,11 +2433,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		"""
 		ret = {}
 		if pk is not None:
-			recs = [r for r in self._records
-					if r[self._keyField] == pk]
-			try:
-				rec = recs[0]
-			except IndexError:
+			row, rec = self._getRecordByPk(pk, raiseRowNotFound=False)
+			if rec is None:
 				return ret
 		else:
 			if row is None:
@@ -1371,6 +2470,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if not ds:
 			ds = dDataSet()
 		self._records = ds
+		self._clearVirtualFieldCache()
 
 
 	def getDataSet(self, flds=(), rowStart=0, rows=None, returnInternals=False):
@@ -1381,35 +2481,197 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		to only include the specified fields. rowStart specifies the starting row
 		to include, and rows is the number of rows to return.
 		"""
-		rowCount = self.RowCount
-		if rows is None:
-			rows = rowCount
-		else:
-			rows = min(rowStart + rows, rowCount)
-		if rows < 1 or rowStart > self.RowCount:
+		flds, data = self.getDataRows(flds, rowStart, rows, returnInternals)
+		if not data:
 			return dDataSet()
+		return dDataSet([dict(zip(flds, vals)) for vals in data])
 
-		getFieldVal = self.getFieldVal
-		_records = self._records
-		vFieldKeys = self.VirtualFields.keys()
-		_correctFieldTypesIfNeeded = self._correctFieldTypesIfNeeded
 
+	def getDataRows(self, flds=(), rowStart=0, rows=None, returnInternals=False):
+		"""
+		Like getDataSet(), but returns a (fields, rows) tuple instead: 'fields' is
+		a tuple of the field names, and 'rows' a list with a tuple of the values
+		of those fields for each row. This saves building a dict for each row
+		when the data is just passed along, such as to a report or a grid.
+
+		When 'flds' is passed, the fields are returned in that order; virtual
+		fields among them are computed a column at a time.
+		"""
+		if rows is None or (rowStart + rows > self.RowCount):
+			self.fetchRemaining()
+		rowCount = self.RowCount
+		if rows is None:
+			rowEnd = rowCount
+		else:
+			rowEnd = min(rowStart + rows, rowCount)
+		if rowEnd <= rowStart:
+			return tuple(flds), []
+
+		recs = self._records[rowStart:rowEnd]
+		flag = kons.CURSOR_FIELD_TYPES_CORRECTED
+		self._correctRecordTypes([rec for rec in recs if not rec.get(flag, False)])
+		vFieldKeys = self.VirtualFields
 		if not flds:
-			vflds = vFieldKeys
-			flds = [f for f in _records[rowStart] if returnInternals or f not in cursor_flags]
+			vflds = vFieldKeys.keys()
+			realFlds = [f for f in recs[0] if returnInternals or f not in cursor_flags]
 		else:
-			vflds = [f for f in _records if f in vFieldKeys]
-			flds = [f for f in flds if f not in vFieldKeys]
+			vflds = [f for f in flds if f in vFieldKeys]
+			realFlds = [f for f in flds if f not in vFieldKeys]
+
+		data = self._projectRecords(recs, realFlds)
+		header = tuple(realFlds) + tuple(vflds)
+		if vflds:
+			rowRange = xrange(rowStart, rowEnd)
+			vrows = zip(*[self._getColumnValues(v, rowRange) for v in vflds])
+			data = [vals + vvals for vals, vvals in zip(data, vrows)]
+			if flds and header != tuple(flds):
+				# Put the virtual fields back where they were asked for.
+				order = itemgetter(*[header.index(f) for f in flds])
+				data = [order(vals) for vals in data]
+				header = tuple(flds)
+		return header, data
+
+
+	def _projectRecords(self, recs, flds):
+		"""
+		Returns a list with a tuple of the values of 'flds' for each of the passed
+		records. The values of compact records are picked with a getter that is
+		made once for each record layout. The internal flags that only some
+		records have are None for the others.
+		"""
+		flds = tuple(flds)
+		projectors = {}
+		def slowProject(rec):
+			return tuple([rec.get(f) if f in cursor_flags else rec[f] for f in flds])
+		ret = []
+		append = ret.append
+		for rec in recs:
+			layout = getattr(rec, "_layout", None)
+			try:
+				project = projectors[layout]
+			except KeyError:
+				project = None
+				if layout is not None:
+					project = layout.getProjector(flds)
+				project = projectors[layout] = project or slowProject
+			append(project(rec))
+		return ret
 
-		ds = []
-		for row in xrange(rowStart, rows):
-			rec = _records[row]
-			_correctFieldTypesIfNeeded(rec)
-			tmprec = dict([(k, rec[k]) for k in flds])
-			for v in vflds:
-				tmprec.update({v: self.getFieldVal(v, row)})
-			ds.append(tmprec)
-		return dDataSet(ds)
+
+	def getColumnArrays(self, flds=None):
+		"""
+		Returns a dict that maps each of the passed fields, or each field in the
+		DataStructure if none are passed, to an array of its values in row
+		order, for handing the data to numeric code without building a dict
+		per row.
+
+		When NumPy is installed the arrays are NumPy arrays typed from the field
+		type codes (int64, float64, bool, datetime64 or object), and columns
+		containing NULLs are masked arrays. Without it, numeric columns are
+		array.array objects, and other columns, or numeric ones containing
+		NULLs, are lists. Virtual fields can be included; their type is taken
+		from their first non-NULL value.
+		"""
+		self.fetchRemaining()
+		typeCodes = dict((fld[0], fld[1]) for fld in self.DataStructure)
+		if flds is None:
+			flds = [fld[0] for fld in self.DataStructure]
+		ret = {}
+		for fld in flds:
+			vals = self._getColumnValues(fld)
+			typeCode = typeCodes.get(fld)
+			if typeCode is None:
+				for val in vals:
+					if val is not None:
+						typeCode = dabo.db.getDaboType(type(val))
+						break
+			ret[fld] = dColumnArrays.toArray(vals, typeCode)
+		return ret
+
+
+	def setColumnArrays(self, columns):
+		"""
+		Stores whole columns of values at once, such as results computed from
+		the arrays returned by getColumnArrays(). 'columns' maps field names to
+		sequences holding one value per row, in row order; masked and NaT
+		entries become NULLs. The changes are tracked as with setFieldVal(),
+		so they are written by the next save(). Virtual fields are ignored.
+		Returns the number of values that changed.
+		"""
+		self.fetchRemaining()
+		records = self._records
+		rowCount = len(records)
+		keyField = self.KeyField
+		if self._compoundKey:
+			keyFields = keyField
+		else:
+			keyFields = (keyField,)
+		cols = []
+		keyCols = []
+		for fld, arr in columns.items():
+			if records and fld not in records[0]:
+				if fld in self.VirtualFields:
+					continue
+				raise dException.FieldNotFoundException(
+						_("Field '%s' does not exist in the data set.") % (fld,))
+			vals = dColumnArrays.toList(arr, self._types.get(fld))
+			if len(vals) != rowCount:
+				cnt = len(vals)
+				raise dException.dException(
+						_("Column '%(fld)s' has %(cnt)s values, but the data set has "
+						"%(rowCount)s row(s)") % locals())
+			if fld in keyFields:
+				# Changing keys moves mementos and index entries around.
+				keyCols.append((fld, vals))
+			else:
+				cols.append((fld, vals))
+		if not rowCount:
+			return 0
+		flag = kons.CURSOR_FIELD_TYPES_CORRECTED
+		self._correctRecordTypes([rec for rec in records if not rec.get(flag, False)])
+		validPK = self._hasValidKeyField()
+		nonUpdateFields = self.getNonUpdateFields()
+		mementos = self._mementos
+		changed = 0
+		changedFlds = set()
+		for row, rec in enumerate(records):
+			oldVals = {}
+			for fld, vals in cols:
+				val = vals[row]
+				oldVal = rec[fld]
+				if oldVal != val:
+					oldVals[fld] = oldVal
+					rec[fld] = val
+			if not oldVals:
+				continue
+			changed += len(oldVals)
+			changedFlds.update(oldVals)
+			if validPK:
+				pk = self.pkExpression(rec)
+				mem = mementos.get(pk, {})
+				for fld, oldVal in oldVals.iteritems():
+					if fld not in mem and fld not in nonUpdateFields:
+						mem[fld] = oldVal
+					if fld in mem and mem[fld] == rec[fld]:
+						# Changed back to the original value.
+						del mem[fld]
+				if mem:
+					mementos[pk] = mem
+				elif pk in mementos:
+					del mementos[pk]
+			self._updateSeekIndexes(row, oldVals)
+		if changed and not validPK:
+			dabo.log.info("Field values changed, but the mementos"
+					" can't be saved, because there is no valid KeyField.")
+		if changedFlds:
+			self._markRecordsChanged()
+			if self._virtualFieldCache:
+				self._clearVirtualFieldCache(changedFlds)
+		for fld, vals in keyCols:
+			for row, val in enumerate(vals):
+				if self.setFieldVal(fld, val, row):
+					changed += 1
+		return changed
 
 
 	def appendDataSet(self, ds, updateInternals=False):
@@ -1418,6 +2680,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		is done on the dataset columns to make sure that they are correct for this cursor;
 		it is the responsibility of the caller to make sure that they match. If invalid data is
 		passed, a dException.FieldNotFoundException will be raised.
+
+		Each row goes through new() and setFieldVal(); use bulkAppend() to load
+		a large number of rows.
 		"""
 		kf = self.KeyField
 		if not isinstance(kf, tuple):
@@ -1434,6 +2699,118 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				self.setFieldVal(col, val)
 
 
+	def bulkAppend(self, rows, markNew=True, fields=None, defaults=None):
+		"""
+		Appends a large number of records at once, such as when importing a
+		file. 'rows' is a sequence of dicts that all have the same keys or, if
+		'fields' is passed, of sequences holding a value for each of those
+		fields. The fields are checked against the data set once, and the
+		records are built directly instead of going through new() and
+		setFieldVal() for each value. Fields that aren't in the rows get their
+		value from the 'defaults' dict, which is handled as in setDefaults(),
+		or else the blank value for their type.
+
+		If 'markNew' is True, the records are flagged as new, with temporary
+		keys when AutoPopulatePK is set, so that save(allRows=True,
+		includeNewUnchanged=True) inserts them in batches. Otherwise they are
+		added as if they had been fetched from the database. Returns the number
+		of records added.
+		"""
+		rows = list(rows)
+		if not rows:
+			return 0
+		if fields is None:
+			fields = rows[0].keys()
+			fromDicts = True
+		else:
+			fields = list(fields)
+			fromDicts = False
+		blank = self._getBlankRecord()
+		for fld in fields:
+			if fld not in blank:
+				raise dException.FieldNotFoundException(
+						_("Field '%s' does not exist in the data set.") % (fld,))
+		layout = dRecordLayout(blank.keys())
+		slots = layout.slots
+		template = [blank[name] for name in layout.names]
+		callDefaults = []
+		for fld, val in (defaults or {}).items():
+			if fld not in blank:
+				raise dException.FieldNotFoundException(
+						_("Can't set default value for nonexistent field '%s'.") % fld)
+			if fld in fields:
+				continue
+			if callable(val):
+				callDefaults.append((slots[fld], val, ()))
+			elif isinstance(val, tuple) and val and callable(val[0]):
+				callDefaults.append((slots[fld], val[0], val[1:]))
+			else:
+				template[slots[fld]] = val
+		positions = [slots[fld] for fld in fields]
+		fldCount = len(fields)
+
+		recs = []
+		append = recs.append
+		for num, row in enumerate(rows):
+			vals = list(template)
+			if fromDicts:
+				try:
+					rowVals = [row[fld] for fld in fields]
+				except KeyError, e:
+					raise dException.dException(_("Row %(num)s has no value for "
+							"field '%(fld)s'") % {"num": num, "fld": e.args[0]})
+			else:
+				rowVals = row
+				if len(rowVals) != fldCount:
+					cnt = len(rowVals)
+					raise dException.dException(_("Row %(num)s has %(cnt)s values, "
+							"but %(fldCount)s fields were passed") % locals())
+			for idx, val in zip(positions, rowVals):
+				vals[idx] = val
+			for idx, fnc, prms in callDefaults:
+				vals[idx] = fnc(*prms)
+			append(dCompactRecord(layout, vals))
+
+		if markNew:
+			self.__flagNewRecords(recs)
+		oldRecords = self._records
+		self._records = dDataSet(self._records + tuple(recs))
+		self._appendToPkIndex(oldRecords, recs)
+		self._appendToSeekIndexes(oldRecords, recs)
+		if self.RowNumber < 0:
+			self.RowNumber = 0
+		return len(recs)
+
+
+	def __flagNewRecords(self, recs):
+		"""
+		Does what genTempAutoPK() and setNewFlag() do for a new record, for all
+		the passed records at once.
+		"""
+		kf = self.KeyField
+		tmpFlag = kons.CURSOR_TMPKEY_FIELD
+		if not kf:
+			for rec in recs:
+				rec[tmpFlag] = None
+			return
+		compound = isinstance(kf, tuple)
+		keyFields = kf if compound else (kf,)
+		if self.AutoPopulatePK:
+			genTempPKVal = self.sqlManager._genTempPKVal
+			for rec in recs:
+				tmpPK = genTempPKVal(rec[keyFields[0]])
+				for key in keyFields:
+					rec[key] = tmpPK
+		newRecords = self._newRecords
+		for rec in recs:
+			if compound:
+				pk = tuple([rec[key] for key in kf])
+			else:
+				pk = rec[kf]
+			newRecords[pk] = None
+			rec[tmpFlag] = pk
+
+
 	def cloneRecord(self):
 		"""Creates a copy of the current record and adds it to the dataset."""
 		if not self.RowCount:
@@ -1466,8 +2843,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		uses it as its own. Also resets the lastRequeryTime value.
 		"""
 		# clear mementos and new record flags:
-		self._mementos = {}
-		self._newRecords = {}
+		self._mementos.clear()
+		self._newRecords.clear()
 		self.lastRequeryTime = time.time()
 		# If None is passed as the data, exit after resetting the flags
 		if data is None:
@@ -1475,8 +2852,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		# Store the values
 		self._records = data
 		self._types = typs
+		self._clearVirtualFieldCache()
+		self._clearFieldConverters()
+		self._deltaConflicts = {}
+		self._deltaWatermark = self.__getDeltaWatermark(data)
 		# Clear the unsorted list, and then apply the current sort
-		self.__unsortedRows = []
+		self.__unsortedPositions = None
+		self.__unsortedRecords = None
 		if self.sortColumn:
 			try:
 				self.sort(self.sortColumn, self.sortOrder)
@@ -1487,11 +2869,19 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def filter(self, fld, expr, op="="):
 		"""Apply a filter to the current records."""
-		self._records = self._records.filter(fld=fld, expr=expr, op=op)
+		self.fetchRemaining()
+		records = self._records
+		values = None
+		if records and fld not in records[0] and fld in self.VirtualFields:
+			values = self._getVirtualColumn(fld)
+		elif fld in self._filterIndexes:
+			records.addIndex(fld, self._filterIndexes[fld])
+		self._records = records.filter(fld=fld, expr=expr, op=op, values=values)
 
 
 	def filterByExpression(self, expr):
 		"""Allows you to filter by any valid Python expression."""
+		self.fetchRemaining()
 		self._records = self._records.filterByExpression(expr)
 
 
@@ -1523,10 +2913,14 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		   be used in any programming.
 
 		"""
+		self.fetchRemaining()
 		# Make sure that the data set object has any necessary references
 		self._records.Cursor = self
 		self._records.Bizobj = self._bizobj
 		self._records.replace(field, valOrExpr, scope=scope)
+		self._invalidatePkIndex()
+		self._invalidateSeekIndexes((field,))
+		self._clearVirtualFieldCache((field,))
 
 
 	def first(self):
@@ -1553,6 +2947,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def next(self):
 		"""Move the record pointer forward one position in the recordset."""
+		if self.RowNumber >= (self.RowCount - 1):
+			self.fetchMore()
 		if self.RowCount > 0:
 			if self.RowNumber < (self.RowCount - 1):
 				self.RowNumber += 1
@@ -1566,6 +2962,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def last(self):
 		"""Move the record pointer to the last record in the recordset."""
+		self.fetchRemaining()
 		if self.RowCount > 0:
 			self.RowNumber = self.RowCount - 1
 		else:
@@ -1574,52 +2971,243 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 
 	def save(self, allRows=False, includeNewUnchanged=False):
-		"""Save any changes to the current record back to the data store."""
+		"""
+		Save any changes to the current record back to the data store.
+
+		When 'allRows' is True, all changed rows are saved; rows whose changes
+		result in the same statement (the same kind of statement on the same
+		set of columns) are sent to the backend together with executemany().
+		"""
 		# Make sure that there is data to save
 		if self.RowCount <= 0:
 			raise dException.NoRecordsException(_("No data to save"))
 		# Make sure that there is a PK
 		self.checkPK()
 
-		def saverow(row):
-			try:
-				self.__saverow(row)
-			except dException.DBQueryException, e:
-				# Error was encountered. Raise an exception so that the
-				# calling bizobj can rollback the transaction if necessary
-				try:
-					errMsg = ustr(e).decode(self.Encoding)
-				except UnicodeError:
-					errMsg = ustr(e)
-				dabo.dbActivityLog.info(
-						_("DBQueryException encountered in save(): %s") % errMsg)
-				raise e
-			except StandardError, e:
-				errMsg = ustr(e)
-				if "connect" in errMsg.lower():
-					dabo.dbActivityLog.info(
-							_("Connection Lost exception encountered in saverow(): %s") % errMsg)
-					raise dException.ConnectionLostException(errMsg)
-				else:
-					# Error was encountered. Raise an exception so that the
-					# calling bizobj can rollback the transaction if necessary
-					raise
+		if allRows:
+			# This branch doesn't happen when called from dBizobj (not sure if
+			# we really need the allRows arg at all).
+			rows = self.getChangedRows(includeNewUnchanged=includeNewUnchanged)
+		else:
+			# This branch results in redundant isChanged() call when called from
+			# dBizobj.saveAll(), but it needs to be here because dBizobj.save()
+			# doesn't check it.
+			rows = []
+			if self.isChanged(allRows=False, includeNewUnchanged=includeNewUnchanged):
+				rows = [self.RowNumber]
+
+		batchRecs = self._batchSaveRecords
+		if batchRecs is not None:
+			# Saving is deferred until flushBatchSave() is called.
+			batchIds = set(id(rec) for rec in batchRecs)
+			for row in rows:
+				rec = self._records[row]
+				if id(rec) not in batchIds:
+					batchRecs.append(rec)
+					batchIds.add(id(rec))
+			return
+		self.__saveRows(rows)
+
+
+	def __saveRows(self, rows):
+		"""Saves the passed rows, batching them when there is more than one."""
+		if not rows:
+			return
+		self._syncAuxProperties()
+		try:
+			if len(rows) > 1:
+				self.__saveBatched(rows)
+			else:
+				self.__saverow(rows[0])
+		except dException.DBQueryException, e:
+			# Error was encountered. Raise an exception so that the
+			# calling bizobj can rollback the transaction if necessary
+			try:
+				errMsg = ustr(e).decode(self.Encoding)
+			except UnicodeError:
+				errMsg = ustr(e)
+			dabo.dbActivityLog.info(
+					_("DBQueryException encountered in save(): %s") % errMsg)
+			raise e
+		except StandardError, e:
+			errMsg = ustr(e)
+			if "connect" in errMsg.lower():
+				dabo.dbActivityLog.info(
+						_("Connection Lost exception encountered in saverow(): %s") % errMsg)
+				raise dException.ConnectionLostException(errMsg)
+			else:
+				# Error was encountered. Raise an exception so that the
+				# calling bizobj can rollback the transaction if necessary
+				raise
+
+
+	def beginBatchSave(self):
+		"""
+		Makes save() collect the rows to be saved instead of writing them. The
+		collected rows are written in batches by flushBatchSave() or
+		endBatchSave().
+		"""
+		if self._batchSaveRecords is None:
+			self._batchSaveRecords = []
+
+
+	def flushBatchSave(self):
+		"""Writes the rows collected by save() since beginBatchSave() was called."""
+		recs = self._batchSaveRecords
+		if not recs:
+			return
+		self._batchSaveRecords = []
+		positions = dict((id(rec), row) for row, rec in enumerate(self._records))
+		self.__saveRows([positions[id(rec)] for rec in recs if id(rec) in positions])
+
+
+	def endBatchSave(self, flush=True):
+		"""
+		Stops collecting rows in save(). Unless 'flush' is False, any collected
+		rows are written first.
+		"""
+		try:
+			if flush:
+				self.flushBatchSave()
+		finally:
+			self._batchSaveRecords = None
+
+
+	def __saveBatched(self, rows):
+		"""
+		Groups the rows by the statement needed to save them, and runs each
+		group with a single executemany() call. Rows that can't be batched, such
+		as new records whose PK is generated by the backend on insert, are saved
+		one at a time. As with single rows, updates that don't find their row
+		are reported by the backend's noResultsOnSave().
+		"""
+		batches = {}
+		batchOrder = []
+		for row in rows:
+			stmnt = self.__getBatchStatement(row)
+			if stmnt is None:
+				self.__saverow(row)
+				continue
+			sql, params, newrec = stmnt
+			try:
+				batches[sql][1].append((row, params))
+			except KeyError:
+				batches[sql] = (newrec, [(row, params)])
+				batchOrder.append(sql)
+
+		aux = self.AuxCursor
+		for sql in batchOrder:
+			newrec, items = batches[sql]
+			aux.executemany(sql, [params for row, params in items])
+			if not newrec:
+				# Each update matches a single row by its PK, so if fewer rows
+				# were changed, some of them are gone or have a different key.
+				cnt = getattr(aux, "rowcount", -1)
+				if cnt is not None and 0 <= cnt < len(items):
+					self.BackendObject.noResultsOnSave()
+			for row, params in items:
+				recKey = self.pkExpression(self._records[row])
+				self._clearMemento(row)
+				if newrec:
+					self._clearNewRecord(row=row, pkVal=recKey)
+
+
+	def __getBatchStatement(self, row):
+		"""
+		Returns a (sql, params, newrec) tuple for saving the row as part of a
+		batch, or None if the row has to be saved by itself.
+		"""
+		rec = self._records[row]
+		newrec = kons.CURSOR_TMPKEY_FIELD in rec
+		newPKVal = None
+		if newrec:
+			if self._nullDefaults:
+				# The default values have to be read back after each insert.
+				return None
+			if self.AutoPopulatePK:
+				if self._compoundKey:
+					return None
+				newPKVal = self.pregenPK()
+				if not newPKVal:
+					# The backend generates the PK on insert, and it can only
+					# report the last one generated.
+					return None
+				self.setFieldVal(self.KeyField, newPKVal, row)
+			diff = self._getNewRecordDiff(row)
+			if not diff:
+				return None
+			sql, params = self.__makeInsert(diff, newPKVal)
+		else:
+			if not self.BackendObject.reportsBatchRowCount():
+				# Only saving the row by itself tells whether it was found.
+				return None
+			diff = self.getRecordStatus(row)
+			if not diff:
+				return None
+			updClause, params = self.makeUpdClause(diff)
+			if not updClause:
+				return None
+			pkWhere, pkParams = self._makePkWhereParams(row)
+			sql = "update %s set %s where %s" % (
+					self.BackendObject.encloseNames(self.Table, self.AutoQuoteNames),
+					updClause, pkWhere)
+			params = params + pkParams
+		return (sql, params, newrec)
+
 
-		self._syncAuxProperties()
+	def __makeInsert(self, diff, newPKVal):
+		"""Returns the insert statement and its parameters for a new record's diff."""
+		aq = self.AutoQuoteNames
+		names = []
+		vals = []
+		kf = self.KeyField
+		nonUpdateFields = self.getNonUpdateFields()
+		fieldTypes = dict((ds[0], ds[1]) for ds in self.DataStructure)
+		for kk, vv in diff.items():
+			if self.AutoPopulatePK:
+				if self._compoundKey:
+					skipIt = (kk in kf)
+				else:
+					# Skip the key field, unless we pre-generated its value above.
+					skipIt = (kk == self.KeyField) and not newPKVal
+				if skipIt:
+					# we don't want to include the PK in the insert
+					continue
+			if kk in nonUpdateFields:
+				# Skip it.
+				continue
+			if self._nullDefaults and vv == (None, None):
+				# Skip these, too
+				continue
+			# Append the field and its value.
+			names.append(kk)
+			# add value to expression
+			fieldType = fieldTypes[kk]
+			val = vv[1]
+			if fieldType == "L" or (isinstance(val, basestring) and "\0" in val):
+				val = self.formatBLOB(val)
+			#elif fieldType in ("D", "T"):
+			#	val = self.formatDateTime(val)
+			vals.append(val)
 
-		if allRows:
-			# This branch doesn't happen when called from dBizobj (not sure if
-			# we really need the allRows arg at all).
-			rows = self.getChangedRows(includeNewUnchanged=includeNewUnchanged)
-		else:
-			# This branch results in redundant isChanged() call when called from
-			# dBizobj.saveAll(), but it needs to be here because dBizobj.save()
-			# doesn't check it.
-			rows = []
-			if self.isChanged(allRows=False, includeNewUnchanged=includeNewUnchanged):
-				rows = [self.RowNumber]
-		for row in rows:
-			saverow(row)
+		key = (self.Table, aq, tuple(names))
+		try:
+			sql = self._insertSQLCache[key]
+		except KeyError:
+			encloseNames = self.BackendObject.encloseNames
+			flds = ", ".join([encloseNames(kk, aq) for kk in names])
+			if not flds:
+				# Some backends (sqlite) require non-empty field clauses. We already
+				# know that we are expecting the backend to generate the PK, so send
+				# NULL as the PK Value:
+				flds = self.KeyField
+				vals = "NULL"
+			nms = encloseNames(self.Table, aq)
+			placeHolders = len(vals) * [self.ParamPlaceholder]
+			sql = "insert into %s (%s) values (%s) " % (nms, flds, ",".join(placeHolders))
+			if names:
+				self._insertSQLCache[key] = sql
+		return (sql, tuple(vals))
 
 
 	def __saverow(self, row):
@@ -1645,48 +3233,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		aq = self.AutoQuoteNames
 		if diff:
 			if newrec:
-				flds = ""
-				vals = []
-				kf = self.KeyField
-				for kk, vv in diff.items():
-					if self.AutoPopulatePK:
-						if self._compoundKey:
-							skipIt = (kk in kf)
-						else:
-							# Skip the key field, unless we pre-generated its value above.
-							skipIt = (kk == self.KeyField) and not newPKVal
-						if skipIt:
-							# we don't want to include the PK in the insert
-							continue
-					if kk in self.getNonUpdateFields():
-						# Skip it.
-						continue
-					if self._nullDefaults and vv == (None, None):
-						# Skip these, too
-						continue
-					# Append the field and its value.
-					flds += ", " + self.BackendObject.encloseNames(kk, aq)
-					# add value to expression
-					fieldType = [ds[1] for ds in self.DataStructure if ds[0] == kk][0]
-					val = vv[1]
-					if fieldType == "L" or (isinstance(val, basestring) and "\0" in val):
-						val = self.formatBLOB(val)
-					#elif fieldType in ("D", "T"):
-					#	val = self.formatDateTime(val)
-					vals.append(val)
-
-				# Trim leading comma-space from the 'flds' string
-				flds = flds[2:]
-				if not flds:
-					# Some backends (sqlite) require non-empty field clauses. We already
-					# know that we are expecting the backend to generate the PK, so send
-					# NULL as the PK Value:
-					flds = self.KeyField
-					vals = "NULL"
-				nms = self.BackendObject.encloseNames(self.Table, aq)
-				placeHolders = len(vals) * [self.ParamPlaceholder]
-				sql = "insert into %s (%s) values (%s) " % (nms, flds, ",".join(placeHolders))
-				params = tuple(vals)
+				sql, params = self.__makeInsert(diff, newPKVal)
 			else:
 				pkWhere = self.makePkWhere(row)
 				updClause, params = self.makeUpdClause(diff)
@@ -1745,6 +3292,16 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 					self.BackendObject.noResultsOnSave()
 
 
+	def _onChangedStateChanged(self):
+		"""
+		Called when the cursor starts or stops having unsaved changes or new
+		records. Lets the owning bizobj keep track of its changed cursors.
+		"""
+		biz = self._bizobj
+		if biz is not None and not self._isAuxiliary:
+			biz._cursorChangedStateChanged(self)
+
+
 	def _clearMemento(self, row=None):
 		"""Erase the memento for the passed row, or current row if none passed."""
 		if row is None:
@@ -1835,7 +3392,10 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	def new(self):
 		"""Add a new record to the data set."""
 		blank = self._getBlankRecord()
+		oldRecords = self._records
 		self._records = dDataSet(self._records + (blank,))
+		self._appendToPkIndex(oldRecords, (blank,))
+		self._appendToSeekIndexes(oldRecords, (blank,))
 		# Adjust the RowCount and position
 		self.RowNumber = self.RowCount - 1
 
@@ -1860,27 +3420,34 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				recs = self._records
 
 			if self._newRecords:
-				recs = list(recs)
-				delrecs_idx = []
+				delrec_ids = set()
 				for rec_id in self._newRecords:
 					# Remove any memento associated with the canceled new record, and
-					# append to the list of indexes to delete.
+					# remember the record object so that it can be dropped below.
 					row, rec = self._getRecordByPk(rec_id)
 					self._clearMemento(row)
-					delrecs_idx.append(self._records._index(rec))
-				delrecs_idx.sort(reverse=True)
-				for idx in delrecs_idx:
-					del recs[idx]
-				self._newRecords = {}
-				self._records = dDataSet(recs)
+					delrec_ids.add(id(rec))
+				self._newRecords.clear()
+				self._records = dDataSet([rec for rec in recs
+						if id(rec) not in delrec_ids])
 				if self.RowNumber >= self.RowCount:
 					self.RowNumber = self.RowCount - 1
 
+			kf = self.KeyField
+			if not isinstance(kf, tuple):
+				kf = (kf,)
 			for rec_pk, mem in self._mementos.items():
 				row, rec = self._getRecordByPk(rec_pk)
 				for fld, val in mem.items():
-					self._records[row][fld] = val
-			self._mementos = {}
+					rec[fld] = val
+					if fld in kf:
+						# The restored key no longer matches the indexed one.
+						self._invalidatePkIndex()
+				self._invalidateSeekIndexes(mem)
+				self._clearVirtualFieldCache(mem, rec)
+			if self._mementos:
+				self._markRecordsChanged()
+			self._mementos.clear()
 
 		else:
 			row = self.RowNumber
@@ -1891,16 +3458,27 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				self._clearMemento(row)
 				self._clearNewRecord(row)
 				recs = list(self._records)
-				del recs[recs.index(rec)]
+				del recs[row]
 				self._records = dDataSet(recs)
 				if self.RowNumber >= self.RowCount:
 					self.RowNumber = self.RowCount - 1
 				return
 
 			# Not a new record: need to manually replace the old values:
-			for fld, val in self._mementos.get(recKey, {}).items():
-				self._records[row][fld] = val
-			self._clearMemento(row)
+			kf = self.KeyField
+			if not isinstance(kf, tuple):
+				kf = (kf,)
+			mem = self._mementos.get(recKey, {})
+			for fld, val in mem.items():
+				rec[fld] = val
+			# The memento is keyed on the PK value before it was restored.
+			self._mementos.pop(recKey, None)
+			if [fld for fld in mem if fld in kf]:
+				self._invalidatePkIndex()
+			self._invalidateSeekIndexes(mem)
+			self._clearVirtualFieldCache(mem, rec)
+			if mem:
+				self._markRecordsChanged(row)
 
 
 	def delete(self, delRowNum=None):
@@ -1911,43 +3489,90 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if delRowNum is None:
 			# assume that it is the current row that is to be deleted
 			delRowNum = self.RowNumber
+		self.deleteRows((delRowNum,))
 
-		rec = self._records[delRowNum]
-		pk = self.pkExpression(rec)
-		if pk in self._newRecords:
-			res = True
-			del self._newRecords[pk]
-		else:
-			pkWhere = self.makePkWhere()
-			# some backends(PostgreSQL) don't return information about number of deleted rows
-			# try to fetch it before
-			sql = "select count(*) as cnt from %s where %s" % (self.Table, pkWhere)
-			aux = self.AuxCursor
-			aux.execute(sql)
-			res = aux.getFieldVal('cnt')
-			if res:
-				sql = "delete from %s where %s" % (self.Table, pkWhere)
-				aux.execute(sql)
-
-		if not res:
-			# Nothing was deleted
-			self.BackendObject.noResultsOnDelete()
-		# The 'res' could be empty in multiuser environment and there is no concurrency
-		# control, so we delete the record from the current data set unconditionally.
-		if pk in self._mementos:
-			del self._mementos[pk]
-		self._removeRow(delRowNum)
 
+	def deleteRows(self, rows):
+		"""
+		Delete the specified rows.
 
-	def _removeRow(self, row):
+		New, unsaved rows are just dropped. The rest are deleted from the backend
+		with one 'delete ... where pk in (...)' statement for each chunk of
+		keys, and the data set is rebuilt once at the end.
+		"""
+		if not rows:
+			return
+		if self.RowCount == 0:
+			raise dException.NoRecordsException(_("No record to delete"))
+		recs = self._records
+		delRecs = [recs[row] for row in sorted(set(rows))]
+		delKeys = []
+		dbKeys = []
+		for rec in delRecs:
+			pk = self.pkExpression(rec)
+			delKeys.append(pk)
+			if pk not in self._newRecords:
+				dbKeys.append(self.__pkValGetter(rec))
+
+		if dbKeys:
+			res = self.__deleteKeys(dbKeys)
+			if res is not None and res < len(dbKeys):
+				# Not everything was deleted
+				self.BackendObject.noResultsOnDelete()
+		# The rows could already be gone in a multiuser environment and there is no
+		# concurrency control, so we delete the records from the current data set
+		# unconditionally.
+		for pk in delKeys:
+			self._newRecords.pop(pk, None)
+			self._mementos.pop(pk, None)
 		## Since record sets are tuples and thus immutable, we need to do this
-		## little dance to remove a row.
-		lRec = list(self._records)
-		del lRec[row]
-		self._records = dDataSet(lRec)
+		## little dance to remove the rows.
+		delIds = set(id(rec) for rec in delRecs)
+		self._records = dDataSet([rec for rec in recs if id(rec) not in delIds])
 		self.RowNumber = min(self.RowNumber, self.RowCount - 1)
 
 
+	def __deleteKeys(self, getters):
+		"""
+		Deletes the backend records identified by the passed key value getters.
+		Returns the number of deleted records, or None if the backend doesn't
+		report it.
+		"""
+		bo = self.BackendObject
+		aq = self.AutoQuoteNames
+		tblPrefix = bo.getWhereTablePrefix(self.Table, autoQuote=aq)
+		if self._compoundKey:
+			keyFields = self.KeyField
+		else:
+			keyFields = (self.KeyField,)
+		fldNames = [tblPrefix + bo.encloseNames(fld, aq) for fld in keyFields]
+		placeHolder = self.ParamPlaceholder
+		aux = self.AuxCursor
+		chunkSize = self._deleteChunkSize
+		ret = 0
+		for start in xrange(0, len(getters), chunkSize):
+			chunk = getters[start:start + chunkSize]
+			params = []
+			if len(fldNames) == 1:
+				where = "%s in (%s)" % (fldNames[0], ", ".join([placeHolder] * len(chunk)))
+				for getPkVal in chunk:
+					params.append(getPkVal(keyFields[0]))
+			else:
+				rowWhere = "(%s)" % " and ".join(["%s = %s" % (fld, placeHolder)
+						for fld in fldNames])
+				where = " or ".join([rowWhere] * len(chunk))
+				for getPkVal in chunk:
+					params.extend([getPkVal(fld) for fld in keyFields])
+			aux.execute("delete from %s where %s" % (self.Table, where), tuple(params))
+			# Some backends (Firebird) don't report the number of deleted rows.
+			cnt = getattr(aux, "rowcount", -1)
+			if ret is None or cnt is None or cnt < 0:
+				ret = None
+			else:
+				ret += cnt
+		return ret
+
+
 	def flush(self):
 		"""
 		Some backends need to be prompted to flush changes
@@ -2054,14 +3679,250 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return map(self._getRowByPk, chKeys)
 
 
+	def _pkIndexKey(self, rec):
+		"""Return the value under which the passed record is stored in the PK index."""
+		kf = self.KeyField
+		corrected = rec.get(kons.CURSOR_FIELD_TYPES_CORRECTED, False)
+		if isinstance(kf, tuple):
+			if corrected:
+				return tuple([rec[k] for k in kf])
+			return tuple([self._correctFieldType(rec[k], k) for k in kf])
+		if corrected:
+			return rec[kf]
+		return self._correctFieldType(rec[kf], kf)
+
+
+	def _getPkIndex(self):
+		"""
+		Return the dict that maps PK values to row positions in the current
+		data set, building it first if the data set has been replaced since the
+		last time it was built. When several rows share a key value, the first
+		of them is indexed, matching what a sequential scan would find.
+		"""
+		records = self._records
+		if self._pkIndex is None or self._pkIndexRecords is not records:
+			pkIndex = {}
+			hasDupes = False
+			_pkIndexKey = self._pkIndexKey
+			try:
+				for row, rec in enumerate(records):
+					key = _pkIndexKey(rec)
+					if key in pkIndex:
+						hasDupes = True
+					else:
+						pkIndex[key] = row
+			except KeyError, e:
+				raise dException.FieldNotFoundException(
+						_("Field '%s' does not exist in the data set.") % e)
+			self._pkIndex = pkIndex
+			self._pkIndexRecords = records
+			self._pkIndexHasDupes = hasDupes
+		return self._pkIndex
+
+
+	def _invalidatePkIndex(self):
+		"""Force the PK index to be rebuilt the next time it is needed."""
+		self._pkIndex = self._pkIndexRecords = None
+
+
+	def _updatePkIndex(self, row, oldKey, newKey):
+		"""Record that the key of the record at 'row' changed from oldKey to newKey."""
+		pkIndex = self._pkIndex
+		if pkIndex is None or self._pkIndexRecords is not self._records:
+			# It will be rebuilt from scratch anyway.
+			return
+		if self._pkIndexHasDupes or pkIndex.get(oldKey) != row or newKey in pkIndex:
+			# Can't patch reliably when several rows share a key value.
+			self._invalidatePkIndex()
+			return
+		del pkIndex[oldKey]
+		pkIndex[newKey] = row
+
+
+	def _appendToPkIndex(self, oldRecords, recs):
+		"""
+		Called after 'recs' have been appended to oldRecords to form the current
+		data set, so that the PK index can be extended instead of rebuilt.
+		"""
+		pkIndex = self._pkIndex
+		if pkIndex is None or self._pkIndexRecords is not oldRecords:
+			return
+		row = len(oldRecords)
+		try:
+			for rec in recs:
+				key = self._pkIndexKey(rec)
+				if key in pkIndex:
+					self._pkIndexHasDupes = True
+				else:
+					pkIndex[key] = row
+				row += 1
+		except KeyError:
+			self._invalidatePkIndex()
+			return
+		self._pkIndexRecords = self._records
+
+
+	def _getSeekIndex(self, flds, lower):
+		"""
+		Return the list of (value, row) tuples for the passed tuple of fields,
+		sorted by value and then by row. For a single field the value is that
+		field's value, lowercased if 'lower' is True; otherwise it is the tuple
+		of the field values. The list is built on first use and kept until the
+		data set is replaced, or one of the fields is changed in a way that
+		can't be patched. Indexes on virtual fields are never kept, since their
+		values can change without the cursor knowing it.
+		"""
+		records = self._records
+		if self._seekIndexRecords is not records:
+			self._seekIndexes = {}
+			self._seekIndexRecords = records
+		try:
+			return self._seekIndexes[(flds, lower)]
+		except KeyError:
+			pass
+		cols = [self._getColumnValues(fld) for fld in flds]
+		if len(flds) == 1:
+			vals = cols[0]
+			if lower:
+				vals = [_safeLower(val) for val in vals]
+		else:
+			vals = zip(*cols)
+		entries = sorted(zip(vals, xrange(len(records))))
+		if not [fld for fld in flds if fld not in records[0]]:
+			self._seekIndexes[(flds, lower)] = entries
+		return entries
+
+
+	@staticmethod
+	def _makeSeekKey(vals, lower):
+		"""Return the seek index value for the passed field values."""
+		if len(vals) == 1:
+			if lower:
+				return _safeLower(vals[0])
+			return vals[0]
+		return tuple(vals)
+
+
+	def _markRecordsChanged(self, row=None):
+		"""
+		Tell the data set holding the records that the passed row, or all of
+		them, were changed in place. See dDataSet.markChanged().
+		"""
+		records = self._records
+		if isinstance(records, dDataSet):
+			records.markChanged(row)
+
+
+	def _invalidateSeekIndexes(self, flds=None):
+		"""
+		Discard the seek indexes that include any of the passed fields, or all
+		of them if no fields are passed.
+		"""
+		if flds is None:
+			self._seekIndexes = {}
+			return
+		if isinstance(flds, basestring):
+			flds = (flds,)
+		for key in self._seekIndexes.keys():
+			if [fld for fld in key[0] if fld in flds]:
+				del self._seekIndexes[key]
+
+
+	def clearVirtualFieldCache(self, fld=None, row=None):
+		"""
+		Discards the memoized values of the virtual fields defined with 'cache'.
+		If 'fld' is passed, only the virtual fields whose 'depends_on' list
+		includes it, or that have no such list, are affected. If 'row' is
+		passed, only the values for that row are discarded.
+		"""
+		rec = None
+		if row is not None:
+			try:
+				rec = self._records[row]
+			except IndexError:
+				return
+		if fld is not None:
+			fld = (fld,)
+		self._clearVirtualFieldCache(fld, rec)
+
+
+	def _clearVirtualFieldCache(self, flds=None, rec=None):
+		"""
+		Discards the memoized virtual field values that depend on any of the
+		passed fields, or on anything if no fields are passed, for the passed
+		record or for all of them.
+		"""
+		cache = self._virtualFieldCache
+		if not cache:
+			return
+		names = cache.keys()
+		if flds is not None:
+			vfs = self.VirtualFields
+			affected = []
+			for name in names:
+				vf = vfs.get(name)
+				deps = None
+				if isinstance(vf, dict):
+					deps = vf.get("depends_on")
+				if not deps or [fld for fld in flds if fld in deps]:
+					affected.append(name)
+			names = affected
+		for name in names:
+			if rec is None:
+				del cache[name]
+			else:
+				cache[name].pop(id(rec), None)
+
+
+	def _updateSeekIndexes(self, row, changes):
+		"""
+		Move the record at 'row' to its new place in the seek indexes after
+		some of its fields were changed. 'changes' maps the changed fields to
+		their values before the change.
+		"""
+		if not self._seekIndexes or self._seekIndexRecords is not self._records:
+			return
+		rec = self._records[row]
+		for key, entries in self._seekIndexes.items():
+			flds, lower = key
+			if not [fld for fld in flds if fld in changes]:
+				continue
+			oldEntry = (self._makeSeekKey([changes.get(fld, rec[fld]) for fld in flds],
+					lower), row)
+			pos = bisect_left(entries, oldEntry)
+			if pos < len(entries) and entries[pos] == oldEntry:
+				del entries[pos]
+				insort(entries, (self._makeSeekKey([rec[fld] for fld in flds], lower), row))
+			else:
+				del self._seekIndexes[key]
+
+
+	def _appendToSeekIndexes(self, oldRecords, recs):
+		"""
+		Called after 'recs' have been appended to oldRecords to form the current
+		data set, so that the seek indexes can be extended instead of rebuilt.
+		"""
+		if self._seekIndexRecords is not oldRecords:
+			return
+		firstRow = len(oldRecords)
+		try:
+			for (flds, lower), entries in self._seekIndexes.items():
+				for row, rec in enumerate(recs, firstRow):
+					insort(entries, (self._makeSeekKey([rec[fld] for fld in flds], lower), row))
+		except KeyError:
+			self._invalidateSeekIndexes()
+		self._seekIndexRecords = self._records
+
+
 	def _getRecordByPk(self, pk, raiseRowNotFound=True):
 		"""Find the record with the passed primary key; return (row, record)."""
 		kf = self.KeyField
-		if kf:
-			for idx, rec in enumerate(self._records):
-				key = self.getFieldVal(kf, row=idx)
-				if key == pk:
-					return (idx, rec)
+		if kf and self.RowCount:
+			if isinstance(pk, list):
+				pk = tuple(pk)
+			row = self._getPkIndex().get(pk)
+			if row is not None:
+				return (row, self._records[row])
 		if raiseRowNotFound:
 			tbl, rc = self.Table, self.RowCount
 			raise dException.RowNotFoundException(_("PK '%(pk)s' not found in table '%(tbl)s' (RowCount: %(rc)s)") % locals())
@@ -2076,8 +3937,11 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def hasPK(self, pk):
 		"""Return True if the passed pk is present in the dataset."""
-		kf = self.KeyField
-		return bool([v[kf] for v in self._records if v[kf] == pk])
+		if not self.KeyField or not self.RowCount:
+			return False
+		if isinstance(pk, list):
+			pk = tuple(pk)
+		return pk in self._getPkIndex()
 
 
 	def moveToPK(self, pk):
@@ -2136,8 +4000,9 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		that is less than the passed value. If 'caseSensitive' is set to False,
 		string comparisons are done in a case-insensitive fashion.
 
-		If sort is True (the default), then we seek to the first matching value
-		without sorting first.
+		If sort is True (the default), the search uses a sorted index of the
+		field values, which is kept between calls until the data changes. If it
+		is False, the rows are searched in their current order.
 
 		If incremental is True (default is False), then we only compare the first
 		characters up until the length of val.
@@ -2149,6 +4014,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if fld is None:
 			# Default to the current sort order field
 			fld = self.sortColumn
+		self.fetchRemaining()
 		if self.RowCount <= 0:
 			# Nothing to seek within
 			return ret
@@ -2174,19 +4040,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if badflds:
 			raise dException.FieldNotFoundException(_("Non-existent field(s) '%s'") % ", ".join(badflds))
 
-		# Copy the specified field vals and their row numbers to a list, and
-		# add those lists to the sort list
-		sortList = []
-		for row in xrange(0, self.RowCount):
-			if simpleKey:
-				rowval = self.getFieldVal(fld, row=row)
-			else:
-				rowval = tuple([self.getFieldVal(f, row=row) for f in flds])
-			sortList.append([rowval, row])
-
+		flds = tuple(flds)
 		if simpleKey:
 			# Determine if we are seeking string values
-			field_type = self._types.get(fld, type(sortList[0][0]))
+			try:
+				field_type = self._types[fld]
+			except KeyError:
+				field_type = type(self.getFieldVal(fld, row=0))
 			compString = issubclass(field_type, basestring)
 		else:
 			compString = False
@@ -2211,57 +4071,19 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 				except ValueError:
 					val = float(0)
 
-		if sort:
-			if compString and not caseSensitive:
-				sortList.sort(key=caseInsensitiveSortKey)
-			else:
-				sortList.sort()
-
-		if compString and not caseSensitive:
-			# Change all of the first elements to lower case
-			def safeLower(val):
-				try:
-					return val.lower()
-				except AttributeError:
-					return val
-			searchList = [safeLower(first) for first, second in sortList]
-			try:
-				matchVal = val.lower()
-			except AttributeError:
-				# this is a string colum, but seeking a null value.
-				matchVal = val
+		lower = compString and not caseSensitive
+		if lower:
+			# If this is a string column but we're seeking a null value, the
+			# value is left as it is.
+			matchVal = _safeLower(val)
 		else:
 			matchVal = val
-			searchList = [first for first, second in sortList]
 
-		# See if we have an exact match before we look for 'near' values
-		try:
-			idx = searchList.index(matchVal)
-			ret = sortList[idx][1]
-		except ValueError:
-			if near:
-				if incremental:
-					# Match the next string only taking into account the first characters
-					# up to the length of matchStr (so that seeking for 'AB' will bring up
-					# 'AB-PC' instead of 'FW-PC'.
-
-					ret = len(sortList) - 1
-					for idx, testVal in enumerate(searchList):
-						if isinstance(testVal, basestring) and isinstance(matchVal, basestring):
-							if len(testVal) >= len(matchVal) and testVal[:len(matchVal)] == matchVal:
-								ret = sortList[idx][1]
-								break
-						elif not isinstance(matchVal, basestring) and testVal > matchVal:
-							ret = idx
-							break
-				else:
-					# Find the first row greater than the match value
-					numSmaller = len([testVal for testVal in searchList
-							if testVal < matchVal])
-					try:
-						ret = sortList[numSmaller][1]
-					except IndexError:
-						ret = len(sortList) - 1
+		if sort:
+			ret = self.__searchSeekIndex(self._getSeekIndex(flds, lower), matchVal,
+					near, incremental)
+		else:
+			ret = self.__searchRows(flds, lower, matchVal, near, incremental)
 
 		if movePointer and ret > -1:
 			# Move the record pointer
@@ -2269,6 +4091,63 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return ret
 
 
+	def __searchSeekIndex(self, entries, matchVal, near, incremental):
+		"""Binary search of a seek index; returns the matching row or -1."""
+		count = len(entries)
+		# (matchVal,) sorts before any (matchVal, row) entry.
+		pos = bisect_left(entries, (matchVal,))
+		if pos < count and entries[pos][0] == matchVal:
+			return entries[pos][1]
+		if not near:
+			return -1
+		if incremental:
+			if isinstance(matchVal, basestring):
+				# Values that start with matchVal directly follow the position where
+				# matchVal itself would be, so seeking for 'AB' brings up 'AB-PC'
+				# instead of 'FW-PC'.
+				testVal = entries[pos][0] if pos < count else None
+				if isinstance(testVal, basestring) and testVal.startswith(matchVal):
+					return entries[pos][1]
+				return count - 1
+			pos = bisect_right(entries, (matchVal, sys.maxint))
+		if pos < count:
+			return entries[pos][1]
+		return count - 1
+
+
+	def __searchRows(self, flds, lower, matchVal, near, incremental):
+		"""Searches the rows in their current order; returns the matching row or -1."""
+		cols = [self._getColumnValues(fld) for fld in flds]
+		if len(flds) == 1:
+			searchList = cols[0]
+			if lower:
+				searchList = [_safeLower(testVal) for testVal in searchList]
+		else:
+			searchList = zip(*cols)
+		# See if we have an exact match before we look for 'near' values
+		try:
+			return searchList.index(matchVal)
+		except ValueError:
+			if not near:
+				return -1
+		ret = len(searchList) - 1
+		if incremental:
+			# Match the next string only taking into account the first characters
+			# up to the length of matchStr.
+			for idx, testVal in enumerate(searchList):
+				if isinstance(testVal, basestring) and isinstance(matchVal, basestring):
+					if testVal.startswith(matchVal):
+						return idx
+				elif not isinstance(matchVal, basestring) and testVal > matchVal:
+					return idx
+		else:
+			# Find the first row greater than the match value
+			numSmaller = len([testVal for testVal in searchList
+					if testVal < matchVal])
+			ret = min(numSmaller, ret)
+		return ret
+
+
 	def checkPK(self):
 		"""Verify that the field(s) specified in the KeyField prop exist."""
 		# First, make sure that there is *something* in the field
@@ -2308,14 +4187,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			keyFields = [fld for fld in self.KeyField]
 		else:
 			keyFields = [self.KeyField]
-		recKey = self.pkExpression(rec)
-		mem = self._mementos.get(recKey, {})
-
-		def getPkVal(fld):
-			try:
-				return mem[fld]
-			except KeyError:
-				return rec[fld]
+		getPkVal = self.__pkValGetter(rec)
 
 		ret = []
 		for fld in keyFields:
@@ -2332,6 +4204,40 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return "".join(ret)
 
 
+	def __pkValGetter(self, rec):
+		"""
+		Returns a function that gets the value of a key field of the record as it
+		is stored in the backend, which is the memento value if it was changed.
+		"""
+		mem = self._mementos.get(self.pkExpression(rec), {})
+
+		def getPkVal(fld):
+			try:
+				return mem[fld]
+			except KeyError:
+				return rec[fld]
+		return getPkVal
+
+
+	def _makePkWhereParams(self, row):
+		"""
+		Like makePkWhere(), but the key values are passed as parameters instead
+		of as literals, so that the clause is the same for every row. Returns a
+		2-tuple of the clause and the parameters.
+		"""
+		bo = self.BackendObject
+		aq = self.AutoQuoteNames
+		tblPrefix = bo.getWhereTablePrefix(self.Table, autoQuote=aq)
+		if self._compoundKey:
+			keyFields = self.KeyField
+		else:
+			keyFields = (self.KeyField,)
+		getPkVal = self.__pkValGetter(self._records[row])
+		clauses = ["%s%s = %s" % (tblPrefix, bo.encloseNames(fld, aq), self.ParamPlaceholder)
+				for fld in keyFields]
+		return (" AND ".join(clauses), tuple([getPkVal(fld) for fld in keyFields]))
+
+
 	def makeUpdClause(self, diff):
 		"""
 		Create the 'set field=val' section of the Update statement. Return a 2-tuple
@@ -2397,13 +4303,12 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		if tableName is None:
 			# Use the default
 			tableName = self.Table
-		key = "%s:::%s" % (tableName, self.CurrentSQL)
-		try:
-			return self._fieldStructure[key]
-		except KeyError:
-			flds = self.BackendObject.getFields(tableName, self.AuxCursor)
-			self._fieldStructure[key] = flds
-			return flds
+		backend = self.BackendObject
+		flds = schemaCache.get(backend.schemaCacheKey, tableName, "fields")
+		if flds is None:
+			flds = backend.getFields(tableName, self.AuxCursor)
+			schemaCache.set(backend.schemaCacheKey, tableName, "fields", flds)
+		return flds
 
 
 	def getFieldInfoFromDescription(self):
@@ -2471,12 +4376,16 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		ret = None
 		if self.BackendObject:
 			ret = self.BackendObject.rollbackTransaction(self.AuxCursor)
+			if len(resultCache):
+				# Results cached during the transaction may hold rows that are gone now.
+				resultCache.invalidate(self.BackendObject.schemaCacheKey)
 		return ret
 
 
 	def createTable(self, tabledef):
 		"""Create a table based on the table definition."""
 		self.BackendObject.createJustTable(tabledef, self)
+		schemaCache.invalidate(self.BackendObject.schemaCacheKey, tabledef.Name)
 
 
 	def createIndexes(self, tabledef):
@@ -2487,6 +4396,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	def createTableAndIndexes(self, tabledef):
 		"""Create a table and its indexes based on the table definition."""
 		self.BackendObject.createTableAndIndexes(tabledef, self)
+		schemaCache.invalidate(self.BackendObject.schemaCacheKey, tabledef.Name)
 
 
 	###     SQL Builder methods     ########
@@ -2598,28 +4508,31 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 					autoQuote=self.AutoQuoteNames)
 
 
-	def setChildFilter(self, fld):
-		"""This method sets the appropriate WHERE filter for dependent child queries."""
+	def _getTableAlias(self):
+		"""
+		Returns the name by which the main table is referred to in the FROM
+		clause, or the Table if there is no FROM clause.
+		"""
+		fromClause = self.sqlManager._fromClause
+		if not fromClause.strip():
+			# Use the old way (pre 2180) of using the Table (DataSource) property.
+			return self.Table
+		joinStrings = ["left join", "right join", "outer join", "inner join", "join"]
+		foundAlias = None
+		for joinString in joinStrings:
+			at = fromClause.lower().find(joinString)
+			if at >= 0:
+				foundAlias = fromClause[:at].strip()
+				break
+		if not foundAlias:
+			# The alias is the last 'word' in the FROM clause
+			foundAlias = fromClause.strip().split()[-1]
+		return foundAlias or self.Table
 
-		def getTableAlias(fromClause):
-			if not fromClause.strip():
-				return None
-			joinStrings = ["left join", "right join", "outer join", "inner join", "join"]
-			foundAlias = None
-			for joinString in joinStrings:
-				at = fromClause.lower().find(joinString)
-				if at >= 0:
-					foundAlias = fromClause[:at].strip()
-					break
-			if not foundAlias:
-				# The alias is the last 'word' in the FROM clause
-				foundAlias = fromClause.strip().split()[-1]
-			return foundAlias
 
-		alias = getTableAlias(self.sqlManager._fromClause)
-		if not alias:
-			# Use the old way (pre 2180) of using the Table (DataSource) property.
-			alias = self.Table
+	def setChildFilter(self, fld):
+		"""This method sets the appropriate WHERE filter for dependent child queries."""
+		alias = self._getTableAlias()
 		if not isinstance(fld, (list, tuple)):
 			fld = (fld,)
 		filtExpr = "and".join([" %s.%s = %s " % (alias, fldExpr, self.ParamPlaceholder)
@@ -2853,6 +4766,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self.__auxCursor = self.BackendObject.getCursor(self.__class__)
 		self.__auxCursor.BackendObject = self.BackendObject
 		self.__auxCursor._isAuxiliary = True
+		# Statements run by the aux cursor are reported for the same bizobj.
+		self.__auxCursor._bizobj = self._bizobj
 		if isnew:
 			ac = self.__auxCursor
 			ac._autoPopulatePK = self._autoPopulatePK
@@ -2877,12 +4792,26 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self.__auxCursor.__backend = obj
 
 
+	def _getCacheTTL(self):
+		return self._cacheTTL
+
+	def _setCacheTTL(self, val):
+		self._cacheTTL = val
+
+
 	def _getCurrentSQL(self):
 		if self.UserSQL:
 			return self.UserSQL
 		return self.AutoSQL
 
 
+	def _getDeltaSQL(self):
+		return self._deltaSQL
+
+	def _setDeltaSQL(self, val):
+		self._deltaSQL = val
+
+
 	def _getDescrip(self):
 		return self.__backend.getDescription(self)
 
@@ -2941,6 +4870,21 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			val[idx] = (field_alias, field_type, field_pk, table_name, field_name, field_scale)
 			self._types[field_name] = dabo.db.getPythonType(field_type)
 		self._dataStructure = self.AuxCursor._dataStructure = tuple(val)
+		self._clearFieldConverters()
+
+
+	def _getCompactRecords(self):
+		return self._compactRecords
+
+	def _setCompactRecords(self, val):
+		self._compactRecords = bool(val)
+
+
+	def _getCorrectTypesOnFetch(self):
+		return self._correctTypesOnFetch
+
+	def _setCorrectTypesOnFetch(self, val):
+		self._correctTypesOnFetch = bool(val)
 
 
 	def _getEncoding(self):
@@ -2950,6 +4894,37 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		self.BackendObject.Encoding = val
 
 
+	def _getFetchMode(self):
+		return self._fetchMode
+
+	def _setFetchMode(self, val):
+		val = ustr(val).lower()
+		if val not in ("all", "chunked"):
+			raise ValueError(_("FetchMode must be either 'all' or 'chunked'"))
+		self._fetchMode = val
+
+
+	def _getFetchSize(self):
+		return self._fetchSize
+
+	def _setFetchSize(self, val):
+		val = int(val)
+		if val < 1:
+			raise ValueError(_("FetchSize must be greater than zero"))
+		self._fetchSize = val
+
+
+	def _getFilterIndexes(self):
+		return self._filterIndexes
+
+	def _setFilterIndexes(self, val):
+		val = dict(val or {})
+		for kind in val.values():
+			if kind not in ("hash", "sorted"):
+				raise ValueError(_("Index kind must be 'hash' or 'sorted', not '%s'") % kind)
+		self._filterIndexes = val
+
+
 	def _getIsAdding(self):
 		"""Return True if the current record is a new record."""
 		if self.RowCount <= 0:
@@ -2980,9 +4955,18 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			self._compoundKey = False
 		self.AuxCursor._keyField = self._keyField
 		self.AuxCursor._compoundKey = self._compoundKey
+		self._invalidatePkIndex()
 		self._keyFieldSet = self.AuxCursor._keyFieldSet = (self._hasValidKeyField)
 
 
+	def _getLastModifiedField(self):
+		return self._lastModifiedField
+
+	def _setLastModifiedField(self, val):
+		self._lastModifiedField = val
+		self._deltaWatermark = None
+
+
 	def _getLastSQL(self):
 		try:
 			v = self._lastSQL
@@ -2991,6 +4975,16 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 		return v
 
 
+	def _getNativeTypeFields(self):
+		return self._nativeTypeFields
+
+	def _setNativeTypeFields(self, val):
+		if isinstance(val, basestring):
+			val = [fld.strip() for fld in val.split(",")]
+		self._nativeTypeFields = tuple(val)
+		self._clearFieldConverters()
+
+
 	def _getParamPlaceholder(self):
 		if self._paramPlaceholder:
 			ret = self._paramPlaceholder
@@ -3042,6 +5036,7 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 						if fld[2] ][0]
 			except IndexError:
 				pass
+			self._invalidatePkIndex()
 
 
 	def _getUserSQL(self):
@@ -3058,6 +5053,8 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 	def _setVirtualFields(self, val):
 		assert isinstance(val, dict)
+		if val is not self._virtualFields:
+			self._virtualFieldCache.clear()
 		self._virtualFields = val
 
 
@@ -3078,9 +5075,28 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 	BackendObject = property(_getBackendObject, _setBackendObject, None,
 			_("Returns a reference to the object defining backend-specific behavior (dBackend)"))
 
+	CacheTTL = property(_getCacheTTL, _setCacheTTL, None,
+			_("""Seconds that the rows fetched by requery() are kept in the shared
+			dabo.db.resultCache, so that requerying with the same SQL and parameters
+			within that time doesn't run the query again. Default=None, meaning the
+			cache isn't used.  (int)"""))
+
 	CurrentSQL = property(_getCurrentSQL, None, None,
 			_("Returns the current SQL that will be run, which is one of UserSQL or AutoSQL."))
 
+	CompactRecords = property(_getCompactRecords, _setCompactRecords, None,
+			_("""When True, the rows fetched by a select are stored as compact
+			dCompactRecord objects that share one map of field names, instead of
+			as one dict per row. This takes much less memory for wide result
+			sets; the records still behave like dicts. Takes effect with the
+			next requery. Default=False  (bool)"""))
+
+	CorrectTypesOnFetch = property(_getCorrectTypesOnFetch, _setCorrectTypesOnFetch, None,
+			_("""When True, the field types of the rows are corrected as soon as they
+			are fetched, one column at a time. When False, each row is corrected
+			the first time it is accessed, which is cheaper when only a few of
+			the rows are ever used. Default=False  (bool)"""))
+
 	DataStructure = property(_getDataStructure, _setDataStructure, None,
 			_("""Returns the structure of the cursor in a tuple of 6-tuples.
 
@@ -3099,12 +5115,38 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 
 				"""))
 
+	DeltaSQL = property(_getDeltaSQL, _setDeltaSQL, None,
+			_("""SQL used by requeryDelta() to fetch the rows changed since the
+			last requery. It receives the requery parameters, followed by the
+			highest LastModifiedField value fetched so far, or the time of the
+			last requery if there is no LastModifiedField. When not set, the
+			current SQL is filtered on the LastModifiedField.  (str)"""))
+
 	Encoding = property(_getEncoding, _setEncoding, None,
 			_("Encoding type used by the Backend  (string)"))
 
 	FieldDescription = property(_getDescrip, None, None,
 			_("Tuple of field names and types, as returned by the backend  (tuple)"))
 
+	FetchMode = property(_getFetchMode, _setFetchMode, None,
+			_("""Determines how the rows of a select are retrieved from the backend.
+			With 'all' (default), the whole result set is fetched by execute().
+			With 'chunked', only the first FetchSize rows are fetched; more rows are
+			fetched as navigation, sorting, filtering or getDataSet() need them, or
+			when fetchMore() or fetchRemaining() is called. Note that some backend
+			drivers buffer the entire result set on the client regardless.  (str)"""))
+
+	FetchSize = property(_getFetchSize, _setFetchSize, None,
+			_("Number of rows fetched at a time when FetchMode is 'chunked'. Default=5000  (int)"))
+
+	FilterIndexes = property(_getFilterIndexes, _setFilterIndexes, None,
+			_("""Dict mapping field names to the kind of index, 'hash' or 'sorted',
+			that filter() keeps for them, so that the matching rows are looked up
+			instead of comparing the value of every row. Hash indexes serve the
+			eq, ne and in operators; sorted ones also serve the range operators
+			and startswith. The indexes are built on first use, and rebuilt
+			after the rows change. Default={}  (dict)"""))
+
 	IsAdding = property(_getIsAdding, None, None,
 			_("Returns True if the current record is new and unsaved"))
 
@@ -3112,6 +5154,11 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			_("""Returns True if this cursor is used for managing internal
 			Dabo preferences and settings. Default=False.  (bool)"""))
 
+	LastModifiedField = property(_getLastModifiedField, _setLastModifiedField, None,
+			_("""Name of the field holding the time each row was last changed. It
+			lets requeryDelta() fetch only the rows changed since the last
+			requery. The field must be part of the query.  (str)"""))
+
 	LastSQL = property(_getLastSQL, None, None,
 			_("Returns the last executed SQL statement."))
 
@@ -3119,6 +5166,13 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			_("""Name of field that is the PK. If multiple fields make up the key,
 			separate the fields with commas. (str)"""))
 
+	NativeTypeFields = property(_getNativeTypeFields, _setNativeTypeFields, None,
+			_("""Names of the fields whose values the backend already returns as the
+			correct Python type, such as numeric and date columns with most
+			backends. Their values are never type-corrected, which saves time
+			when fetching large result sets. Can be set to a comma-separated
+			string.  (tuple)"""))
+
 	ParamPlaceholder = property(_getParamPlaceholder, None, None,
 			_("""The character(s) used to indicate a parameter in an SQL statement.
 			This can be different for different backend systems. Read-only.  (str)"""))
@@ -3143,4 +5197,24 @@ xsi:noNamespaceSchemaLocation = "http://dabodev.com/schema/dabocursor.xsd">
 			_("""A dictionary mapping virtual_field_name to a function to call.
 
 			The specified function will be called when getFieldVal() is called on
-			the specified field name."""))
+			the specified field name. Instead of the function, the value can be a
+			dict with these keys:
+
+				func: the function to call
+				requery_children: when True, the child bizobjs are requeried for
+					the row before the function is called. Default=False
+				batch: when True, the function computes the values of many rows
+					in one call. It is passed one list per field of the rows in
+					'depends_on', holding that field's values, or a dDataSet of
+					the rows if 'depends_on' names none, and must return a sequence with a
+					value for each row. Batch values are always cached. Default=False
+				cache: when True, the value returned for each row is remembered
+					until something it depends on changes. Default=False
+				depends_on: the fields that the cached value is computed from,
+					and the DataSource of any child bizobj whose rows it uses.
+					Setting one of those fields, or changing the child's rows,
+					discards the value for the row. Without this list, a change
+					to any field of the row discards it.
+
+			All cached values are discarded when the data set is requeried. Call
+			clearVirtualFieldCache() when a value depends on anything else."""))
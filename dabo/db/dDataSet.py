@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 import sys
-import re
 import operator
 import datetime
-import hashlib
+import itertools
+from bisect import bisect_left, bisect_right
 
 from decimal import Decimal
 try:
@@ -26,6 +26,141 @@ pysqlite2: http://initd.org/tracker/pysqlite
 import dabo
 from dabo.dLocalize import _
 from dabo.lib.utils import ustr
+from dabo.db import dDataSetQuery
+from dabo.db import dExpressions
+
+# Identifies each data set, for telling which one a SQLite table was loaded from.
+_serials = itertools.count(1)
+
+
+def _typeFamily(typ):
+	"""Returns the group of types that values of the type can be ordered among."""
+	if typ is type(None):
+		return None
+	if issubclass(typ, (int, long, float, Decimal)):
+		return "number"
+	if issubclass(typ, datetime.datetime):
+		return datetime.datetime
+	return typ
+
+
+
+class _FieldIndex(object):
+	"""Indexes the values of one field of a data set by row position, for
+	dDataSet.filter(). A 'hash' index answers the eq, ne and in operators; a
+	'sorted' one also answers the range operators and startswith. The index is
+	built when first used, and rebuilt when the data set has been changed.
+	"""
+	def __init__(self, field, kind):
+		self.field = field
+		self.kind = kind
+		# The version of the data set the index was built for.
+		self.version = None
+		self.usable = False
+
+
+	def build(self, ds):
+		self.version = ds._version
+		self.usable = False
+		self.count = len(ds)
+		fld = self.field
+		try:
+			vals = [rec[fld] for rec in ds]
+			if self.kind == "hash":
+				self.hashed = hashed = {}
+				for pos, val in enumerate(vals):
+					hashed.setdefault(val, []).append(pos)
+			else:
+				families = set(_typeFamily(typ) for typ in set(map(type, vals)))
+				families.discard(None)
+				if len(families) > 1:
+					# Mixed types don't have an order that matches the filter's
+					# comparisons.
+					return
+				self.family = families.pop() if families else None
+				if self.family == "number":
+					# Comparing floats is much faster than comparing Decimals, and
+					# gives the same order, except among values that convert to the
+					# same float, which are then put in order themselves.
+					floats = [val if val is None else float(val) for val in vals]
+					order = sorted(xrange(len(vals)), key=floats.__getitem__)
+					self.positions = []
+					for key, group in itertools.groupby(order, floats.__getitem__):
+						group = list(group)
+						if len(group) > 1:
+							group.sort(key=vals.__getitem__)
+						self.positions.extend(group)
+				else:
+					self.positions = sorted(xrange(len(vals)), key=vals.__getitem__)
+				self.keys = [vals[pos] for pos in self.positions]
+		except (KeyError, TypeError):
+			# Missing fields, or values that can't be hashed or ordered; the
+			# filter will scan the records instead.
+			return
+		self.usable = True
+
+
+	def lookup(self, op, expr):
+		"""Returns the positions of the rows for which the filter operator is
+		true, in any order, or None if the index can't tell.
+		"""
+		if op == "ne":
+			matches = self.lookup("eq", expr)
+			if matches is None:
+				return None
+			matches = set(matches)
+			return [pos for pos in xrange(self.count) if pos not in matches]
+		if op == "in":
+			try:
+				vals = set(expr)
+			except TypeError:
+				return None
+			ret = []
+			for val in vals:
+				matches = self.lookup("eq", val)
+				if matches is None:
+					return None
+				ret.extend(matches)
+			return ret
+		if self.kind == "hash":
+			if op != "eq":
+				return None
+			try:
+				return self.hashed.get(expr, [])
+			except TypeError:
+				return None
+		family = _typeFamily(type(expr))
+		if family is not None and self.family not in (None, family):
+			return None
+		keys, positions = self.keys, self.positions
+		if op == "eq":
+			return positions[bisect_left(keys, expr):bisect_right(keys, expr)]
+		if op == "gt":
+			return positions[bisect_right(keys, expr):]
+		if op == "gte":
+			return positions[bisect_left(keys, expr):]
+		if op == "lt":
+			return positions[:bisect_left(keys, expr)]
+		if op == "lte":
+			return positions[:bisect_right(keys, expr)]
+		if op == "startswith":
+			if not isinstance(expr, basestring) or family is None:
+				return None
+			if not expr:
+				# NULLs count as empty strings, and everything starts with ''.
+				return positions
+			start = end = bisect_left(keys, expr)
+			while end < len(keys) and keys[end].startswith(expr):
+				end += 1
+			return positions[start:end]
+		return None
+
+
+# The filter() operators that indexes can answer.
+_indexOps = {"eq": "eq", "=": "eq", "equals": "eq", "ne": "ne", "!=": "ne",
+		"nequals": "ne", "gt": "gt", ">": "gt", "gte": "gte", ">=": "gte", "lt": "lt",
+		"<": "lt", "lte": "lte", "<=": "lte", "startswith": "startswith",
+		"beginswith": "startswith", "in": "in"}
 
 
 
@@ -35,7 +170,12 @@ class dDataSet(tuple):
 	This is the data structure returned by the dCursorMixin class.
 
 	It is used to give these data sets the ability to be queried, joined, etc.
-	This is accomplished by using SQLite in-memory databases. If SQLite
+	Simple selects are run directly on the records (see dDataSetQuery); all
+	other statements use SQLite in-memory databases. The SQLite copy of the
+	rows is kept between statements and only the rows marked with
+	markChanged() are written to it again, so code that changes the records
+	in place must call markChanged(), as replace() and the cursor owning the
+	records do; otherwise SQLite keeps seeing the old values. If SQLite
 	and pysqlite2 are not installed on the machine this is run on, a
 	warning message will be printed out and the SQL functions will return
 	None. The data will still be usable, though.
@@ -51,13 +191,35 @@ class dDataSet(tuple):
 		self._typeStructure = {}
 		# We may need to encode fields that are not legal names.
 		self.fieldAliases = {}
-		# Keep a hash value to tell if we need to re-populate
-		self._dataHash = ""
+		# Bumped by markChanged() whenever rows are changed in place, so that
+		# the SQLite tables holding a copy of the rows can be brought up to date
+		# without comparing all the data.
+		self._version = 0
+		# Maps the rows changed in place to the version they last changed in.
+		# Changes to all the rows only set _allRowsVersion.
+		self._rowVersions = {}
+		self._allRowsVersion = 0
+		self._serial = next(_serials)
+		# Maps each alias loaded into this data set's SQLite connection to the
+		# (serial, version, fields) of the data set it holds.
+		self._tables = {}
+		self._useQueryPlanner = True
+		self._lastQueryPath = None
+		# Set once a statement that changes the SQLite copy of the rows has
+		# been run, as the records no longer match it.
+		self._sqliteOnly = False
 
 		sqlite.register_adapter(Decimal, self._adapt_decimal)
 		# When filtering datasets, we need a reference to the dataset
 		# this dataset was derived from.
 		self._sourceDataSet = None
+		# Filtered data sets hold the positions of their rows in the data set
+		# the filters started from, so that stacked filters can narrow them
+		# down using the indexes of that data set.
+		self._selection = None
+		self._selectionBase = None
+		# Maps field names to their _FieldIndex objects.
+		self._indexes = {}
 
 		# Register the converters
 		sqlite.register_converter("decimal", self._convert_decimal)
@@ -105,6 +267,28 @@ class dDataSet(tuple):
 		return None
 
 
+	def markChanged(self, rows=None):
+		"""Records that the values of the passed row numbers, or of all the
+		rows if none are passed, were changed in place, so that the next
+		execute() updates its copy of them. This is done by replace() and by
+		the cursor that owns the records; code that changes the records of a
+		data set directly should call it as well.
+		"""
+		self._version += 1
+		if rows is None:
+			self._allRowsVersion = self._version
+			self._rowVersions.clear()
+		else:
+			if isinstance(rows, (int, long)):
+				rows = (rows,)
+			for row in rows:
+				self._rowVersions[row] = self._version
+		if self._sourceDataSet is not None:
+			# The records are shared with the data set this one was filtered
+			# from, where they are at other positions.
+			self._sourceDataSet.markChanged()
+
+
 	def replace(self, field, valOrExpr, scope=None):
 		"""Replaces the value of the specified field with the given expression.
 
@@ -113,27 +297,26 @@ class dDataSet(tuple):
 
 		Scope is a boolean expression.
 		"""
+		if not self:
+			return
+		# The scope and value expressions are compiled once, and run over all
+		# the records in a single pass.
+		flds = list(self[0])
+		rows = None
+		recs = self
 		if scope is not None:
-			scope = self._fldReplace(scope, "rec")
-
-		literal = True
-		if isinstance(valOrExpr, basestring):
-			if valOrExpr.strip()[0] == "=":
-				literal = False
-				valOrExpr = valOrExpr.replace("=", "", 1)
-			valOrExpr = self._fldReplace(valOrExpr, "rec")
-		if literal:
-			upDict = {field: valOrExpr}
-			if scope is None:
-				[rec.update(upDict) for rec in self]
-			else:
-				[rec.update(upDict) for rec in self
-						if eval(scope)]
+			rows = dExpressions.matchingRows(self, scope, flds, globals(), self)
+			recs = [self[row] for row in rows]
+
+		if isinstance(valOrExpr, basestring) and valOrExpr.strip()[:1] == "=":
+			expr = valOrExpr.replace("=", "", 1)
+			vals = dExpressions.evaluateRecords(recs, expr, flds, globals(), self)
+			for rec, val in zip(recs, vals):
+				rec[field] = val
 		else:
-			# Need to go record-by-record so that the expression evaluates correctly
-			for rec in self:
-				if eval(scope):
-					rec[field] = eval(valOrExpr)
+			for rec in recs:
+				rec[field] = valOrExpr
+		self.markChanged(rows)
 
 
 	def sort(self, col, ascdesc=None, caseSensitive=None):
@@ -151,7 +334,7 @@ class dDataSet(tuple):
 		return ret
 
 
-	def filter(self, fld, expr, op="="):
+	def filter(self, fld, expr, op="=", values=None):
 		"""This takes a field name, an expression, and an optional operator,
 		and returns a dataset that is filtered on that field by that expression.
 		If the operator is specified, it will be used literally in the evaluation
@@ -166,11 +349,21 @@ class dDataSet(tuple):
 			startswith, beginswith: fld.startswith(expr)
 			endswith: fld.endswith(expr)
 			contains: expr in fld
+			in: fld in expr
+		The values compared can be passed in 'values', one per row, for fields
+		that aren't stored in the records, such as virtual fields.
+
+		When the field has an index (see addIndex()), the matching rows are
+		looked up in it instead of comparing the value of every row.
 		"""
 		if not self:
 			# No rows, so nothing to filter
 			return self
 		op = op.strip().lower()
+		if values is None:
+			rows = self._indexedFilter(fld, expr, _indexOps.get(op))
+			if rows is not None:
+				return self._makeFiltered(rows, fld, expr, op)
 		opDict = {"eq": operator.eq,
 				"=": operator.eq,
 				"equals": operator.eq,
@@ -189,19 +382,61 @@ class dDataSet(tuple):
 			fnc = opDict[op]
 		except KeyError:
 			fnc = None
+		if values is None:
+			values = [rec[fld] for rec in self]
+		pairs = enumerate(values)
 		if fnc:
-			filtered = [rec for rec in self if fnc(rec[fld], expr)]
+			rows = [row for row, val in pairs if fnc(val, expr)]
 		elif op in ("startswith", "beginswith"):
-			filtered = [rec for rec in self if (rec[fld] or "").startswith(expr)]
+			rows = [row for row, val in pairs if (val or "").startswith(expr)]
 		elif op == "endswith":
-			filtered = [rec for rec in self if (rec[fld] or "").endswith(expr)]
+			rows = [row for row, val in pairs if (val or "").endswith(expr)]
 		elif op == "contains":
-			filtered = [rec for rec in self if expr in (rec[fld] or "")]
-		ret = self.__class__(filtered)
+			rows = [row for row, val in pairs if expr in (val or "")]
+		elif op == "in":
+			rows = [row for row, val in pairs if val in expr]
+		return self._makeFiltered(rows, fld, expr, op)
+
+
+	def _indexedFilter(self, fld, expr, op):
+		"""Returns the positions in this data set of the rows for which the
+		filter operator is true, using the index of the field in the data set
+		the filters started from. Returns None if there is no index that can
+		answer the filter.
+		"""
+		base = self._selectionBase or self
+		index = base._indexes.get(fld)
+		if index is None or op is None:
+			return None
+		if index.version != base._version:
+			index.build(base)
+		if not index.usable:
+			return None
+		matches = index.lookup(op, expr)
+		if matches is None:
+			return None
+		if self._selection is None:
+			return sorted(matches)
+		# Narrow down the rows of this data set, keeping their order.
+		matches = set(matches)
+		return [row for row, pos in enumerate(self._selection) if pos in matches]
+
+
+	def _makeFiltered(self, rows, fld=None, expr=None, op=None):
+		"""Returns the filtered data set holding the passed rows of this one."""
+		ret = self.__class__([self[row] for row in rows])
 		ret._sourceDataSet = self
-		ret._filtered_fld = fld
-		ret._filtered_expr = expr
-		ret._filtered_op = op
+		if self._selection is None:
+			ret._selectionBase = self
+			ret._selection = rows
+		else:
+			ret._selectionBase = self._selectionBase
+			selection = self._selection
+			ret._selection = [selection[row] for row in rows]
+		if fld is not None:
+			ret._filtered_fld = fld
+			ret._filtered_expr = expr
+			ret._filtered_op = op
 		return ret
 
 
@@ -210,11 +445,31 @@ class dDataSet(tuple):
 		if not self:
 			# No rows, so nothing to filter
 			return self
-		stmnt = """ [rec for rec in self if %s] """ % self._fldReplace(expr, "rec")
-		recs = eval(stmnt)
-		ret = self.__class__(recs)
-		ret._sourceDataSet = self
-		return ret
+		rows = dExpressions.matchingRows(self, expr, list(self[0]), globals(), self)
+		return self._makeFiltered(rows)
+
+
+	def addIndex(self, fld, kind="hash"):
+		"""Indexes the values of the field, so that filter() can look up the
+		matching rows instead of comparing every row. A 'hash' index serves the
+		eq, ne and in operators; a 'sorted' one serves those as well as the
+		range operators and startswith. The index belongs to the data set the
+		filters start from, so it also serves filters stacked on top of one
+		another. It is built the first time it is used, and again after the
+		rows have been changed.
+		"""
+		if kind not in ("hash", "sorted"):
+			raise ValueError(_("Index kind must be 'hash' or 'sorted', not '%s'") % kind)
+		base = self._selectionBase or self
+		index = base._indexes.get(fld)
+		if index is None or index.kind != kind:
+			base._indexes[fld] = _FieldIndex(fld, kind)
+
+
+	def removeIndex(self, fld):
+		"""Discards the index on the field added by addIndex(), if any."""
+		base = self._selectionBase or self
+		base._indexes.pop(fld, None)
 
 
 	def removeFilter(self):
@@ -247,15 +502,9 @@ class dDataSet(tuple):
 			self._fldReplace("price > 50", "foo")
 				=> returns "foo['price'] > 50"
 		"""
-		patTemplate = r"\b%s\b"
-		ret = expr
 		if dictName is None:
 			dictName = "rec"
-		for kk in self[0]:
-			pat = patTemplate % kk
-			replacement = "%s['%s']" % (dictName, kk)
-			ret = re.sub(pat, replacement, ret)
-		return ret
+		return dExpressions.rewrite(expr, self[0], lambda fld: "%s[%r]" % (dictName, fld))
 
 
 	def _makeCreateTable(self, ds, alias=None):
@@ -296,6 +545,10 @@ class dDataSet(tuple):
 	def _populate(self, ds, alias=None):
 		"""This is the method that converts a Python dataset
 		into a SQLite table with the name specified by 'alias'.
+
+		The table is kept between calls. If the data set has changed since it
+		was loaded, only the rows marked as changed with markChanged() are
+		written again, unless all of them were.
 		"""
 		if alias is None:
 			# Use the default
@@ -305,31 +558,46 @@ class dDataSet(tuple):
 			dabo.log.info(_("Cannot populate without data for alias '%s'")
 					% alias)
 			return None
-		hs = hashlib.md5(ustr(ds)).hexdigest()
-		if hs == ds._dataHash:
-			# Data's already there and hasn't changed; no need to re-load it
-			return
-		ds._dataHash = hs
-		if ds._populated:
-			# Clear out the old records
-			self._cursor.execute("delete from %s" % alias)
-		else:
-			# Create the table
-			self._cursor.execute(self._makeCreateTable(ds, alias))
+		flds = list(ds[0])
+		state = self._tables.get(alias)
+		if state is not None and state[0] == ds._serial and state[2] == flds:
+			version = state[1]
+			if version == ds._version:
+				# Data's already there and hasn't changed; no need to re-load it
+				return
+			if ds._allRowsVersion <= version:
+				rows = [row for row, rowVersion in ds._rowVersions.iteritems()
+						if rowVersion > version]
+				self._insertRows(ds, alias, flds, rows)
+				self._tables[alias] = (ds._serial, ds._version, flds)
+				return
+		# (Re)create the table, as its columns may have changed.
+		self._cursor.execute("drop table if exists %s" % alias)
+		self._cursor.execute(self._makeCreateTable(ds, alias))
+		self._insertRows(ds, alias, flds)
+		self._tables[alias] = (ds._serial, ds._version, flds)
+		if ds is self:
+			self._populated = True
+
 
+	def _insertRows(self, ds, alias, flds, rows=None):
+		"""Writes the passed rows of 'ds', or all of them, to the table. Each
+		row is stored under its position as the SQLite rowid, so that changed
+		rows replace their old versions.
+		"""
 		# Fields may contain illegal names. This will correct them
-		flds = [fld.replace("dabo-", "dabo_") for fld in ds[0]]
-		fldParams = [":%s" % fld for fld in flds]
-		insStmnt = "insert into %s (%s) values (%s)" % (alias,
-				", ".join(flds), ", ".join(fldParams))
+		colNames = [fld.replace("dabo-", "dabo_") for fld in flds]
+		insStmnt = "insert or replace into %s (rowid, %s) values (?%s)" % (alias,
+				", ".join(colNames), ", ?" * len(colNames))
+		if rows is None:
+			rows = xrange(len(ds))
 
-		def recGenerator(ds):
-			for rec in ds:
-				yield rec
+		def paramGenerator():
+			for row in rows:
+				rec = ds[row]
+				yield [row + 1] + [rec[fld] for fld in flds]
 
-		self._cursor.executemany(insStmnt, recGenerator(ds))
-		if ds is self:
-			self._populated = True
+		self._cursor.executemany(insStmnt, paramGenerator())
 
 
 	def execute(self, sqlExpr, params=(), cursorDict=None):
@@ -347,7 +615,27 @@ class dDataSet(tuple):
 		additional DataSet objects in a dictionary, where the value is the
 		DataSet, and the key is the alias used to reference that DataSet
 		in your join statement.
+
+		Selects that dDataSetQuery understands are always run on the records
+		themselves, without loading them into SQLite; LastQueryPath tells which
+		way the statement was run. Their values are returned as they
+		are stored, rather than as converted by SQLite, so text stays unicode
+		and booleans stay booleans.
 		"""
+		if params and not isinstance(params, tuple):
+			params = (params,)
+		if self._useQueryPlanner and not self._sqliteOnly and self:
+			tables = {"dataset": self}
+			if cursorDict is not None:
+				tables.update(cursorDict)
+			try:
+				recs = dDataSetQuery.run(sqlExpr, params, tables)
+			except dDataSetQuery.QueryNotSupported:
+				pass
+			else:
+				self._lastQueryPath = "python"
+				return dDataSet(recs)
+
 		def dict_factory(cursor, row):
 			dd = {}
 			for idx, col in enumerate(cursor.description):
@@ -388,8 +676,7 @@ class dDataSet(tuple):
 				self._populate(ds, alias)
 
 		# We have a table now with the necessary data. Run the query!
-		if params and not isinstance(params, tuple):
-			params = (params,)
+		self._lastQueryPath = "sqlite"
 		self._cursor.execute(sqlExpr, params)
 
 # 		et = time.clock()
@@ -399,6 +686,7 @@ class dDataSet(tuple):
 		# nothing. In those cases, we need to run a 'select *' to get the
 		# modified data set.
 		if not sqlExpr.lower().strip().startswith("select "):
+			self._sqliteOnly = True
 			self._cursor.execute("select * from dataset")
 		tmpres = self._cursor.fetchall()
 
@@ -454,6 +742,10 @@ class dDataSet(tuple):
 			ret = ret._sourceDataSet
 		return ret
 
+	def _getLastQueryPath(self):
+		return self._lastQueryPath
+
+
 	def _getTypeStructure(self):
 		return self._typeStructure
 
@@ -461,6 +753,13 @@ class dDataSet(tuple):
 		self._typeStructure = val
 
 
+	def _getUseQueryPlanner(self):
+		return self._useQueryPlanner
+
+	def _setUseQueryPlanner(self, val):
+		self._useQueryPlanner = bool(val)
+
+
 	Bizobj = property(_getBizobj, _setBizobj, None,
 			_("Reference to the bizobj that 'owns' this data set. Default=None  (bizobj)"))
 
@@ -470,12 +769,21 @@ class dDataSet(tuple):
 	Encoding = property(_getEncoding, _setEncoding, None,
 			_("The encoding used for data in the dataset.  (str)"))
 
+	LastQueryPath = property(_getLastQueryPath, None, None,
+			_("""How the last statement passed to execute() was run: 'python' if it
+			was run on the records by dDataSetQuery, 'sqlite' if it was run by
+			SQLite, or None before the first one.  (str)"""))
+
 	UnfilteredDataSet = property(_getUnfilteredDataSet, None, None,
 			_("""If filters have been applied, returns the unfiltered dataset that would be returned if removeFilters() had been called. If no filters have been applied, returns self  (dDataSet)"""))
 
 	TypeStructure = property(_getTypeStructure, _setTypeStructure, None,
 			_("""An optional helper dictionary matching field names to dabo data types."""))
 
+	UseQueryPlanner = property(_getUseQueryPlanner, _setUseQueryPlanner, None,
+			_("""When True (default), execute() runs the selects it can on the
+			records themselves instead of loading them into SQLite.  (bool)"""))
+
 
 
 # class DataSetOld(tuple):
@@ -0,0 +1,844 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the common subset of SQL used on dDataSet objects directly on their
+records, instead of loading them into SQLite first::
+
+	select <columns> from <table> [[as] <alias>]
+		[[inner | left [outer]] join <table> [[as] <alias>] on <column> = <column>] ...
+		[where <condition>]
+		[group by <column>, ...]
+		[order by <column, alias or position> [asc | desc], ...]
+		[limit <count> [offset <skip>]]
+
+The columns can be '*', column references, and the count(), sum(), avg(),
+min() and max() aggregates, each with an optional 'as' name. Conditions
+combine comparisons between columns, literals and '?' parameters, 'is [not]
+null', '[not] in (...)' and '[not] between ... and ...' with 'and', 'or',
+'not' and parentheses, following the SQL rules for NULLs.
+
+run() raises QueryNotSupported for anything else, and also when values of
+different types have to be compared, since SQLite would convert them
+according to the column types. The caller is expected to run the statement
+through SQLite in that case.
+
+The values returned are the ones stored in the data sets, rather than their
+conversions by SQLite; aggregates of Decimal values are floats, as they are
+in SQLite.
+"""
+import operator
+import re
+from decimal import Decimal
+
+
+
+class QueryNotSupported(Exception):
+	"""Raised for statements that have to be run by SQLite."""
+	pass
+
+
+
+_tokenPat = re.compile(r"""\s*(?:
+		(?P<num>(?:\d+\.\d*|\.\d+|\d+)(?![A-Za-z_0-9]))
+		|(?P<str>'(?:[^']|'')*')
+		|(?P<name>[A-Za-z_][A-Za-z_0-9]*)
+		|(?P<op><=|>=|<>|!=|==|[-=<>(),.*?])
+		)""", re.X)
+_keywords = frozenset(("select", "from", "where", "group", "by", "order", "limit",
+		"offset", "join", "inner", "left", "outer", "on", "and", "or", "not", "is",
+		"null", "as", "asc", "desc", "in", "between", "having", "union", "distinct",
+		"all", "like", "glob", "cross", "natural", "using", "case", "when", "then",
+		"else", "end", "exists", "intersect", "except", "right", "full", "escape",
+		"collate", "match", "regexp"))
+_aggregates = frozenset(("count", "sum", "avg", "min", "max"))
+_compareOps = {"=": operator.eq, "==": operator.eq, "!=": operator.ne,
+		"<>": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt,
+		">=": operator.ge}
+_numericTypes = (int, long, float, Decimal)
+
+
+def _tokenize(sql):
+	"""Returns a list of (kind, value, start, end) tuples for the statement."""
+	ret = []
+	pos = 0
+	end = len(sql)
+	while True:
+		mtch = _tokenPat.match(sql, pos)
+		if not mtch:
+			if sql[pos:].strip():
+				raise QueryNotSupported("Can't parse %r" % sql[pos:pos + 20])
+			break
+		kind = mtch.lastgroup
+		text = mtch.group(kind)
+		if kind == "num":
+			if "." in text:
+				value = float(text)
+			else:
+				value = int(text)
+		elif kind == "str":
+			value = text[1:-1].replace("''", "'")
+			if isinstance(value, str):
+				value = value.decode("utf-8")
+		elif kind == "name":
+			value = text.lower()
+		else:
+			value = text
+		ret.append((kind, value, mtch.start(kind), mtch.end(kind)))
+		pos = mtch.end()
+		if pos >= end:
+			break
+	ret.append(("end", None, end, end))
+	return ret
+
+
+
+class _Parser(object):
+	"""Parses a statement into a dict describing the query."""
+	def __init__(self, sql):
+		self.sql = sql
+		self.tokens = _tokenize(sql)
+		self.pos = 0
+		self.paramCount = 0
+
+
+	def peek(self, offset=0):
+		return self.tokens[self.pos + offset]
+
+
+	def next(self):
+		tok = self.tokens[self.pos]
+		self.pos += 1
+		return tok
+
+
+	def isKeyword(self, word, offset=0):
+		tok = self.peek(offset)
+		return tok[0] == "name" and tok[1] == word
+
+
+	def acceptKeyword(self, word):
+		if self.isKeyword(word):
+			self.pos += 1
+			return True
+		return False
+
+
+	def expectKeyword(self, word):
+		if not self.acceptKeyword(word):
+			raise QueryNotSupported("Expected '%s'" % word)
+
+
+	def acceptOp(self, op):
+		tok = self.peek()
+		if tok[0] == "op" and tok[1] == op:
+			self.pos += 1
+			return True
+		return False
+
+
+	def expectOp(self, op):
+		if not self.acceptOp(op):
+			raise QueryNotSupported("Expected '%s'" % op)
+
+
+	def name(self):
+		tok = self.next()
+		if tok[0] != "name" or tok[1] in _keywords:
+			raise QueryNotSupported("Expected a name")
+		return tok[1]
+
+
+	def parse(self):
+		self.expectKeyword("select")
+		query = {"columns": self.columns()}
+		self.expectKeyword("from")
+		query["tables"] = [self.tableRef()]
+		query["joins"] = []
+		while True:
+			outer = False
+			if self.acceptKeyword("left"):
+				outer = True
+				self.acceptKeyword("outer")
+				self.expectKeyword("join")
+			elif self.acceptKeyword("inner"):
+				self.expectKeyword("join")
+			elif not self.acceptKeyword("join"):
+				break
+			query["tables"].append(self.tableRef())
+			self.expectKeyword("on")
+			left = self.columnRef()
+			if not (self.acceptOp("=") or self.acceptOp("==")):
+				raise QueryNotSupported("Only equi-joins are supported")
+			right = self.columnRef()
+			query["joins"].append((outer, left, right))
+		query["where"] = None
+		if self.acceptKeyword("where"):
+			query["where"] = self.condition()
+		query["groupBy"] = []
+		if self.acceptKeyword("group"):
+			self.expectKeyword("by")
+			query["groupBy"].append(self.columnRef())
+			while self.acceptOp(","):
+				query["groupBy"].append(self.columnRef())
+		query["orderBy"] = []
+		if self.acceptKeyword("order"):
+			self.expectKeyword("by")
+			query["orderBy"].append(self.orderItem())
+			while self.acceptOp(","):
+				query["orderBy"].append(self.orderItem())
+		query["limit"] = query["offset"] = None
+		if self.acceptKeyword("limit"):
+			query["limit"] = self.countValue()
+			if self.acceptKeyword("offset"):
+				query["offset"] = self.countValue()
+			elif self.acceptOp(","):
+				# 'limit <skip>, <count>'
+				query["offset"] = query["limit"]
+				query["limit"] = self.countValue()
+		if self.peek()[0] != "end":
+			raise QueryNotSupported("Unexpected %r" % (self.peek()[1],))
+		return query
+
+
+	def columns(self):
+		if self.acceptOp("*"):
+			return None
+		ret = [self.column()]
+		while self.acceptOp(","):
+			ret.append(self.column())
+		return ret
+
+
+	def column(self):
+		start = self.peek()[2]
+		tok = self.peek()
+		if tok[0] == "name" and tok[1] in _aggregates and self.peek(1)[1] == "(":
+			self.pos += 2
+			func = tok[1]
+			if self.acceptOp("*"):
+				if func != "count":
+					raise QueryNotSupported("Only count() accepts '*'")
+				arg = None
+			else:
+				arg = self.columnRef()
+			self.expectOp(")")
+			expr = ("agg", func, arg)
+		else:
+			expr = self.columnRef()
+		end = self.tokens[self.pos - 1][3]
+		alias = None
+		if self.acceptKeyword("as"):
+			alias = self.name()
+		elif self.peek()[0] == "name" and self.peek()[1] not in _keywords:
+			alias = self.name()
+		if alias is not None:
+			# Names are returned as written.
+			alias = self.sql[self.tokens[self.pos - 1][2]:self.tokens[self.pos - 1][3]]
+		return (expr, alias, self.sql[start:end])
+
+
+	def columnRef(self):
+		first = self.name()
+		if self.acceptOp("."):
+			return ("col", first, self.name())
+		return ("col", None, first)
+
+
+	def tableRef(self):
+		table = self.name()
+		alias = table
+		if self.acceptKeyword("as"):
+			alias = self.name()
+		elif self.peek()[0] == "name" and self.peek()[1] not in _keywords:
+			alias = self.name()
+		return (table, alias)
+
+
+	def orderItem(self):
+		tok = self.peek()
+		if tok[0] == "num" and isinstance(tok[1], int):
+			self.pos += 1
+			expr = ("position", tok[1])
+		else:
+			expr = self.columnRef()
+		desc = False
+		if self.acceptKeyword("desc"):
+			desc = True
+		else:
+			self.acceptKeyword("asc")
+		return (expr, desc)
+
+
+	def countValue(self):
+		tok = self.next()
+		if tok[0] == "num" and isinstance(tok[1], int):
+			return ("lit", tok[1])
+		if tok[0] == "op" and tok[1] == "?":
+			self.paramCount += 1
+			return ("param", self.paramCount - 1)
+		if tok[0] == "op" and tok[1] == "-" and self.peek()[0] == "num":
+			return ("lit", -self.next()[1])
+		raise QueryNotSupported("Expected a number")
+
+
+	def condition(self):
+		terms = [self.andCondition()]
+		while self.acceptKeyword("or"):
+			terms.append(self.andCondition())
+		if len(terms) == 1:
+			return terms[0]
+		return ("or", terms)
+
+
+	def andCondition(self):
+		terms = [self.notCondition()]
+		while self.acceptKeyword("and"):
+			terms.append(self.notCondition())
+		if len(terms) == 1:
+			return terms[0]
+		return ("and", terms)
+
+
+	def notCondition(self):
+		if self.acceptKeyword("not"):
+			return ("not", self.notCondition())
+		if self.acceptOp("("):
+			ret = self.condition()
+			self.expectOp(")")
+			return ret
+		left = self.operand()
+		tok = self.peek()
+		if tok[0] == "op" and tok[1] in _compareOps:
+			self.pos += 1
+			return ("cmp", _compareOps[tok[1]], left, self.operand())
+		if self.acceptKeyword("is"):
+			negate = self.acceptKeyword("not")
+			self.expectKeyword("null")
+			return ("isnull", left, negate)
+		negate = self.acceptKeyword("not")
+		if self.acceptKeyword("in"):
+			self.expectOp("(")
+			items = [self.operand()]
+			while self.acceptOp(","):
+				items.append(self.operand())
+			self.expectOp(")")
+			return ("in", left, items, negate)
+		if self.acceptKeyword("between"):
+			low = self.operand()
+			self.expectKeyword("and")
+			high = self.operand()
+			return ("between", left, low, high, negate)
+		raise QueryNotSupported("Unsupported condition")
+
+
+	def operand(self):
+		tok = self.peek()
+		if tok[0] in ("num", "str"):
+			self.pos += 1
+			return ("lit", tok[1])
+		if tok[0] == "op":
+			if tok[1] == "?":
+				self.pos += 1
+				self.paramCount += 1
+				return ("param", self.paramCount - 1)
+			if tok[1] == "-" and self.peek(1)[0] == "num":
+				self.pos += 2
+				return ("lit", -self.peek(-1)[1])
+			raise QueryNotSupported("Unsupported operand")
+		if self.acceptKeyword("null"):
+			return ("lit", None)
+		return self.columnRef()
+
+
+
+def _coerce(a, b):
+	"""
+	Returns the two values in a form that Python compares the way SQLite
+	does, or raises QueryNotSupported if SQLite would convert one of them.
+	"""
+	if isinstance(a, _numericTypes) and isinstance(b, _numericTypes):
+		if isinstance(a, float) and isinstance(b, Decimal) or (
+				isinstance(a, Decimal) and isinstance(b, float)):
+			# SQLite compares Decimals as floats, which Python doesn't.
+			raise QueryNotSupported("Decimal compared with float")
+		return a, b
+	if isinstance(a, basestring) and isinstance(b, basestring):
+		# SQLite compares the UTF-8 bytes, which sort like the code points.
+		try:
+			if isinstance(a, str):
+				a = a.decode("utf-8")
+			if isinstance(b, str):
+				b = b.decode("utf-8")
+		except UnicodeError:
+			raise QueryNotSupported("Undecodable text")
+		return a, b
+	raise QueryNotSupported("Can't compare %s with %s" % (type(a).__name__,
+			type(b).__name__))
+
+
+def _compare(op, a, b):
+	"""Compares two values with SQL semantics: None if either is NULL."""
+	if a is None or b is None:
+		return None
+	if type(a) is not type(b):
+		a, b = _coerce(a, b)
+	return op(a, b)
+
+
+def _sortKey(val):
+	"""Returns a key that orders values the way SQLite does, NULLs first."""
+	if val is None:
+		return (0, None)
+	if isinstance(val, _numericTypes):
+		return (1, val)
+	if isinstance(val, str):
+		try:
+			return (2, val.decode("utf-8"))
+		except UnicodeError:
+			raise QueryNotSupported("Undecodable text")
+	return (2, val)
+
+
+def _sortRows(rows, keys):
+	"""
+	Sorts the rows in place by the (getter, descending) keys. Each key is
+	sorted on in turn, starting from the last one, relying on the sort being
+	stable.
+	"""
+	try:
+		for getter, desc in reversed(keys):
+			rows.sort(key=lambda row: _sortKey(getter(row)), reverse=desc)
+	except TypeError:
+		raise QueryNotSupported("Values that can't be ordered")
+
+
+def _aggregate(func, vals):
+	"""Computes an aggregate over the non-NULL values of a group."""
+	if func == "count":
+		return len(vals)
+	if not vals:
+		return None
+	if func in ("min", "max"):
+		try:
+			ret = (min if func == "min" else max)(vals, key=_sortKey)
+		except TypeError:
+			raise QueryNotSupported("Values that can't be ordered")
+		if isinstance(ret, Decimal):
+			ret = float(ret)
+		return ret
+	for val in vals:
+		if not isinstance(val, _numericTypes):
+			# SQLite would convert text to numbers.
+			raise QueryNotSupported("%s() of non-numeric values" % func)
+	if [val for val in vals if isinstance(val, (float, Decimal))]:
+		total = sum(float(val) for val in vals)
+	else:
+		total = sum(vals)
+	if func == "avg":
+		return float(total) / len(vals)
+	return total
+
+
+
+class _Query(object):
+	"""Binds a parsed statement to the data sets and runs it."""
+	def __init__(self, query, params, tables):
+		self.query = query
+		self.params = params
+		# List of (alias, records, fields) in the order they are joined.
+		self.sources = []
+		lowerTables = dict((name.lower(), ds) for name, ds in tables.items())
+		for table, alias in query["tables"]:
+			try:
+				ds = lowerTables[table]
+			except KeyError:
+				raise QueryNotSupported("Unknown table '%s'" % table)
+			if not ds:
+				# SQLite has no table for an empty data set.
+				raise QueryNotSupported("Empty table '%s'" % table)
+			flds = list(ds[0])
+			for fld in flds:
+				if not isinstance(fld, basestring) or fld.startswith("dabo-"):
+					# SQLite renames internal fields.
+					raise QueryNotSupported("Internal field '%s'" % fld)
+			self.sources.append((alias, ds, flds))
+		aliases = [alias for alias, ds, flds in self.sources]
+		if len(set(aliases)) != len(aliases):
+			raise QueryNotSupported("Duplicate table alias")
+		self.single = len(self.sources) == 1
+
+
+	def resolve(self, ref):
+		"""
+		Returns the (source index, field name) of a column reference. Names
+		are matched without regard to case, as in SQLite.
+		"""
+		kind, alias, name = ref
+		found = []
+		for idx, (srcAlias, ds, flds) in enumerate(self.sources):
+			if alias is not None and srcAlias != alias:
+				continue
+			for fld in flds:
+				if fld.lower() == name:
+					found.append((idx, fld))
+		if len(found) != 1:
+			raise QueryNotSupported("Unknown or ambiguous column '%s'" % name)
+		return found[0]
+
+
+	def getter(self, ref):
+		"""Returns a function that takes a row and returns the column's value."""
+		idx, fld = self.resolve(ref)
+		if self.single:
+			return operator.itemgetter(fld)
+		def get(row):
+			rec = row[idx]
+			if rec is None:
+				# The missing side of a left join.
+				return None
+			return rec[fld]
+		return get
+
+
+	def value(self, expr):
+		"""Returns a function that returns the value of an operand for a row."""
+		kind = expr[0]
+		if kind == "lit":
+			val = expr[1]
+			return lambda row: val
+		if kind == "param":
+			try:
+				val = self.params[expr[1]]
+			except IndexError:
+				raise QueryNotSupported("Missing parameter")
+			return lambda row: val
+		try:
+			return self.getter(expr)
+		except QueryNotSupported:
+			# SQLite also accepts the names given to the result columns.
+			for colExpr, alias, text in self.query["columns"] or ():
+				if alias is not None and alias.lower() == expr[2] and expr[1] is None \
+						and colExpr[0] == "col":
+					return self.getter(colExpr)
+			raise
+
+
+	def predicate(self, cond):
+		"""
+		Returns a function that evaluates a condition for a row, returning
+		True, False or None for unknown.
+		"""
+		kind = cond[0]
+		if kind == "cmp":
+			op = cond[1]
+			left, right = self.value(cond[2]), self.value(cond[3])
+			if cond[3][0] not in ("lit", "param"):
+				return lambda row: _compare(op, left(row), right(row))
+			# The usual 'column <op> constant' case, without the extra calls.
+			const = right(None)
+			if const is None:
+				return lambda row: None
+			constType = type(const)
+			def compareConst(row):
+				val = left(row)
+				if val is None:
+					return None
+				if type(val) is not constType:
+					val, other = _coerce(val, const)
+					return op(val, other)
+				return op(val, const)
+			return compareConst
+		if kind == "isnull":
+			get = self.value(cond[1])
+			if cond[2]:
+				return lambda row: get(row) is not None
+			return lambda row: get(row) is None
+		if kind == "in":
+			get = self.value(cond[1])
+			items = [self.value(item) for item in cond[2]]
+			negate = cond[3]
+			def isIn(row):
+				val = get(row)
+				ret = False
+				for item in items:
+					res = _compare(operator.eq, val, item(row))
+					if res:
+						ret = True
+						break
+					if res is None:
+						ret = None
+				if negate and ret is not None:
+					return not ret
+				return ret
+			return isIn
+		if kind == "between":
+			get, low, high = [self.value(expr) for expr in cond[1:4]]
+			negate = cond[4]
+			def isBetween(row):
+				val = get(row)
+				ret = _and((_compare(operator.ge, val, low(row)),
+						_compare(operator.le, val, high(row))))
+				if negate and ret is not None:
+					return not ret
+				return ret
+			return isBetween
+		if kind == "not":
+			inner = self.predicate(cond[1])
+			def negated(row):
+				ret = inner(row)
+				if ret is None:
+					return None
+				return not ret
+			return negated
+		terms = [self.predicate(term) for term in cond[1]]
+		if kind == "and":
+			def allTrue(row):
+				ret = True
+				for term in terms:
+					val = term(row)
+					if val is None:
+						ret = None
+					elif not val:
+						return False
+				return ret
+			return allTrue
+		return lambda row: _or([term(row) for term in terms])
+
+
+	def rows(self):
+		"""Returns the rows produced by the tables and joins."""
+		alias, ds, flds = self.sources[0]
+		if self.single:
+			return list(ds)
+		rows = [(rec,) for rec in ds]
+		for num, (outer, leftRef, rightRef) in enumerate(self.query["joins"]):
+			newIdx = num + 1
+			left, right = self.resolve(leftRef), self.resolve(rightRef)
+			if left[0] == newIdx:
+				left, right = right, left
+			if right[0] != newIdx or left[0] >= newIdx:
+				raise QueryNotSupported("Unsupported join condition")
+			index = {}
+			for rec in self.sources[newIdx][1]:
+				key = rec[right[1]]
+				if key is not None:
+					index.setdefault(key, []).append(rec)
+			leftIdx, leftFld = left
+			joined = []
+			for row in rows:
+				leftRec = row[leftIdx]
+				key = None
+				if leftRec is not None:
+					key = leftRec[leftFld]
+				matches = None
+				if key is not None:
+					try:
+						matches = index.get(key)
+					except TypeError:
+						raise QueryNotSupported("Unhashable join key")
+				if matches:
+					for rec in matches:
+						if type(rec[right[1]]) is not type(key):
+							# Equal hashes across types need SQLite's rules.
+							_coerce(key, rec[right[1]])
+						joined.append(row + (rec,))
+				elif outer:
+					joined.append(row + (None,))
+			rows = joined
+		return rows
+
+
+	def run(self):
+		query = self.query
+		rows = self.rows()
+		if query["where"] is not None:
+			test = self.predicate(query["where"])
+			rows = [row for row in rows if test(row)]
+
+		columns = query["columns"]
+		hasAggregates = columns is not None and [col for col in columns
+				if col[0][0] == "agg"]
+		if query["groupBy"] or hasAggregates:
+			names, results, orderGetters = self.group(rows)
+		else:
+			names, getters = self.projection()
+			orderGetters = self.orderGetters(names, getters)
+			if orderGetters:
+				_sortRows(rows, orderGetters)
+				orderGetters = None
+			results = self.limit(rows)
+			results = [tuple([get(row) for get in getters]) for row in results]
+			return names, results
+		if orderGetters:
+			_sortRows(results, orderGetters)
+		return names, self.limit(results)
+
+
+	def projection(self):
+		"""Returns the output names and getters of a query without aggregates."""
+		columns = self.query["columns"]
+		if columns is None:
+			names = []
+			getters = []
+			for idx, (alias, ds, flds) in enumerate(self.sources):
+				for fld in flds:
+					names.append(fld)
+					getters.append(self.getter(("col", alias, fld.lower())))
+			return names, getters
+		names = []
+		getters = []
+		for expr, alias, text in columns:
+			names.append(alias or self.resolve(expr)[1])
+			getters.append(self.getter(expr))
+		return names, getters
+
+
+	def orderGetters(self, names, getters):
+		"""
+		Returns (getter, descending) tuples for the ORDER BY terms of a query
+		without grouping; the getters take source rows.
+		"""
+		ret = []
+		lowerNames = [name.lower() for name in names]
+		for expr, desc in self.query["orderBy"]:
+			if expr[0] == "position":
+				if not 0 < expr[1] <= len(getters):
+					raise QueryNotSupported("Bad ORDER BY position")
+				ret.append((getters[expr[1] - 1], desc))
+			elif expr[1] is None and expr[2] in lowerNames and self.query["columns"]:
+				# Result column names take precedence over table columns.
+				ret.append((getters[lowerNames.index(expr[2])], desc))
+			else:
+				ret.append((self.getter(expr), desc))
+		return ret
+
+
+	def group(self, rows):
+		"""
+		Runs a query with GROUP BY or aggregates. Returns the output names, the
+		result tuples, and (getter, descending) ORDER BY keys for them.
+		"""
+		query = self.query
+		columns = query["columns"]
+		if columns is None:
+			raise QueryNotSupported("'*' with aggregates")
+		groupRefs = [self.resolve(ref) for ref in query["groupBy"]]
+		groupGetters = [self.getter(ref) for ref in query["groupBy"]]
+		if groupGetters:
+			groups = {}
+			try:
+				for row in rows:
+					key = tuple([get(row) for get in groupGetters])
+					groups.setdefault(key, []).append(row)
+			except TypeError:
+				raise QueryNotSupported("Unhashable GROUP BY value")
+			keys = groups.keys()
+			try:
+				# SQLite returns the groups in the order of their keys.
+				keys.sort(key=lambda key: [_sortKey(val) for val in key])
+			except TypeError:
+				raise QueryNotSupported("Values that can't be ordered")
+			groupList = [(key, groups[key]) for key in keys]
+		else:
+			groupList = [((), rows)]
+
+		def itemFunc(expr):
+			"""Returns a function computing a column from a (key, rows) group."""
+			if expr[0] == "agg":
+				func, arg = expr[1], expr[2]
+				if arg is None:
+					return lambda group: len(group[1])
+				get = self.getter(arg)
+				return lambda group: _aggregate(func,
+						[val for val in [get(row) for row in group[1]] if val is not None])
+			ref = self.resolve(expr)
+			if ref not in groupRefs:
+				# SQLite would pick the value from one of the rows.
+				raise QueryNotSupported("Column not in GROUP BY")
+			pos = groupRefs.index(ref)
+			return lambda group: group[0][pos]
+
+		names = []
+		funcs = []
+		for expr, alias, text in columns:
+			if alias:
+				names.append(alias)
+			elif expr[0] == "agg":
+				names.append(text)
+			else:
+				names.append(self.resolve(expr)[1])
+			funcs.append(itemFunc(expr))
+		results = [tuple([func(group) for func in funcs]) for group in groupList]
+
+		orderKeys = []
+		lowerNames = [name.lower() for name in names]
+		for expr, desc in query["orderBy"]:
+			if expr[0] == "position":
+				if not 0 < expr[1] <= len(names):
+					raise QueryNotSupported("Bad ORDER BY position")
+				pos = expr[1] - 1
+			elif expr[1] is None and expr[2] in lowerNames:
+				pos = lowerNames.index(expr[2])
+			else:
+				ref = self.resolve(expr)
+				matches = [num for num, (colExpr, alias, text) in enumerate(columns)
+						if colExpr[0] == "col" and self.resolve(colExpr) == ref]
+				if not matches:
+					raise QueryNotSupported("ORDER BY column not in the result")
+				pos = matches[0]
+			orderKeys.append((operator.itemgetter(pos), desc))
+		return names, results, orderKeys
+
+
+	def limit(self, rows):
+		"""Applies the LIMIT and OFFSET of the query."""
+		limit, offset = self.query["limit"], self.query["offset"]
+		start = 0
+		if offset is not None:
+			start = max(self.value(offset)(None), 0)
+		if limit is not None:
+			count = self.value(limit)(None)
+			if not isinstance(count, (int, long)):
+				raise QueryNotSupported("Non-integer LIMIT")
+			if count >= 0:
+				return rows[start:start + count]
+		return rows[start:]
+
+
+
+def _and(vals):
+	ret = True
+	for val in vals:
+		if val is None:
+			ret = None
+		elif not val:
+			return False
+	return ret
+
+
+def _or(vals):
+	ret = False
+	for val in vals:
+		if val is None:
+			ret = None
+		elif val:
+			return True
+	return ret
+
+
+def run(sql, params, tables):
+	"""
+	Runs the select statement on the records of the data sets in the
+	'tables' dict, keyed by the names used in the statement. Returns a list of
+	dicts, one per result row, or raises QueryNotSupported.
+	"""
+	parser = _Parser(sql)
+	query = parser.parse()
+	params = tuple(params or ())
+	if parser.paramCount != len(params):
+		raise QueryNotSupported("Parameter count mismatch")
+	try:
+		names, results = _Query(query, params, tables).run()
+	except KeyError, e:
+		# Records that don't all have the same fields.
+		raise QueryNotSupported("Missing field %s" % e)
+	return [dict(zip(names, vals)) for vals in results]
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Compiles the Python expressions that refer to fields by name, as passed to
+filterByExpression() and replace(), into functions.
+
+The field names in an expression are found with the tokenizer, so names
+inside strings or after a dot are left alone, and replaced by the code that
+reads the field. The rewritten expression is compiled once, into a function
+that runs over all the records in a single list comprehension, and cached by
+the expression text, the fields and the way they are read. For the
+dCompactRecord objects of a cursor, fields are read from the record's slots
+directly instead of through its dict interface.
+"""
+import keyword
+import threading
+import tokenize
+from StringIO import StringIO
+
+from dabo.db.dCompactRecord import dCompactRecord
+
+
+# The templates for the functions compiled from an expression; '%s' is
+# replaced by the rewritten expression. 'self' is available to expressions,
+# as it was when they were passed to eval() by the calling methods.
+_templates = {
+		# Returns the records for which the expression is true.
+		"filter": "lambda _recs, self: [rec for rec in _recs if (%s)]",
+		# Returns the positions of the records for which it is true.
+		"rows": "lambda _recs, self: [_row for _row, rec in enumerate(_recs) if (%s)]",
+		# Returns its value for each record.
+		"values": "lambda _recs, self: [(%s) for rec in _recs]",
+		# Returns its value, reading the fields with the _get function.
+		"call": "lambda _get, self: (%s)",
+		}
+# How each field is read by the compiled code.
+_itemRef = "rec[%r]"
+_slotRef = "rec._values[%d]"
+_callRef = "_get(%r)"
+# The number of compiled functions kept before the cache is cleared.
+_maxCached = 256
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def rewrite(expr, fields, makeRef):
+	"""
+	Returns the expression with each name that is one of the passed fields
+	replaced by makeRef(fieldName). Names inside strings, attribute names and
+	keyword argument names aren't replaced.
+	"""
+	fields = set(fields)
+	try:
+		tokens = list(tokenize.generate_tokens(StringIO(expr).readline))
+	except tokenize.TokenError, e:
+		raise SyntaxError("%s: %s" % (e.args[0], expr))
+	# The offset of the start of each line, to turn (row, col) into positions.
+	lineStarts = [0]
+	for line in StringIO(expr):
+		lineStarts.append(lineStarts[-1] + len(line))
+	pieces = []
+	pos = 0
+	prev = None
+	for num, tok in enumerate(tokens):
+		typ, text, start = tok[:3]
+		if typ == tokenize.NAME and text in fields and not keyword.iskeyword(text):
+			after = tokens[num + 1] if num + 1 < len(tokens) else None
+			isAttr = prev is not None and prev[1] == "."
+			isKeywordArg = after is not None and after[1] == "="
+			if not isAttr and not isKeywordArg:
+				offset = lineStarts[start[0] - 1] + start[1]
+				pieces.append(expr[pos:offset])
+				pieces.append(makeRef(text))
+				pos = offset + len(text)
+		if typ not in (tokenize.NL, tokenize.COMMENT):
+			prev = tok
+	pieces.append(expr[pos:])
+	return "".join(pieces)
+
+
+def _compile(kind, expr, fields, namespace, layout=None):
+	"""
+	Returns the function for the template 'kind' and the expression, compiled
+	with the globals in 'namespace'. When the dRecordLayout of the records is
+	passed, the fields it holds are read from their slots.
+	"""
+	names = layout.names if layout is not None else None
+	key = (kind, expr, fields, names, id(namespace))
+	try:
+		return _cache[key]
+	except KeyError:
+		pass
+	if kind == "call":
+		makeRef = lambda fld: _callRef % fld
+	elif layout is not None:
+		slots = layout.slots
+		makeRef = lambda fld: _slotRef % slots[fld] if fld in slots else _itemRef % fld
+	else:
+		makeRef = lambda fld: _itemRef % fld
+	source = _templates[kind] % rewrite(expr.strip(), fields, makeRef)
+	func = eval(compile(source, "<expression>", "eval"), namespace)
+	with _lock:
+		if len(_cache) >= _maxCached:
+			_cache.clear()
+		_cache[key] = func
+	return func
+
+
+def _layoutRuns(records):
+	"""
+	Splits the records into runs that can be handled by the same compiled
+	function. Returns a list of (layout, records) tuples, where layout is the
+	dRecordLayout shared by all the records of the run, or None for records
+	that aren't compact records.
+	"""
+	if not records:
+		return []
+	first = records[0]
+	layout = first._layout if type(first) is dCompactRecord else None
+	if layout is not None and all(type(rec) is dCompactRecord and rec._layout is layout
+			for rec in records):
+		return [(layout, records)]
+	if layout is None and not [rec for rec in records if type(rec) is dCompactRecord]:
+		return [(None, records)]
+	ret = []
+	current = []
+	currentLayout = None
+	for rec in records:
+		recLayout = rec._layout if type(rec) is dCompactRecord else None
+		if current and recLayout is not currentLayout:
+			ret.append((currentLayout, current))
+			current = []
+		currentLayout = recLayout
+		current.append(rec)
+	ret.append((currentLayout, current))
+	return ret
+
+
+def _run(kind, records, expr, fields, namespace, obj):
+	"""Runs the 'kind' function compiled from the expression over the records."""
+	ret = []
+	start = 0
+	for layout, recs in _layoutRuns(records):
+		result = _compile(kind, expr, fields, namespace, layout)(recs, obj)
+		if kind == "rows":
+			result = [row + start for row in result]
+		ret.extend(result)
+		start += len(recs)
+	return ret
+
+
+def filterRecords(records, expr, fields, namespace, obj=None):
+	"""
+	Returns a list of the records for which the expression is true. 'fields'
+	are the names that refer to fields of the records; the expression is
+	compiled with the globals in 'namespace', and 'obj' is available to it as
+	'self'.
+	"""
+	return _run("filter", records, expr, frozenset(fields), namespace, obj)
+
+
+def matchingRows(records, expr, fields, namespace, obj=None):
+	"""
+	Returns the positions of the records for which the expression is true.
+	The arguments are the same as for filterRecords().
+	"""
+	return _run("rows", records, expr, frozenset(fields), namespace, obj)
+
+
+def evaluateRecords(records, expr, fields, namespace, obj=None):
+	"""
+	Returns a list with the value of the expression for each record. The
+	arguments are the same as for filterRecords().
+	"""
+	return _run("values", records, expr, frozenset(fields), namespace, obj)
+
+
+def compileGetterExpression(expr, fields, namespace):
+	"""
+	Returns a function of (getter, obj) that evaluates the expression, reading
+	each field with getter(fieldName), with 'obj' available as 'self'. This is
+	for objects like bizobjs, whose field values are read through a method.
+	"""
+	return _compile("call", expr, frozenset(fields), namespace)
+
+
+def clearCache():
+	"""Discards all the compiled functions."""
+	with _lock:
+		_cache.clear()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Query observers for dabo cursors.
+
+Any callable can be registered with addQueryObserver(). After every statement
+run by a dCursorMixin-based cursor, each observer is called with these
+arguments:
+
+	sql: the statement that was executed
+	params: the parameters passed with it, if any. For executemany() this is
+			the list of parameter sets.
+	elapsed: the time in seconds spent running the statement and fetching
+			its rows
+	rowCount: the number of rows fetched for a select, or the number of rows
+			affected by other statements, as reported by the backend
+	name: the Name of the bizobj that owns the cursor; cursors that are not
+			used by a bizobj use their Table instead
+
+Requeries answered from dabo.db.resultCache don't reach the database, and are
+only reported to the observers registered with 'cacheHits' set to True. Those
+observers are called with the extra keyword argument 'cached', which is True
+for cache hits; their 'elapsed' is 0.
+
+dQueryStats is an observer that collects per-bizobj statistics::
+
+	stats = dQueryStats()
+	stats.start()
+	...
+	print stats.report()
+"""
+import heapq
+import itertools
+import math
+import threading
+from collections import deque
+import dabo
+from dabo.dLocalize import _
+
+
+# The registered (observer, wants cache hits) tuples.
+_observers = ()
+_lock = threading.Lock()
+
+
+def addQueryObserver(func, cacheHits=False):
+	"""
+	Registers 'func' to be called after each query is executed, and also for
+	each requery answered from the result cache if 'cacheHits' is True.
+	"""
+	global _observers
+	with _lock:
+		if func not in [obs for obs, hits in _observers]:
+			_observers = _observers + ((func, cacheHits),)
+
+
+def removeQueryObserver(func):
+	"""Unregisters an observer added with addQueryObserver()."""
+	global _observers
+	with _lock:
+		_observers = tuple((obs, hits) for obs, hits in _observers if obs != func)
+
+
+def hasQueryObservers(cached=False):
+	"""
+	Returns True if at least one query observer is registered, or if 'cached'
+	is True, one that is called for cache hits.
+	"""
+	if cached:
+		return bool([obs for obs, hits in _observers if hits])
+	return bool(_observers)
+
+
+def notifyQueryObservers(sql, params, elapsed, rowCount, name, cached=False):
+	"""
+	Passes the details of an executed query to all the registered observers,
+	or for a requery answered from the result cache, to those that asked for
+	cache hits. An observer that raises an error is logged, but never
+	interrupts the query.
+	"""
+	for obs, hits in _observers:
+		try:
+			if hits:
+				obs(sql, params, elapsed, rowCount, name, cached=cached)
+			elif not cached:
+				obs(sql, params, elapsed, rowCount, name)
+		except StandardError, e:
+			dabo.log.error(_("Query observer %(obs)r failed: %(e)s") % locals())
+
+
+
+class dQueryStats(object):
+	"""
+	Query observer that collects statistics for each bizobj: the number of
+	queries run, the requeries answered from the result cache, the rows
+	fetched, the total time and the p50/p99 latency. It also keeps the
+	slowest statements seen overall.
+
+	Latencies are computed from the most recent 'maxSamples' queries of each
+	bizobj, so the memory used stays bounded in long running applications.
+	"""
+	def __init__(self, maxSlowest=10, maxSamples=1000):
+		self.maxSlowest = maxSlowest
+		self.maxSamples = maxSamples
+		self._lock = threading.Lock()
+		self.reset()
+
+
+	def __call__(self, sql, params, elapsed, rowCount, name, cached=False):
+		with self._lock:
+			try:
+				stat = self._stats[name]
+			except KeyError:
+				stat = self._stats[name] = {"count": 0, "cacheHits": 0, "rows": 0,
+						"totalTime": 0.0, "samples": deque(maxlen=self.maxSamples)}
+			if cached:
+				# Nothing was asked of the database.
+				stat["cacheHits"] += 1
+				return
+			stat["count"] += 1
+			if rowCount > 0:
+				stat["rows"] += rowCount
+			stat["totalTime"] += elapsed
+			stat["samples"].append(elapsed)
+			# The counter keeps the heap from ever comparing the statements.
+			entry = (elapsed, self._counter.next(), name, sql)
+			if len(self._slowest) < self.maxSlowest:
+				heapq.heappush(self._slowest, entry)
+			elif self._slowest and elapsed > self._slowest[0][0]:
+				heapq.heapreplace(self._slowest, entry)
+
+
+	def start(self):
+		"""Starts collecting statistics for all queries."""
+		addQueryObserver(self, cacheHits=True)
+
+
+	def stop(self):
+		"""Stops collecting statistics. The collected values are kept."""
+		removeQueryObserver(self)
+
+
+	def reset(self):
+		"""Discards all the statistics collected so far."""
+		with self._lock:
+			self._stats = {}
+			self._slowest = []
+			self._counter = itertools.count()
+
+
+	def getStats(self):
+		"""
+		Returns a dict with an entry for each bizobj name. Each entry is a dict
+		with the keys 'count', 'cacheHits', 'rows', 'totalTime', 'p50' and 'p99'.
+		"""
+		ret = {}
+		with self._lock:
+			for name, stat in self._stats.iteritems():
+				samples = sorted(stat["samples"])
+				ret[name] = {"count": stat["count"], "cacheHits": stat["cacheHits"],
+						"rows": stat["rows"],
+						"totalTime": stat["totalTime"],
+						"p50": self._percentile(samples, 50),
+						"p99": self._percentile(samples, 99)}
+		return ret
+
+
+	def getSlowest(self):
+		"""
+		Returns the slowest statements as a list of (elapsed, name, sql) tuples,
+		slowest first.
+		"""
+		with self._lock:
+			entries = sorted(self._slowest, reverse=True)
+		return [(elapsed, name, sql) for elapsed, seq, name, sql in entries]
+
+
+	def report(self):
+		"""Returns the collected statistics formatted as a text table."""
+		lines = ["%-24s %8s %8s %10s %10s %10s %10s" % (_("Name"), _("Queries"),
+				_("Cached"), _("Rows"), _("Total"), "p50", "p99")]
+		stats = self.getStats()
+		for name in sorted(stats, key=lambda nm: -stats[nm]["totalTime"]):
+			stat = stats[name]
+			lines.append("%-24s %8d %8d %10d %10.4f %10.4f %10.4f" % (name, stat["count"],
+					stat["cacheHits"], stat["rows"], stat["totalTime"], stat["p50"], stat["p99"]))
+		slowest = self.getSlowest()
+		if slowest:
+			lines.append("")
+			lines.append(_("Slowest statements:"))
+			for elapsed, name, sql in slowest:
+				lines.append("%10.4f %-24s %s" % (elapsed, name, " ".join(sql.split())))
+		return "\n".join(lines)
+
+
+	@staticmethod
+	def _percentile(samples, pct):
+		"""Nearest-rank percentile of an already sorted list."""
+		if not samples:
+			return 0.0
+		rank = int(math.ceil(pct / 100.0 * len(samples)))
+		return samples[min(max(rank, 1), len(samples)) - 1]
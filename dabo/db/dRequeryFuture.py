@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import threading
+import dabo
+import dabo.dException as dException
+from dabo.dLocalize import _
+from dabo.lib.utils import ustr
+
+
+
+class dRequeryFuture(object):
+	"""
+	Handle for a requery started with requeryAsync().
+
+	The query runs on a worker thread, using its own connection to the
+	database. Once the rows have been fetched, they are stored in the cursor
+	on the thread that started the requery: when a UI is loaded this happens
+	in the event loop through dabo.ui.callAfter(); otherwise it happens when
+	result() is called. Callbacks added with addDoneCallback() are called at
+	that point, on the same thread, with the future as their only argument.
+
+	Starting another requery on the same cursor cancels this one; a canceled
+	requery never replaces the data in the cursor.
+	"""
+	def __init__(self, finishFunc):
+		# Called with the fetched (data, types, structure) on the requesting thread.
+		self._finishFunc = finishFunc
+		self._lock = threading.Lock()
+		self._fetched = threading.Event()
+		self._callbacks = []
+		self._cancelled = False
+		self._done = False
+		self._fetchResult = None
+		self._exception = None
+		self._rowCount = None
+		# The DB-API connection used by the worker thread, if it is running.
+		self._connection = None
+		# The PK of the cursor's current record before the rows were replaced.
+		self._priorPK = None
+
+
+	def cancel(self):
+		"""
+		Cancels the requery, so that its rows won't replace the data in the
+		cursor. Returns False if the requery has already finished.
+		"""
+		with self._lock:
+			if self._done:
+				return self._cancelled
+			self._cancelled = self._done = True
+			conn = self._connection
+		if conn is not None and hasattr(conn, "interrupt"):
+			# Backends like SQLite can stop a running statement from another thread.
+			try:
+				conn.interrupt()
+			except StandardError:
+				pass
+		self._runCallbacks()
+		return True
+
+
+	def cancelled(self):
+		"""Returns True if the requery was canceled."""
+		return self._cancelled
+
+
+	def done(self):
+		"""Returns True if the requery was canceled, or its rows have been stored."""
+		return self._done
+
+
+	def running(self):
+		"""Returns True while the query is being run on the worker thread."""
+		return not self._fetched.isSet() and not self._done
+
+
+	def result(self, timeout=None):
+		"""
+		Waits for the requery to finish, and returns the number of rows in the
+		cursor. If the query failed, its exception is raised. Raises a
+		dException if the requery was canceled, or if it didn't finish within
+		'timeout' seconds.
+		"""
+		self._complete(timeout)
+		if self._cancelled:
+			raise dException.dException(_("The requery was canceled"))
+		if self._exception is not None:
+			raise self._exception
+		return self._rowCount
+
+
+	def exception(self, timeout=None):
+		"""
+		Waits for the requery to finish, and returns the exception raised by
+		the query, or None if it succeeded.
+		"""
+		self._complete(timeout)
+		return self._exception
+
+
+	def addDoneCallback(self, fn):
+		"""
+		Adds a function to be called with this future when the requery is done
+		or canceled. If that has already happened, it is called right away.
+		"""
+		with self._lock:
+			if not self._done:
+				self._callbacks.append(fn)
+				return
+		fn(self)
+
+
+	def _setFetched(self, result=None, exception=None):
+		"""Called by the worker thread when the query has finished."""
+		self._fetchResult = result
+		self._exception = exception
+		self._connection = None
+		self._fetched.set()
+		if dabo.ui.getUIType() is not None:
+			dabo.ui.callAfter(self._complete)
+
+
+	def _complete(self, timeout=None):
+		"""
+		Waits for the rows to be fetched, and stores them in the cursor. Runs
+		on the thread that started the requery; does nothing once done.
+		"""
+		if self._done:
+			return
+		if not self._fetched.wait(timeout):
+			raise dException.dException(_("Timed out waiting for the requery"))
+		with self._lock:
+			if self._done:
+				return
+			self._done = True
+		if self._exception is None:
+			try:
+				self._rowCount = self._finishFunc(self, *self._fetchResult)
+			except StandardError, e:
+				self._exception = e
+		self._fetchResult = None
+		self._runCallbacks()
+
+
+	def _runCallbacks(self):
+		with self._lock:
+			callbacks, self._callbacks = self._callbacks, []
+		for fn in callbacks:
+			try:
+				fn(self)
+			except StandardError, e:
+				dabo.log.error(_("Requery callback %(fn)r failed: %(e)s")
+						% {"fn": fn, "e": ustr(e)})
+
+
+
+def startRequery(future, connectInfo, sql, params, cursorProps):
+	"""
+	Starts the worker thread that runs 'sql' on a new connection made with a
+	copy of 'connectInfo'. The properties in the 'cursorProps' dict are set on
+	the worker's cursor before running the query.
+	"""
+	thd = threading.Thread(target=_fetch, name="dabo requery",
+			args=(future, connectInfo.copy(), sql, params, cursorProps))
+	thd.setDaemon(True)
+	thd.start()
+	return thd
+
+
+def _fetch(future, connectInfo, sql, params, cursorProps):
+	# Imported here, as dConnection imports dCursorMixin, which imports this module.
+	from dabo.db.dConnection import dConnection
+	conn = None
+	try:
+		if future.cancelled():
+			return
+		connectInfo.KeepAliveInterval = None
+		conn = dConnection(connectInfo)
+		future._connection = conn.getConnection()
+		crs = conn.getDaboCursor()
+		for prop, val in cursorProps.iteritems():
+			setattr(crs, prop, val)
+		crs.execute(sql, params)
+		stru = crs.DataStructure
+		future._setFetched((crs._records, crs.getDataTypes(), stru))
+	except Exception, e:
+		future._setFetched(exception=e)
+	finally:
+		if conn is not None:
+			try:
+				conn.close()
+			except StandardError:
+				pass
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import copy
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+# Finds the table list that follows each keyword that names tables in a
+# statement, up to the next clause or parenthesis.
+_tableListPat = re.compile(r"\b(?:from|join|update|into)\s+(.+?)"
+		r"(?=\b(?:where|group|order|having|limit|join|on|using|union|set|values"
+		r"|inner|left|right|outer|cross|full|natural)\b|[();]|$)", re.I | re.S)
+# Statements that change the rows of the tables they name.
+_writeVerbs = ("insert", "update", "delete", "replace", "merge", "truncate",
+		"drop", "alter")
+# The number of rows measured when estimating the size of a result set.
+_sizeSample = 100
+
+
+def getTableNames(sql):
+	"""
+	Returns the set of table names that the passed statement reads from or
+	writes to, lowercased and without any schema prefix or quotes.
+	"""
+	ret = set()
+	for tableList in _tableListPat.findall(sql):
+		for item in tableList.split(","):
+			words = item.split()
+			if not words:
+				continue
+			name = words[0].split(".")[-1].strip("\"'`[]").lower()
+			if name and name != "select":
+				ret.add(name)
+	return ret
+
+
+def isWriteStatement(sql):
+	"""Returns True if the statement changes the rows of the tables it names."""
+	words = sql.split(None, 1)
+	return bool(words) and words[0].lower() in _writeVerbs
+
+
+
+class dResultCache(object):
+	"""
+	Keeps the rows returned by recent queries, so that cursors requerying
+	data that rarely changes, such as lookup tables, don't have to go back to
+	the database each time.
+
+	Entries are keyed by the connection (see dConnectInfo.getSchemaCacheKey()),
+	the SQL and its parameters, and expire after the time-to-live passed when
+	they are stored. When the estimated size of all the entries goes over
+	'maxBytes', the least recently used ones are dropped. Running an insert,
+	update or delete through any cursor discards the entries whose queries
+	read from the changed table; changes made outside of Dabo are only seen
+	once the entries expire, or after calling invalidate().
+
+	A single instance, dabo.db.resultCache, is used by all the cursors whose
+	CacheTTL is set.
+	"""
+	def __init__(self, maxBytes=16 * 1024 * 1024):
+		self.maxBytes = maxBytes
+		self._lock = threading.Lock()
+		# key -> (rows, types, structure, tables, size, expires), oldest first.
+		self._entries = OrderedDict()
+		# (connKey, table) -> set of the keys of the entries that read the table.
+		self._tables = {}
+		self._size = 0
+		self.resetStats()
+
+
+	def __len__(self):
+		return len(self._entries)
+
+
+	def get(self, connKey, sql, params):
+		"""
+		Returns a (rows, types, structure) tuple for the query, or None if it
+		isn't cached. The rows are copies that the caller is free to change.
+		"""
+		key = self._makeKey(connKey, sql, params)
+		if key is None:
+			return None
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and entry[5] < time.time():
+				self._remove(key)
+				self._stats["expired"] += 1
+				entry = None
+			if entry is None:
+				self._stats["misses"] += 1
+				return None
+			# Move it to the most recently used end.
+			del self._entries[key]
+			self._entries[key] = entry
+			self._stats["hits"] += 1
+		rows, typs, stru = entry[:3]
+		return [copy.copy(rec) for rec in rows], typs.copy(), stru
+
+
+	def set(self, connKey, sql, params, rows, typs, stru, ttl, tables=None):
+		"""
+		Stores copies of the rows returned by the query for 'ttl' seconds.
+		'tables' are the names of the tables the query reads; they are taken
+		from the SQL if not passed. Queries whose tables can't be determined,
+		or whose rows wouldn't fit in the cache, aren't stored.
+		"""
+		key = self._makeKey(connKey, sql, params)
+		if key is None or not ttl:
+			return False
+		tables = set(tbl.lower() for tbl in (tables or ()) if tbl) | getTableNames(sql)
+		if not tables:
+			return False
+		size = self._estimateSize(rows)
+		if size > self.maxBytes:
+			return False
+		entry = ([copy.copy(rec) for rec in rows], typs.copy(), stru, tables, size,
+				time.time() + ttl)
+		with self._lock:
+			if key in self._entries:
+				self._remove(key)
+			self._entries[key] = entry
+			self._size += size
+			for table in tables:
+				self._tables.setdefault((connKey, table), set()).add(key)
+			while self._size > self.maxBytes:
+				self._remove(next(iter(self._entries)))
+				self._stats["evictions"] += 1
+		return True
+
+
+	def invalidateTables(self, connKey, tables):
+		"""Discards the entries for the connection that read any of the tables."""
+		if not self._entries:
+			return
+		with self._lock:
+			for table in tables:
+				for key in self._tables.get((connKey, table.lower()), ()).copy():
+					self._remove(key)
+					self._stats["invalidations"] += 1
+
+
+	def invalidate(self, connKey=None):
+		"""
+		Discards all the entries for the passed connection, or the whole cache
+		if no connection is passed.
+		"""
+		with self._lock:
+			if connKey is None:
+				self._entries.clear()
+				self._tables.clear()
+				self._size = 0
+				return
+			for key in [key for key in self._entries if key[0] == connKey]:
+				self._remove(key)
+
+
+	def getStats(self):
+		"""
+		Returns a dict with the number of 'hits' and 'misses', of entries that
+		'expired', were dropped to stay within the byte budget ('evictions'),
+		or discarded because a table they read was changed ('invalidations'),
+		along with the current number of 'entries' and their estimated 'bytes'.
+		"""
+		with self._lock:
+			ret = dict(self._stats)
+			ret["entries"] = len(self._entries)
+			ret["bytes"] = self._size
+		return ret
+
+
+	def resetStats(self):
+		"""Sets all the counters returned by getStats() back to zero."""
+		with self._lock:
+			self._stats = dict.fromkeys(("hits", "misses", "expired", "evictions",
+					"invalidations"), 0)
+
+
+	def _makeKey(self, connKey, sql, params):
+		if connKey is None:
+			# The connection can't be identified, so nothing can be shared.
+			return None
+		if params is not None:
+			params = tuple(params)
+		key = (connKey, sql, params)
+		try:
+			hash(key)
+		except TypeError:
+			return None
+		return key
+
+
+	def _remove(self, key):
+		"""Removes an entry. The lock must be held by the caller."""
+		entry = self._entries.pop(key)
+		self._size -= entry[4]
+		for table in entry[3]:
+			tableKey = (key[0], table)
+			keys = self._tables.get(tableKey)
+			if keys is not None:
+				keys.discard(key)
+				if not keys:
+					del self._tables[tableKey]
+
+
+	@staticmethod
+	def _estimateSize(rows):
+		"""Estimates the memory used by the rows from a sample of them."""
+		if not rows:
+			return sys.getsizeof(rows)
+		sample = rows[:_sizeSample]
+		sampleSize = 0
+		for rec in sample:
+			sampleSize += sys.getsizeof(rec) + sum(sys.getsizeof(val)
+					for val in rec.itervalues())
+		return sys.getsizeof(rows) + sampleSize * len(rows) // len(sample)
+
+
+
+resultCache = dResultCache()
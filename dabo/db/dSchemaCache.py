@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import cPickle as pickle
+import dabo
+from dabo.dLocalize import _
+from dabo.lib.utils import ustr
+
+
+
+class dSchemaCache(object):
+	"""
+	Holds the table metadata that cursors would otherwise have to query the
+	backend for, such as the field list of a table, or the description of a
+	query that returns no rows.
+
+	Each entry is stored under the key of the connection it came from (see
+	dConnectInfo.getSchemaCacheKey()), the table name and the kind of item, so
+	all the cursors using the same database share it. Entries can be saved to
+	a file and loaded again when the application restarts; pass a version
+	stamp to both save() and load() to make sure that an outdated file is
+	ignored. Call invalidate() after changing the structure of a table.
+
+	A single instance, dabo.db.schemaCache, is used by all the cursors.
+	"""
+	# Increased when the format of the saved file changes.
+	_fileFormat = 1
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._entries = {}
+
+
+	def __len__(self):
+		return len(self._entries)
+
+
+	def get(self, connKey, table, item, default=None):
+		"""Returns the cached value, or 'default' if there isn't one."""
+		if connKey is None:
+			return default
+		return self._entries.get((connKey, table, item), default)
+
+
+	def set(self, connKey, table, item, value):
+		"""Stores the value for the item of the table in the connection."""
+		if connKey is None:
+			# The connection can't be identified, so nothing can be shared.
+			return
+		with self._lock:
+			self._entries[(connKey, table, item)] = value
+
+
+	def invalidate(self, connKey=None, table=None):
+		"""
+		Discards the entries for the passed table in the passed connection.
+		Leaving out the table discards everything for the connection, and
+		leaving out both clears the whole cache.
+		"""
+		with self._lock:
+			if connKey is None and table is None:
+				self._entries.clear()
+				return
+			for key in self._entries.keys():
+				if ((connKey is None or key[0] == connKey)
+						and (table is None or key[1] == table)):
+					del self._entries[key]
+
+
+	def save(self, pth, version=None):
+		"""
+		Writes the cache to the file 'pth'. Entries for connections that only
+		exist in this process, such as in-memory SQLite databases, are skipped.
+		"""
+		with self._lock:
+			entries = dict((key, val) for key, val in self._entries.iteritems()
+					if key[0][-1] is None)
+		data = {"format": self._fileFormat, "version": version, "entries": entries}
+		tmpPath = "%s.tmp" % pth
+		try:
+			f = open(tmpPath, "wb")
+			try:
+				pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+			finally:
+				f.close()
+			if os.path.exists(pth):
+				# os.rename() can't replace an existing file on Windows.
+				os.remove(pth)
+			os.rename(tmpPath, pth)
+		except (IOError, OSError, pickle.PicklingError), e:
+			dabo.log.error(_("Unable to save the schema cache to '%(pth)s': %(e)s")
+					% {"pth": pth, "e": ustr(e)})
+			return False
+		return True
+
+
+	def load(self, pth, version=None):
+		"""
+		Adds the entries saved in the file 'pth' to the cache. Returns False if
+		the file doesn't exist, can't be read, or was saved with a different
+		version stamp.
+		"""
+		if not os.path.exists(pth):
+			return False
+		try:
+			f = open(pth, "rb")
+			try:
+				data = pickle.load(f)
+			finally:
+				f.close()
+		except StandardError, e:
+			dabo.log.error(_("Unable to load the schema cache from '%(pth)s': %(e)s")
+					% {"pth": pth, "e": ustr(e)})
+			return False
+		if (data.get("format") != self._fileFormat) or (data.get("version") != version):
+			dabo.log.info(_("Ignoring outdated schema cache file '%s'") % pth)
+			return False
+		with self._lock:
+			self._entries.update(data["entries"])
+		return True
+
+
+
+schemaCache = dSchemaCache()
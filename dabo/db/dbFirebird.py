@@ -73,6 +73,11 @@ class Firebird(dBackend):
 		return
 
 
+	def reportsBatchRowCount(self):
+		"""Firebird does not report the number of records updated."""
+		return False
+
+
 	def noResultsOnDelete(self):
 		"""
 		Firebird does not return the number of records deleted, so
@@ -63,6 +63,12 @@ class MSSQL(dBackend):
 						for key in range(len(row) / 2):
 							row.pop(key, None)
 					return rows
+				def fetchmany(self, *args, **kwargs):
+					rows = super(ConCursor, self).fetchmany(*args, **kwargs)
+					for row in rows:
+						for key in range(len(row) / 2):
+							row.pop(key, None)
+					return rows
 		else:
 			class ConCursor(self.dbapi.pymssqlCursor):
 				def __init__(self, *args, **kwargs):
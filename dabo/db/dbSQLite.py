@@ -8,6 +8,7 @@ from dabo.dException import dException, DBFileDoesNotExistException
 from dBackend import dBackend
 from dNoEscQuoteStr import dNoEscQuoteStr as dNoEQ
 from dCursorMixin import dCursorMixin
+from dSchemaCache import schemaCache
 from dabo.lib.utils import ustr
 
 
@@ -212,16 +213,29 @@ class SQLite(dBackend):
 		# This is the current description of the cursor.
 		descFlds = cursor.FieldDescription
 		# Get the field info for the table
-		auxCrs = cursor._getAuxCursor()
-		auxCrs.execute("pragma table_info('%s')" % cursor.Table)
-		rs = auxCrs._records
-
-		stdFlds = [ff["name"] for ff in rs]
+		stdFlds = self._getTableColumns(cursor, cursor.Table)
 		# Get all the fields that are not in the table.
 		return [d[0] for d in descFlds
 				if d[0] not in stdFlds ]
 
 
+	def _getTableColumns(self, cursor, table):
+		"""Returns the names of the table's columns, using the schema cache."""
+		cols = schemaCache.get(self.schemaCacheKey, table, "columns")
+		if cols is None:
+			auxCrs = cursor._getAuxCursor()
+			auxCrs.execute("pragma table_info('%s')" % table)
+			cols = [ff["name"] for ff in auxCrs._records]
+			schemaCache.set(self.schemaCacheKey, table, "columns", cols)
+		return cols
+
+
+	def cacheTableSchema(self, cursor, table):
+		"""Loads the table's metadata into the schema cache."""
+		cursor.getFields(table)
+		self._getTableColumns(cursor, table)
+
+
 	def getUpdateTablePrefix(self, table, autoQuote=True):
 		"""Table name prefixes are not allowed."""
 		return ""
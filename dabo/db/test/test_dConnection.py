@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
 import unittest
+import dabo.biz
 import dabo.db
 
 
@@ -25,6 +30,109 @@ class Test_dConnectInfo(unittest.TestCase):
 			co = dabo.db.dConnection(DbType="SQLite", Db=":memory:")
 		self.assertRaises(TypeError, anotherBogusParm)
 
+
+class Test_dConnectionPool(unittest.TestCase):
+	def setUp(self):
+		# Pooled connections must all reach the same database, so it can't be in memory.
+		self.dir = tempfile.mkdtemp()
+		self.ci = dabo.db.dConnectInfo(DbType="SQLite", Name="pooled",
+				Database=os.path.join(self.dir, "pool.db"), PoolMinSize=1, PoolMaxSize=2)
+		dabo.db.dConnection(self.ci.copy(), forceCreate=True).close()
+		self.pool = dabo.db.dConnectionPool(self.ci)
+
+	def tearDown(self):
+		self.pool.close()
+		dabo.db.schemaCache.invalidate(self.ci.getSchemaCacheKey())
+		shutil.rmtree(self.dir)
+
+	def test_checkout(self):
+		pool = self.pool
+		self.assertEqual(pool.getStats()["size"], 1)
+		conn1 = pool.acquire()
+		conn2 = pool.acquire()
+		self.assertFalse(conn1 is conn2)
+		self.assertTrue(conn1.Pool is pool)
+		self.assertRaises(dabo.dException.ConnectionPoolTimeoutException, pool.acquire, 0.01)
+		conn1.close()
+		self.assertTrue(pool.acquire() is conn1)
+		stats = pool.getStats()
+		self.assertEqual((stats["size"], stats["inUse"], stats["created"]), (2, 2, 2))
+		self.assertEqual((stats["checkouts"], stats["waits"], stats["timeouts"]), (3, 1, 1))
+
+	def test_healthCheck(self):
+		pool = self.pool
+		pool.healthCheckInterval = 0
+		conn = pool.acquire()
+		conn.close()
+		conn.getConnection().close()
+		newConn = pool.acquire()
+		self.assertFalse(newConn is conn)
+		newConn.getDaboCursor().execute("select 1")
+		stats = pool.getStats()
+		self.assertEqual((stats["healthCheckFailures"], stats["discarded"]), (1, 1))
+
+	def test_prewarmSchema(self):
+		conn = self.pool.acquire()
+		conn.getDaboCursor().execute("create table prewarm (pk integer primary key, name char)")
+		conn.close()
+		app = dabo.dApp(UI=None)
+		app.addConnectInfo(self.ci)
+		try:
+			for num in range(3):
+				app.prewarmSchema(["prewarm"], "pooled")
+			# The pooled connection is returned each time.
+			stats = app.getConnectionPool("pooled").getStats()
+			self.assertEqual((stats["inUse"], stats["checkouts"]), (0, 3))
+		finally:
+			app.closeConnections()
+
+	def test_parentChildSave(self):
+		conn = self.pool.acquire()
+		crs = conn.getDaboCursor()
+		crs.execute("create table parent (pk integer primary key autoincrement, name char)")
+		crs.execute("create table child (pk integer primary key autoincrement, "
+				"parent_fk integer, name char)")
+		conn.getConnection().commit()
+		conn.close()
+		app = dabo.dApp(UI=None)
+		app.addConnectInfo(self.ci)
+		try:
+			bizParent = dabo.biz.dBizobj(app.getConnectionByName("pooled"))
+			bizParent.KeyField = "pk"
+			bizParent.DataSource = "parent"
+			bizChild = dabo.biz.dBizobj(app.getConnectionByName("pooled"))
+			bizChild.KeyField = "pk"
+			bizChild.DataSource = "child"
+			bizChild.LinkField = "parent_fk"
+			bizChild.FillLinkFromParent = True
+			bizParent.addChild(bizChild)
+			# The bizobjs of a thread share a connection, and with it the transaction.
+			self.assertTrue(bizParent.Connection is bizChild.Connection)
+			others = []
+			thread = threading.Thread(target=lambda: others.append(
+					app.getConnectionByName("pooled")))
+			thread.start()
+			thread.join()
+			self.assertFalse(others[0] is bizParent.Connection)
+			others[0].close()
+			bizParent.requery()
+			bizParent.new()
+			bizParent.Record.name = "parent"
+			bizChild.new()
+			bizChild.Record.name = "child"
+			bizParent.saveAll()
+			bizChild.requery()
+			self.assertEqual(bizChild.Record.parent_fk, bizParent.Record.pk)
+			pool = app.getConnectionPool("pooled")
+			bizChild.Connection.close()
+			self.assertEqual(pool.getStats()["inUse"], 1)
+			bizParent.Connection.close()
+			self.assertEqual(pool.getStats()["inUse"], 0)
+		finally:
+			app.closeConnections()
+
+
 if __name__ == "__main__":
-	suite = unittest.TestLoader().loadTestsFromTestCase(Test_dConnectInfo)
+	suite = unittest.TestSuite([unittest.TestLoader().loadTestsFromTestCase(cls)
+			for cls in (Test_dConnectInfo, Test_dConnectionPool)])
 	unittest.TextTestRunner(verbosity=2).run(suite)
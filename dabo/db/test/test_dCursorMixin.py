@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
 import unittest
+from decimal import Decimal
 import dabo.db
 from dabo.lib import getRandomUUID
 
@@ -188,6 +192,644 @@ class Test_dCursorMixin(object):
 		self.assertEqual(cur.Record.cfield, newVal)
 		self.assertRaises(dabo.dException.FieldNotFoundException, cur.oldVal, "bogusField")
 
+	def test_pkLookups(self):
+		cur = self.cur
+		self.assertTrue(cur.hasPK(3))
+		self.assertFalse(cur.hasPK(99))
+		cur.sort("cfield", "DESC")
+		cur.moveToPK(2)
+		self.assertEqual(cur.Record.cfield.rstrip(), "Edward Leafe")
+		# Changing the key value must be reflected in lookups:
+		cur.setFieldVal("pk", 42)
+		self.assertFalse(cur.hasPK(2))
+		cur.first()
+		cur.moveToPK(42)
+		self.assertEqual(cur.Record.cfield.rstrip(), "Edward Leafe")
+		cur.cancel()
+		self.assertTrue(cur.hasPK(2))
+		self.assertFalse(cur.hasPK(42))
+		# New records are found by their temporary key:
+		cur.new()
+		tmpKey = cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.first()
+		cur.moveToPK(tmpKey)
+		self.assertEqual(cur.RowNumber, 3)
+		cur.setFieldVal("cfield", "Someone New")
+		self.assertEqual(cur.getChangedRows(), [3])
+		cur.cancel(allRows=True)
+		self.assertFalse(cur.hasPK(tmpKey))
+		cur.moveToPK(3)
+		cur.delete()
+		self.assertFalse(cur.hasPK(3))
+		self.assertTrue(cur.hasPK(1))
+
+	def test_sort(self):
+		cur = self.cur
+		cur.moveToPK(2)
+		cur.sort("ifield", "DESC")
+		self.assertEqual([rec["pk"] for rec in cur._records], [3, 2, 1])
+		# The current record is preserved across the sort:
+		self.assertEqual(cur.Record.pk, 2)
+		self.assertEqual(cur.RowNumber, 1)
+		# Multiple columns, each with its own direction:
+		cur.moveToPK(1)
+		cur.setFieldVal("ifield", 42)
+		cur.sort(["ifield", "cfield"], ["ASC", "DESC"])
+		self.assertEqual([rec["pk"] for rec in cur._records], [1, 2, 3])
+		self.assertEqual(cur.sortColumn, ("ifield", "cfield"))
+		self.assertEqual(cur.sortOrder, ("ASC", "DESC"))
+		cur.sort(["ifield", "cfield"], "ASC")
+		self.assertEqual([rec["pk"] for rec in cur._records], [2, 1, 3])
+		self.assertEqual(cur.Record.pk, 1)
+		self.assertRaises(dabo.dException.dException, cur.sort, ["ifield", "bogusField"])
+		self.assertRaises(dabo.dException.dException, cur.sort, ["ifield", "cfield"], ["ASC"])
+		# Passing no direction for every column restores the unsorted order:
+		cur.new()
+		cur.sort(["ifield", "cfield"], ["", ""])
+		self.assertEqual([rec["pk"] for rec in cur._records[:3]], [1, 2, 3])
+		self.assertEqual(cur.RowNumber, 3)
+		cur.moveToPK(2)
+		self.assertEqual(cur.Record.cfield.rstrip(), "Edward Leafe")
+
+	def test_chunkedFetch(self):
+		cur = self.cur
+		self.assertRaises(ValueError, cur._setFetchMode, "bogus")
+		cur.FetchMode = "chunked"
+		cur.FetchSize = 2
+		cur.requery()
+		self.assertEqual(cur.RowCount, 2)
+		# Moving past the fetched rows fetches the next chunk:
+		cur.first()
+		cur.next()
+		cur.next()
+		self.assertEqual(cur.RowCount, 3)
+		self.assertEqual(cur.Record.pk, 3)
+		self.assertRaises(dabo.dException.EndOfFileException, cur.next)
+		self.assertEqual(cur.fetchMore(), 0)
+		cur.requery()
+		self.assertEqual(cur.RowCount, 2)
+		self.assertEqual(len(cur.getDataSet()), 3)
+		# Streaming doesn't add the pending rows to the data set:
+		cur.requery()
+		self.assertEqual([rec["pk"] for rec in cur.iterRecords()], [1, 2, 3])
+		self.assertEqual(cur.RowCount, 2)
+		self.assertEqual(cur.fetchRemaining(), 0)
+
+	def test_compactRecords(self):
+		cur = self.cur
+		cur.CompactRecords = True
+		cur.requery()
+		self.assertTrue(isinstance(cur._records[0], dabo.db.dCompactRecord))
+		self.assertTrue(cur._records[0]._layout is cur._records[2]._layout)
+		cur.moveToPK(2)
+		self.assertEqual(cur.Record.cfield.rstrip(), "Edward Leafe")
+		self.assertEqual(cur.getFieldVal("ifield"), 42)
+		cur.setFieldVal("ifield", 4242)
+		self.assertTrue(cur.isChanged())
+		self.assertEqual(cur.oldVal("ifield"), 42)
+		cur.save()
+		cur.requery()
+		cur.moveToPK(2)
+		self.assertEqual(cur.Record.ifield, 4242)
+		ds = cur.getDataSet(flds=("pk", "ifield"))
+		self.assertEqual(ds[1], {"pk": 2, "ifield": 4242})
+		self.assertEqual(len(ds.execute("select * from dataset where ifield > 100")), 2)
+		cur.sort("ifield", "DESC")
+		self.assertEqual(cur.Record.pk, 2)
+		cur.filter("cfield", "Carl", "startswith")
+		self.assertEqual(cur.RowCount, 1)
+		cur.removeFilter()
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		self.assertTrue(cur.IsAdding)
+		self.assertEqual(cur.RowCount, 4)
+
+	def test_compactRecordsColumnOrder(self):
+		cur = self.cur
+		cur.CompactRecords = True
+		cur.execute("select cfield, ifield from %s where pk = 1" % self.temp_table_name)
+		self.assertEqual(cur._getRecordLayout(("x", 1)).names, ("cfield", "ifield"))
+		cur.execute("select ifield, cfield from %s where pk = 1" % self.temp_table_name)
+		self.assertEqual(cur.getFieldVal("ifield"), 23)
+		# Sequence rows are stored by position, so the layout can't be reused.
+		self.assertEqual(cur._getRecordLayout((1, "x")).names, ("ifield", "cfield"))
+
+	def test_batchedSave(self):
+		cur = self.cur
+		aux = cur.AuxCursor
+		batches = []
+		def executemany(sql, paramList):
+			batches.append(len(paramList))
+			return aux.__class__.executemany(aux, sql, paramList)
+		aux.executemany = executemany
+		for pk in (1, 2, 3):
+			cur.moveToPK(pk)
+			cur.setFieldVal("ifield", pk * 100)
+		cur.setFieldVal("cfield", "Carl Karsten, Jr.")
+		cur.AutoPopulatePK = False
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.setFieldVal("pk", 10)
+		cur.setFieldVal("cfield", "Someone New")
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.setFieldVal("pk", 11)
+		cur.setFieldVal("cfield", "Someone Else")
+		cur.save(allRows=True)
+		self.assertEqual(sorted(batches), [1, 2, 2])
+		self.assertFalse(cur.isChanged(allRows=True))
+		cur.requery()
+		self.assertEqual([(rec["pk"], rec["ifield"]) for rec in cur._records],
+				[(1, 100), (2, 200), (3, 300), (10, 0), (11, 0)])
+		cur.moveToPK(3)
+		self.assertEqual(cur.Record.cfield, "Carl Karsten, Jr.")
+		# Batched updates of rows that are gone are reported, like single ones.
+		backend = cur.BackendObject
+		def noResultsOnSave():
+			raise dabo.dException.dException("No records updated")
+		backend.noResultsOnSave = noResultsOnSave
+		try:
+			for pk in (1, 2):
+				cur.moveToPK(pk)
+				cur.setFieldVal("ifield", pk)
+			aux.execute("delete from %s where pk = 2" % self.temp_table_name)
+			self.assertRaises(dabo.dException.dException, cur.save, allRows=True)
+		finally:
+			del backend.noResultsOnSave
+
+	def test_deleteRows(self):
+		cur = self.cur
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.moveToPK(3)
+		cur.setFieldVal("ifield", 99)
+		cur.deleteRows([0, 2, 3])
+		self.assertEqual(cur.RowCount, 1)
+		self.assertEqual(cur.Record.pk, 2)
+		self.assertFalse(cur.isChanged(allRows=True, includeNewUnchanged=True))
+		cur.requery()
+		self.assertEqual([rec["pk"] for rec in cur._records], [2])
+		# Deleting rows that are already gone is reported by the backend object:
+		cur.AuxCursor.execute("delete from %s" % self.temp_table_name)
+		self.assertRaises(dabo.dException.dException, cur.delete)
+
+	def test_seek(self):
+		cur = self.cur
+		self.assertEqual(cur.seek("edward leafe", "cfield", caseSensitive=False), 1)
+		self.assertEqual(cur.seek("edward leafe", "cfield"), -1)
+		self.assertEqual(cur.seek("Ed", "cfield", near=True, incremental=True), 1)
+		self.assertEqual(cur.seek("Dave", "cfield", near=True), 1)
+		self.assertEqual(cur.seek(50, "ifield", near=True), 2)
+		self.assertEqual(cur.seek((42, "Edward Leafe"), ("ifield", "cfield")), 1)
+		self.assertTrue(cur.locate(10223, "ifield"))
+		self.assertEqual(cur.RowNumber, 2)
+		# The index is kept, and patched when values change.
+		entries = cur._getSeekIndex(("cfield",), True)
+		cur.setFieldVal("cfield", "Aaron", row=0)
+		self.assertTrue(cur._getSeekIndex(("cfield",), True) is entries)
+		self.assertEqual(cur.seek("aaron", "cfield", caseSensitive=False), 0)
+		self.assertEqual(cur.seek("paul", "cfield", caseSensitive=False,
+				near=True, incremental=True), 2)
+		cur.new()
+		cur.genTempAutoPK()
+		cur.setNewFlag()
+		cur.setFieldVal("cfield", "Zed")
+		self.assertEqual(cur.seek("Zed", "cfield"), 3)
+		cur.cancel()
+		self.assertEqual(cur.seek("Zed", "cfield"), -1)
+		cur.sort("cfield")
+		self.assertEqual(cur.seek("Aaron", "cfield"), 0)
+		self.assertEqual(cur.seek("Edward Leafe", "cfield"), 2)
+		self.assertEqual(cur.seek("Edward Leafe", "cfield", sort=False), 2)
+		cur.cancel(allRows=True)
+		self.assertEqual(cur.seek("Aaron", "cfield"), -1)
+		self.assertEqual(cur.seek("Paul Keith McNett", "cfield"), 0)
+
+	def test_typeCorrection(self):
+		cur = self.cur
+		cur.CorrectTypesOnFetch = True
+		cur.requery()
+		flag = dabo.dConstants.CURSOR_FIELD_TYPES_CORRECTED
+		self.assertTrue(cur._records[2].get(flag, False))
+		self.assertEqual(cur._records[2]["nfield"], Decimal("23032.76"))
+		self.assertTrue(isinstance(cur._records[2]["nfield"], Decimal))
+		# Fields listed in NativeTypeFields are left as the backend returns them.
+		cur.CorrectTypesOnFetch = False
+		cur.NativeTypeFields = "nfield"
+		cur.requery()
+		self.assertFalse(cur._records[0].get(flag, False))
+		self.assertFalse(isinstance(cur.getFieldVal("nfield"), Decimal))
+		cur.NativeTypeFields = ()
+		cur.requery()
+		# Correcting the values of a row marks it as changed in its data set.
+		records = cur._records
+		version = records._version
+		self.assertEqual(cur.getFieldVal("nfield", 1), Decimal("42.42"))
+		self.assertEqual(records._rowVersions.get(1), version + 1)
+
+	def test_schemaCache(self):
+		cur = self.cur
+		cache = dabo.db.schemaCache
+		key = cur.BackendObject.schemaCacheKey
+		flds = cur.getFields()
+		self.assertEqual(cache.get(key, self.temp_table_name, "fields"), flds)
+		calls = []
+		def observer(sql, params, elapsed, rowCount, name):
+			calls.append(sql)
+		dabo.db.addQueryObserver(observer)
+		try:
+			# A new query shape doesn't need to look up the table structure again.
+			cur.UserSQL = "select pk, cfield from %s" % self.temp_table_name
+			cur.requery()
+			self.assertEqual(cur.getNonUpdateFields(), [])
+		finally:
+			dabo.db.removeQueryObserver(observer)
+		self.assertEqual(len(calls), 1)
+		cache.invalidate(key, self.temp_table_name)
+		self.assertEqual(cache.get(key, self.temp_table_name, "fields"), None)
+		# Entries for in-memory databases are never saved to disk.
+		private = dabo.db.dSchemaCache()
+		private.set(key, self.temp_table_name, "fields", flds)
+		private.set(("SQLite", "", "", None, "test.db", "", None), "tbl", "fields", flds)
+		pth = os.path.join(tempfile.mkdtemp(), "schema.cache")
+		try:
+			self.assertTrue(private.save(pth, version="1.0"))
+			other = dabo.db.dSchemaCache()
+			self.assertFalse(other.load(pth, version="2.0"))
+			self.assertTrue(other.load(pth, version="1.0"))
+			self.assertEqual(len(other), 1)
+			self.assertEqual(other.get(("SQLite", "", "", None, "test.db", "", None),
+					"tbl", "fields"), flds)
+		finally:
+			shutil.rmtree(os.path.dirname(pth))
+		# The entries for an in-memory database go away with its connection.
+		con = dabo.db.dConnection(DbType="SQLite", Database=":memory:")
+		crs = con.getDaboCursor()
+		crs.execute("create table memtable (pk INTEGER PRIMARY KEY, cfield CHAR)")
+		crs.getFields("memtable")
+		memKey = crs.BackendObject.schemaCacheKey
+		self.assertNotEqual(cache.get(memKey, "memtable", "fields"), None)
+		con.close()
+		self.assertEqual(cache.get(memKey, "memtable", "fields"), None)
+
+	def test_keysetPaging(self):
+		cur = self.cur
+		pks = lambda: [rec["pk"] for rec in cur.getDataSet()]
+		self.assertRaises(dabo.dException.dException, cur.requeryPage, 2)
+		cur.UserSQL = None
+		cur.setFromClause(self.temp_table_name)
+		self.assertEqual(cur.requeryPage(2), 2)
+		self.assertEqual(pks(), [1, 2])
+		cur.setFieldVal("cfield", "Paul McNett")
+		self.assertEqual(cur.nextPage(), 1)
+		# The edited row stays, along with its memento.
+		self.assertEqual(pks(), [3, 1])
+		self.assertEqual(cur.getFieldVal("cfield", 1), "Paul McNett")
+		self.assertTrue(cur.isChanged())
+		self.assertEqual(cur.nextPage(), 0)
+		self.assertEqual(cur.priorPage(), 2)
+		self.assertEqual(pks(), [1, 2])
+		self.assertEqual(cur.getFieldVal("cfield", 0), "Paul McNett")
+		cur.cancel(allRows=True)
+		# Descending order, appending the pages.
+		cur.sortColumn, cur.sortOrder = "ifield", "DESC"
+		self.assertEqual(cur.requeryPage(1, append=True), 1)
+		self.assertEqual(cur.nextPage(), 1)
+		self.assertEqual(pks(), [3, 2])
+		self.assertEqual(cur.RowNumber, 0)
+		cur.requeryPage(1, after=(42, 2), append=True)
+		self.assertEqual(pks(), [1])
+		self.assertEqual(cur.priorPage(), 1)
+		self.assertEqual(pks(), [2, 1])
+		self.assertEqual(cur.RowNumber, 1)
+
+	def test_requeryDelta(self):
+		cur = self.cur
+		tableName = self.temp_table_name
+		cur.LastModifiedField = "ifield"
+		cur.requery()
+		cur.sort("cfield")
+		cur.moveToPK(2)
+		cur.setFieldVal("cfield", "Ed")
+		cur.AuxCursor.execute("update %s set cfield = 'Paul McNett', ifield = 20000 where pk = 1" % tableName)
+		cur.AuxCursor.execute("update %s set ifield = 20001 where pk = 2" % tableName)
+		cur.AuxCursor.execute("insert into %s (cfield, ifield) values ('Aaron', 30000)" % tableName)
+		cur.AuxCursor.execute("delete from %s where pk = 3" % tableName)
+		self.assertEqual(cur.requeryDelta(detectDeletes=True), 3)
+		self.assertEqual([rec["pk"] for rec in cur.getDataSet()], [4, 2, 1])
+		self.assertEqual(cur.getFieldVal("cfield", 2), "Paul McNett")
+		# The edited row keeps its changes, and the conflict is recorded.
+		self.assertEqual(cur.RowNumber, 1)
+		self.assertEqual(cur.getFieldVal("cfield"), "Ed")
+		self.assertEqual(cur.getDeltaConflicts().keys(), [2])
+		self.assertEqual(cur.getDeltaConflicts()[2]["ifield"], 20001)
+		# Once the local changes are gone, the database values are applied.
+		cur.cancel()
+		self.assertEqual(cur.requeryDelta(), 1)
+		self.assertEqual(cur.getDeltaConflicts(), {})
+		self.assertEqual(cur.getFieldVal("ifield"), 20001)
+		# The rows fetched again at the watermark don't count when unchanged.
+		self.assertEqual(cur.requeryDelta(), 0)
+
+	def test_cachedVirtualFields(self):
+		cur = self.cur
+		calls = []
+		def getDoubled():
+			calls.append(cur.RowNumber)
+			return cur.getFieldVal("ifield") * 2
+		cur.VirtualFields = {"doubled": {"func": getDoubled, "cache": True,
+				"depends_on": ["ifield"]}}
+		self.assertEqual(cur.getFieldVal("doubled"), 46)
+		self.assertEqual(cur.getFieldVal("doubled"), 46)
+		cur.setFieldVal("cfield", "Paul McNett")
+		cur.sort("cfield")
+		self.assertEqual(cur.getFieldVal("doubled", 2), 46)
+		self.assertEqual(len(calls), 1)
+		cur.setFieldVal("ifield", 5, 2)
+		self.assertEqual(cur.getFieldVal("doubled", 2), 10)
+		cur.cancel(allRows=True)
+		self.assertEqual(cur.getFieldVal("doubled", 2), 46)
+		self.assertEqual(len(calls), 3)
+		cur.requery()
+		self.assertEqual(cur.getFieldVal("doubled", 2), 46)
+		self.assertEqual(len(calls), 4)
+
+	def test_bulkAppend(self):
+		cur = self.cur
+		aux = cur.AuxCursor
+		batches = []
+		def executemany(sql, paramList):
+			batches.append(len(paramList))
+			return aux.__class__.executemany(aux, sql, paramList)
+		aux.executemany = executemany
+		cur.AutoPopulatePK = False
+		rows = [(pk, "Imported %s" % pk) for pk in (10, 11, 12)]
+		self.assertEqual(cur.bulkAppend(rows, fields=("pk", "cfield"),
+				defaults={"ifield": 7}), 3)
+		self.assertEqual(cur.RowCount, 6)
+		self.assertEqual(cur.getFieldVal("ifield", 4), 7)
+		self.assertTrue(cur.isChanged(allRows=True, includeNewUnchanged=True))
+		cur.save(allRows=True, includeNewUnchanged=True)
+		self.assertEqual(batches, [3])
+		self.assertFalse(cur.isChanged(allRows=True, includeNewUnchanged=True))
+		cur.requery()
+		self.assertEqual(cur.RowCount, 6)
+		cur.moveToPK(12)
+		self.assertEqual(cur.Record.cfield, "Imported 12")
+		self.assertRaises(dabo.dException.FieldNotFoundException, cur.bulkAppend,
+				[{"nofield": 1}])
+		self.assertRaises(dabo.dException.dException, cur.bulkAppend,
+				[{"pk": 20, "cfield": "x"}, {"pk": 21}])
+
+	def test_batchVirtualFields(self):
+		cur = self.cur
+		calls = []
+		def getDoubled(ifields):
+			calls.append(len(ifields))
+			return [ifield * 2 for ifield in ifields]
+		cur.VirtualFields = {"doubled": {"func": getDoubled, "batch": True,
+				"depends_on": ["ifield"]}}
+		self.assertEqual(cur.getFieldVal("doubled", 1), 84)
+		self.assertEqual(cur.getFieldVal("doubled", 2), 20446)
+		self.assertEqual(calls, [3])
+		cur.setFieldVal("ifield", 5, 0)
+		cur.sort("doubled")
+		self.assertEqual([rec["doubled"] for rec in cur.getDataSet()], [10, 84, 20446])
+		self.assertEqual(calls, [3, 1])
+		cur.filter("doubled", 100, "<")
+		self.assertEqual(cur.RowCount, 2)
+		self.assertEqual(calls, [3, 1])
+		# A child DataSource in 'depends_on' isn't passed to the function.
+		cur.removeFilters()
+		cur.VirtualFields = {"tripled": {"func": lambda ifields: [i * 3 for i in ifields],
+				"batch": True, "depends_on": ["ifield", "child_table"]}}
+		self.assertEqual(sorted(rec["tripled"] for rec in cur.getDataSet()), [15, 126, 30669])
+
+	def test_dataSetVersions(self):
+		ds = self.cur.getDataSet(flds=("pk", "ifield"))
+		# Test the SQLite copy of the rows.
+		ds.UseQueryPlanner = False
+		sql = "select pk from dataset where ifield > 40 order by pk"
+		self.assertEqual([rec["pk"] for rec in ds.execute(sql)], [2, 3])
+		# Changes made directly to the records are only seen once marked.
+		ds[0]["ifield"] = 50
+		self.assertEqual(len(ds.execute(sql)), 2)
+		ds.markChanged(0)
+		self.assertEqual([rec["pk"] for rec in ds.execute(sql)], [1, 2, 3])
+		ds.replace("ifield", 0, scope="pk == 3")
+		self.assertEqual([rec["pk"] for rec in ds.execute(sql)], [1, 2])
+		self.assertEqual(len(ds.execute("select * from dataset")), 3)
+		# The cursor marks the rows it changes in its own data set.
+		cur = self.cur
+		records = cur._records
+		version = records._version
+		cur.setFieldVal("ifield", 1, 1)
+		self.assertEqual(records._rowVersions.get(1), version + 1)
+
+	def test_expressions(self):
+		cur = self.cur
+		cur.filterByExpression("ifield > 40 and cfield != 'ifield'")
+		self.assertEqual([rec["pk"] for rec in cur.getDataSet()], [2, 3])
+		cur.removeFilters()
+		cur.replace("ifield", "=ifield * 2", scope="pk != 2")
+		self.assertEqual([rec["ifield"] for rec in cur.getDataSet()], [46, 42, 20446])
+		cur.replace("cfield", "pk", scope="pk == 1")
+		self.assertEqual(cur.getFieldVal("cfield", 0), "pk")
+		# Records with another layout, such as appended ones, are handled too.
+		cur.bulkAppend([{"cfield": u"New", "ifield": 50, "nfield": Decimal("1.00")}],
+				markNew=False)
+		cur.filterByExpression("ifield > 45 and cfield.startswith('N')")
+		self.assertEqual([rec["ifield"] for rec in cur.getDataSet()], [50])
+		cur.removeFilters()
+		ds = cur.getDataSet(flds=("pk", "ifield"))
+		self.assertEqual(ds._fldReplace("pk > 1", "r"), "r['pk'] > 1")
+		self.assertEqual(len(ds.filterByExpression("pk == 1 or ifield == 50")), 2)
+
+	def test_filterIndexes(self):
+		cur = self.cur
+		self.createNullRecord()
+		cur.requery()
+		def pks(fld, expr, op):
+			cur.filter(fld, expr, op)
+			ret = [rec["pk"] for rec in cur.getDataSet()]
+			cur.removeFilter()
+			return ret
+		checks = (("ifield", 42, "eq"), ("ifield", 42, "ne"), ("ifield", (23, 42), "in"),
+				("ifield", 42, "gte"), ("ifield", 42, "lt"), ("nfield", Decimal("42.42"), "<="),
+				("cfield", "Ed", "startswith"), ("cfield", "Edward Leafe", "="))
+		expected = [pks(*check) for check in checks]
+		cur.FilterIndexes = {"ifield": "sorted", "nfield": "sorted", "cfield": "hash"}
+		self.assertEqual([pks(*check) for check in checks], expected)
+		self.assertEqual(expected[1], [1, 3, 4])
+		self.assertTrue("ifield" in cur._records._indexes)
+		# Stacked filters narrow down the rows of the first one.
+		cur.filter("ifield", 10, "gt")
+		cur.filter("cfield", "Carl Karsten")
+		self.assertEqual(cur._records._selection, [2])
+		self.assertEqual(cur.getFieldVal("pk"), 3)
+		cur.removeFilter()
+		self.assertEqual(cur.RowCount, 3)
+		# The index is rebuilt after the rows are changed.
+		cur.setFieldVal("ifield", 5, 0)
+		cur.removeFilters()
+		self.assertEqual(pks("ifield", 20, "<"), [1, 4])
+		self.assertRaises(ValueError, setattr, cur, "FilterIndexes", {"pk": "btree"})
+
+	def test_dataSetQueryPlanner(self):
+		self.createNullRecord()
+		self.cur.requery()
+		kids = dabo.db.dDataSet([{"fk": 1, "toy": u"ball"}, {"fk": 1, "toy": u"kite"},
+				{"fk": 3, "toy": u"yoyo"}])
+		def run(sql, params=(), planner=True):
+			# A new data set each time, so that no SQLite copy is loaded yet.
+			ds = self.cur.getDataSet(flds=("pk", "cfield", "ifield", "nfield"))
+			ds.UseQueryPlanner = planner
+			ret = ds.execute(sql, params, {"kids": kids})
+			return ds.LastQueryPath, [dict((key, float(val) if isinstance(val, Decimal)
+					else val) for key, val in rec.items()) for rec in ret]
+		for sql, params in (
+				("select pk, cfield from dataset where ifield > ? order by pk desc", (30,)),
+				("select pk as id from dataset where ifield is null or not (pk in (1, 2))", ()),
+				("select * from dataset where nfield between 20 and 50 order by 1 limit 1", ()),
+				("select count(*), count(ifield) as n, SUM( ifield ), avg(nfield), min(cfield)"
+					" from dataset", ()),
+				("select cfield, count(*) from dataset group by cfield order by 2, cfield", ()),
+				("select d.pk, k.toy from dataset d left join kids k on k.fk = d.pk"
+					" order by d.pk, k.toy", ())):
+			path, rows = run(sql, params)
+			self.assertEqual(path, "python")
+			self.assertEqual((path, rows), ("python", run(sql, params, planner=False)[1]),
+					sql)
+		# Anything else falls back to SQLite.
+		self.assertEqual(run("select pk from dataset where cfield like 'Ed%'"),
+				("sqlite", [{"pk": 2}]))
+		# Supported selects are run on the records even once SQLite holds a copy.
+		ds = dabo.db.dDataSet([{"a": 1}, {"a": 3}])
+		self.assertEqual(len(ds.execute("select a from dataset where a like '1'")), 1)
+		self.assertEqual(ds.LastQueryPath, "sqlite")
+		ds[0]["a"] = 100
+		self.assertEqual(ds.execute("select max(a) as m from dataset")[0]["m"], 100)
+		self.assertEqual(ds.LastQueryPath, "python")
+
+	def test_getDataRows(self):
+		cur = self.cur
+		cur.VirtualFields = {"doubled": lambda: cur.getFieldVal("ifield") * 2}
+		flds, rows = cur.getDataRows(flds=("doubled", "pk", "cfield"), rowStart=1)
+		self.assertEqual(flds, ("doubled", "pk", "cfield"))
+		self.assertEqual(rows, [(84, 2, "Edward Leafe"), (20446, 3, "Carl Karsten")])
+		self.assertEqual(cur.getDataSet(flds=("pk", "doubled"), rows=1)[0],
+				{"pk": 1, "doubled": 46})
+		self.assertEqual(cur.getDataRows(flds=("pk",), rowStart=3), (("pk",), []))
+		cur.new()
+		cur.genTempAutoPK()
+		# Only the new record has a temporary key.
+		flds, rows = cur.getDataRows(flds=("pk", dabo.dConstants.CURSOR_TMPKEY_FIELD))
+		self.assertEqual([row[1] is None for row in rows], [True, True, True, False])
+
+	def test_columnArrays(self):
+		cur = self.cur
+		self.createNullRecord()
+		cur.requery()
+		cols = cur.getColumnArrays(["ifield", "nfield", "cfield"])
+		self.assertEqual(len(cols["ifield"]), 4)
+		self.assertEqual(list(cols["cfield"][:3]), ["Paul Keith McNett", "Edward Leafe",
+				"Carl Karsten"])
+		if dabo.db.dColumnArrays.hasNumpy():
+			self.assertEqual(cols["ifield"].dtype.name, "int64")
+			self.assertEqual(cols["ifield"].mask.tolist(), [False, False, False, True])
+			self.assertEqual(cols["ifield"].sum(), 10288)
+		else:
+			# array.array can't hold NULLs, so the columns are lists.
+			self.assertEqual(cols["ifield"], [23, 42, 10223, None])
+		cur.setFieldVal("ifield", 5, 3)
+		cols = cur.getColumnArrays(["ifield", "nfield"])
+		if not dabo.db.dColumnArrays.hasNumpy():
+			self.assertEqual(cols["ifield"].typecode, "l")
+		self.assertEqual(sum(cols["ifield"]), 10293)
+		self.assertEqual(cur.setColumnArrays({"ifield": [val * 2 for val in cols["ifield"]]}), 4)
+		self.assertEqual(cur.getFieldVal("ifield", 2), 20446)
+		self.assertTrue(cur.isChanged())
+		cur.save()
+		cur.requery()
+		self.assertEqual(cur.getFieldVal("ifield", 0), 46)
+		self.assertRaises(dabo.dException.dException, cur.setColumnArrays, {"ifield": [1]})
+
+	def test_resultCache(self):
+		cur = self.cur
+		cache = dabo.db.resultCache
+		cache.resetStats()
+		cur.CacheTTL = 60
+		try:
+			cur.requery()
+			cur.setFieldVal("cfield", "Paul McNett")
+			# Served from the cache, which isn't affected by the change.
+			cur.requery()
+			self.assertEqual(cur.getFieldVal("cfield"), "Paul Keith McNett")
+			self.assertEqual((cache.getStats()["hits"], cache.getStats()["misses"]), (1, 1))
+			cur.AuxCursor.execute("update %s set ifield = 1 where pk = 1" % self.temp_table_name)
+			self.assertEqual(cache.getStats()["invalidations"], 1)
+			cur.requery()
+			self.assertEqual(cur.getFieldVal("ifield"), 1)
+			self.assertEqual(cache.getStats()["misses"], 2)
+			# Going over the byte budget drops the least recently used entry.
+			cache.maxBytes = cache.getStats()["bytes"] + 1
+			cur.UserSQL = "select * from %s where pk = 1" % self.temp_table_name
+			cur.requery()
+			stats = cache.getStats()
+			self.assertEqual((stats["entries"], stats["evictions"]), (1, 1))
+			# Partially fetched results aren't cached.
+			cache.invalidate()
+			cur.UserSQL = "select * from %s" % self.temp_table_name
+			cur.FetchMode = "chunked"
+			cur.FetchSize = 1
+			cur.requery()
+			self.assertEqual(len(cache), 0)
+			cur.requery()
+			cur.fetchRemaining()
+			self.assertEqual(cur.RowCount, 3)
+		finally:
+			cur.FetchMode = "all"
+			cur.CacheTTL = None
+			cache.maxBytes = dabo.db.dResultCache().maxBytes
+			cache.invalidate()
+
+	def test_queryObservers(self):
+		cur = self.cur
+		calls = []
+		def observer(sql, params, elapsed, rowCount, name):
+			calls.append((sql, params, rowCount, name))
+		stats = dabo.db.dQueryStats(maxSlowest=2)
+		dabo.db.addQueryObserver(observer)
+		stats.start()
+		try:
+			cur.requery()
+			cur.AuxCursor.execute("update %s set ifield = 1 where pk = 1" % self.temp_table_name)
+			# Only the observers that ask for them see the cache hits.
+			cur.CacheTTL = 60
+			cur.requery()
+			cur.requery()
+		finally:
+			cur.CacheTTL = None
+			dabo.db.resultCache.invalidate()
+			dabo.db.removeQueryObserver(observer)
+			stats.stop()
+		cur.requery()
+		self.assertEqual(len(calls), 3)
+		self.assertEqual(calls[0][2], 3)
+		self.assertEqual(calls[0][3], self.temp_table_name)
+		self.assertEqual(calls[1][2], 1)
+		result = stats.getStats()[self.temp_table_name]
+		self.assertEqual((result["count"], result["cacheHits"]), (3, 1))
+		self.assertEqual(result["rows"], 7)
+		self.assertTrue(result["p50"] <= result["p99"])
+		self.assertEqual(len(stats.getSlowest()), 2)
+		self.assertTrue(self.temp_table_name in stats.report())
+
 	## - End method unit tests -
 
 	def testMementos(self):
@@ -289,6 +931,38 @@ insert into %s (cfield, ifield, nfield) values ("Carl Karsten", 10223, 23032.76)
 insert into %s (cfield, ifield, nfield) values (NULL, NULL, NULL)
 """ % self.temp_table_name)
 
+	def test_requeryAsync(self):
+		# In-memory databases can't be opened by the worker's connection.
+		pth = os.path.join(tempfile.mkdtemp(), "async.db")
+		con = dabo.db.dConnection(DbType="SQLite", Database=pth, forceCreate=True)
+		try:
+			cur = con.getDaboCursor()
+			cur.executescript("""
+create table tst (pk INTEGER PRIMARY KEY AUTOINCREMENT, cfield CHAR);
+insert into tst (cfield) values ("Paul Keith McNett");
+insert into tst (cfield) values ("Edward Leafe");
+""")
+			cur.UserSQL = "select * from tst"
+			cur.KeyField = "pk"
+			cur.Table = "tst"
+			calls = []
+			first = cur.requeryAsync(callback=calls.append)
+			# The latest request wins.
+			future = cur.requeryAsync(callback=calls.append)
+			self.assertTrue(first.cancelled())
+			self.assertEqual(future.result(10), 2)
+			self.assertTrue(future.done())
+			self.assertEqual(calls, [first, future])
+			self.assertEqual(cur.getFieldVal("cfield", 1), "Edward Leafe")
+			cur.UserSQL = "select * from bogus"
+			future = cur.requeryAsync()
+			self.assertRaises(dabo.dException.DBQueryException, future.result, 10)
+			self.assertEqual(cur.RowCount, 2)
+		finally:
+			dabo.db.schemaCache.invalidate(cur.BackendObject.schemaCacheKey)
+			con.close()
+			shutil.rmtree(os.path.dirname(pth))
+
 
 class Test_dCursorMixin_mysql(Test_dCursorMixin, unittest.TestCase):
 	def setUp(self):
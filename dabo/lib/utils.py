@@ -246,6 +246,25 @@ def exceptionToUnicode(e):
 		return u"Unknown message."
 
 
+def logWillEmit(logger, level):
+	"""
+	Returns True if a message of the passed level sent to 'logger' would be
+	written by at least one handler. This lets callers skip building expensive
+	log messages that would just be thrown away.
+	"""
+	if not logger.isEnabledFor(level):
+		return False
+	lg = logger
+	while lg:
+		for handler in lg.handlers:
+			if level >= handler.level:
+				return True
+		if not lg.propagate:
+			break
+		lg = lg.parent
+	return False
+
+
 def relativePathList(toLoc, fromLoc=None):
 	"""
 	Given two paths, returns a list that, when joined with